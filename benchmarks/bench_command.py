@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Micro-benchmark of msnp.Command and of the command dispatching
+
+Measures how many commands per second are parsed, serialized and
+dispatched to the handlers of a protocol.
+
+    usage: bench_command.py [options] [capture ...]
+
+Without capture files, the traffic of a login with a large contact list
+is generated."""
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from papyon.msnp import Command
+from papyon.msnp.base import BaseProtocol
+
+from traffic import read_capture, ns_login_traffic
+
+
+class NullProtocol(BaseProtocol):
+    """Protocol with a handler for every command of the login traffic"""
+    def __init__(self):
+        self.handled = 0
+
+    def _handle(self, command):
+        self.handled += 1
+
+    _handle_VER = _handle_CVR = _handle_USR = _handle_SBS = _handle
+    _handle_MSG = _handle_BLP = _handle_ADL = _handle_CHG = _handle
+    _handle_ILN = _handle_UBX = _handle_NLN = _handle_FLN = _handle
+
+    def _default_handler(self, command):
+        self.handled += 1
+
+    def _error_handler(self, error):
+        self.handled += 1
+
+
+def split_commands(data):
+    """Splits the traffic in the chunks DirectConnection gives to
+    Command.parse: the command line, followed by its payload if any"""
+    chunks = []
+    offset = 0
+    while offset < len(data):
+        end = data.index("\r\n", offset)
+        line = data[offset:end]
+        offset = end + 2
+        if line[:3] in Command.INCOMING_PAYLOAD:
+            try:
+                length = int(line.rsplit(" ", 1)[-1])
+            except ValueError:
+                length = 0
+            if length > 0:
+                chunks.append(line + "\r\n" + data[offset:offset + length])
+                offset += length
+                continue
+        chunks.append(line)
+    return chunks
+
+def best_of(repeat, func, *args):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func(*args)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def parse(chunks):
+    for chunk in chunks:
+        Command().parse(chunk)
+
+def serialize(commands):
+    for command in commands:
+        str(command)
+
+def dispatch(protocol, commands):
+    for command in commands:
+        protocol._dispatch_command(None, command)
+
+def main():
+    parser = OptionParser(usage="%prog [options] [capture ...]")
+    parser.add_option("-c", "--contacts", type="int", default=5000,
+            help="number of contacts of the generated login traffic")
+    parser.add_option("-r", "--repeat", type="int", default=5,
+            help="number of runs, the best one is reported")
+    options, captures = parser.parse_args()
+
+    if captures:
+        data = "".join([read_capture(path) for path in captures])
+    else:
+        data = ns_login_traffic(options.contacts)
+
+    chunks = split_commands(data)
+    commands = []
+    for chunk in chunks:
+        command = Command()
+        command.parse(chunk)
+        commands.append(command)
+    protocol = NullProtocol()
+
+    print "%d commands" % len(commands)
+    print "%10s %12s" % ("operation", "commands/s")
+    for name, func, args in (("parse", parse, (chunks,)),
+            ("serialize", serialize, (commands,)),
+            ("dispatch", dispatch, (protocol, commands))):
+        elapsed = best_of(options.repeat, func, *args)
+        print "%10s %12.0f" % (name, len(commands) / elapsed)
+
+if __name__ == "__main__":
+    main()
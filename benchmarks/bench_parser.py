@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Micro-benchmark of gnet.parser.DelimiterParser
+
+Replays Notification Server traffic through a DelimiterParser, switching
+the delimiter for payload commands the same way DirectConnection does.
+
+    usage: bench_parser.py [options] [capture ...]
+
+Without capture files, the traffic of a login with a large contact list
+is generated."""
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from papyon.gnet.io import AbstractClient
+from papyon.gnet.parser import DelimiterParser
+from papyon.msnp import Command
+import gobject
+
+from traffic import read_capture, ns_login_traffic, split_reads
+
+
+class ReplayClient(AbstractClient):
+    """Client emitting prerecorded data"""
+    def __init__(self):
+        AbstractClient.__init__(self, "replay", 0)
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def replay(self, reads):
+        for data in reads:
+            self.emit("received", data, len(data))
+gobject.type_register(ReplayClient)
+
+
+class CommandCounter(object):
+    """Splits the chunks in commands like DirectConnection does"""
+    def __init__(self, parser):
+        self.commands = 0
+        self._parser = parser
+        self._parser.delimiter = "\r\n"
+        self._parser.connect("received", self._on_received)
+
+    def _on_received(self, parser, chunk):
+        if isinstance(parser.delimiter, int):
+            parser.delimiter = "\r\n"
+            self.commands += 1
+            return
+        name = chunk[:3]
+        if name in Command.INCOMING_PAYLOAD:
+            try:
+                length = int(chunk.rsplit(" ", 1)[-1])
+            except ValueError:
+                length = 0
+            if length > 0:
+                parser.delimiter = length
+                return
+        self.commands += 1
+
+
+def run(data, read_size, repeat):
+    best = None
+    for i in range(repeat):
+        reads = split_reads(data, 1, read_size, seed=i)
+        client = ReplayClient()
+        counter = CommandCounter(DelimiterParser(client))
+        start = time.time()
+        client.replay(reads)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return counter.commands, len(reads), best
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] [capture ...]")
+    parser.add_option("-c", "--contacts", type="int", default=5000,
+            help="number of contacts of the generated login traffic")
+    parser.add_option("-s", "--read-sizes", default="64,512,1460,16384",
+            help="comma separated list of maximum read sizes")
+    parser.add_option("-r", "--repeat", type="int", default=3,
+            help="number of runs, the best one is reported")
+    options, captures = parser.parse_args()
+
+    if captures:
+        data = "".join([read_capture(path) for path in captures])
+    else:
+        data = ns_login_traffic(options.contacts)
+
+    print "%d bytes of traffic" % len(data)
+    print "%10s %10s %10s %12s %12s" % ("read size", "reads", "commands",
+            "MB/s", "commands/s")
+    for read_size in [int(size) for size in options.read_sizes.split(",")]:
+        commands, reads, elapsed = run(data, read_size, options.repeat)
+        print "%10d %10d %10d %12.2f %12.0f" % (read_size, reads, commands,
+                len(data) / elapsed / 1048576, commands / elapsed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Offline replay of Notification and Switchboard traffic
+
+Feeds the traffic through DirectConnection, NotificationProtocol and
+SwitchboardProtocol over an in-memory connection, so that the whole
+receiving path can be measured without any server. For each scenario it
+reports the commands per second, the time the main loop spends per
+command, the longest time the main loop was blocked by a single read and
+the peak memory of the process.
+
+    usage: bench_replay.py [options] [capture ...]
+
+The captures, if any, are replayed as Notification Server traffic instead
+of the generated login of a large contact list."""
+
+import os
+import resource
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from papyon.gnet.constants import IoStatus
+from papyon.gnet.io import AbstractClient
+from papyon.msnp import NotificationProtocol, SwitchboardProtocol
+from papyon.profile import Contact, Membership, NetworkID, Profile
+from papyon.service.AddressBook import AddressBook, AddressBookState
+from papyon.transport import DirectConnection, ServerType
+import gobject
+
+from traffic import read_capture, ns_login_traffic, sb_chat_traffic, \
+        contact_accounts, split_reads
+
+ACCOUNT = "papyon@hotmail.com"
+
+
+class MemoryClient(AbstractClient):
+    """Connection living in memory: what is sent is dropped, and what
+    L{feed} is given is received"""
+    def __init__(self, host, port):
+        AbstractClient.__init__(self, host, port)
+        self.sent_bytes = 0
+
+    def open(self):
+        if not self._configure():
+            return
+        self._pre_open()
+        self._status = IoStatus.OPEN
+
+    def close(self):
+        self._status = IoStatus.CLOSED
+
+    def send(self, buffer, callback=None, *args, **kwargs):
+        self.sent_bytes += len(buffer)
+        if callback:
+            callback(*args)
+
+    def feed(self, data):
+        self.emit("received", data, len(data))
+gobject.type_register(MemoryClient)
+
+
+class MemoryConnection(DirectConnection):
+    def _create_client(self, server):
+        return MemoryClient(server[0], server[1])
+gobject.type_register(MemoryConnection)
+
+
+class OfflineClient(object):
+    """The parts of L{papyon.Client} used by the protocols, with an
+    address book already synchronized"""
+    def __init__(self, contacts):
+        self.machine_guid = "F26D1F07-95E2-403C-BC18-D4BFED493428"
+        self.oim_box = None
+        self.mailbox = None
+        self.protocol = None
+        self.profile = None
+
+        self.address_book = AddressBook(None, self)
+        self.address_book._profile = Contact(None, NetworkID.MSN, ACCOUNT,
+                "Papyon")
+        for account in contact_accounts(contacts):
+            contact = Contact(None, NetworkID.MSN, account, account,
+                    memberships=Membership.FORWARD | Membership.ALLOW)
+            self.address_book.contacts.add(contact)
+        self.address_book._state = AddressBookState.SYNCHRONIZED
+
+    @property
+    def protocol_version(self):
+        return self.protocol._protocol_version
+
+
+class Replay(object):
+    """Feeds reads to connections and measures how long each one blocks
+    the main loop"""
+    def __init__(self, name):
+        self.name = name
+        self.commands = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.max_stall = 0.0
+
+    def watch(self, connection):
+        connection.connect("command-received", self._on_command)
+
+    def feed(self, client, data):
+        start = time.time()
+        client.feed(data)
+        elapsed = time.time() - start
+        self.bytes += len(data)
+        self.elapsed += elapsed
+        if elapsed > self.max_stall:
+            self.max_stall = elapsed
+
+    def _on_command(self, connection, command):
+        self.commands += 1
+
+    def report(self):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print "%-10s %9d %10d %12.0f %12.1f %10.2f %10d" % (self.name,
+                self.commands, self.bytes, self.commands / self.elapsed,
+                self.elapsed / self.commands * 1e6, self.max_stall * 1e3,
+                peak)
+
+
+def replay_login(data, contacts, read_size):
+    client = OfflineClient(contacts)
+    connection = MemoryConnection(("127.0.0.1", 1863))
+    client.protocol = NotificationProtocol(client, connection)
+    client.profile = Profile((ACCOUNT, ""), client.protocol)
+
+    replay = Replay("login")
+    replay.watch(connection)
+    connection.establish_connection()
+    for read in split_reads(data, 1, read_size):
+        replay.feed(connection._transport, read)
+    return replay
+
+def replay_chat(traffic, contacts, read_size):
+    client = OfflineClient(contacts)
+    client.protocol = NotificationProtocol(client,
+            MemoryConnection(("127.0.0.1", 1863)))
+    client.profile = Profile((ACCOUNT, ""), client.protocol)
+
+    replay = Replay("chat")
+    switchboards = []
+    for i, data in enumerate(traffic):
+        connection = MemoryConnection(("127.0.0.1", 1863),
+                ServerType.SWITCHBOARD)
+        protocol = SwitchboardProtocol(client, connection, str(i))
+        replay.watch(connection)
+        connection.establish_connection()
+        reads = split_reads(data, 1, read_size, seed=i)
+        reads.reverse()
+        switchboards.append((connection._transport, protocol, reads))
+
+    # the switchboards all receive their traffic at the same time
+    while switchboards:
+        for entry in switchboards[:]:
+            io_client, protocol, reads = entry
+            replay.feed(io_client, reads.pop())
+            if not reads:
+                switchboards.remove(entry)
+    return replay
+
+def main():
+    parser = OptionParser(usage="%prog [options] [capture ...]")
+    parser.add_option("-c", "--contacts", type="int", default=5000,
+            help="number of contacts of the generated login traffic")
+    parser.add_option("-s", "--switchboards", type="int", default=100,
+            help="number of switchboards of the generated chat traffic")
+    parser.add_option("-m", "--messages", type="int", default=200,
+            help="number of messages received on each switchboard")
+    parser.add_option("-r", "--read-size", type="int", default=1460,
+            help="maximum size of the reads")
+    options, captures = parser.parse_args()
+
+    if captures:
+        login = "".join([read_capture(path) for path in captures])
+    else:
+        login = ns_login_traffic(options.contacts)
+    chat = sb_chat_traffic(options.switchboards, options.messages,
+            contacts=options.contacts)
+
+    print "%-10s %9s %10s %12s %12s %10s %10s" % ("scenario", "commands",
+            "bytes", "commands/s", "us/command", "stall ms", "peak KiB")
+    replay_login(login, options.contacts, options.read_size).report()
+    replay_chat(chat, options.contacts, options.read_size).report()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""MSNP traffic sources for the benchmarks.
+
+The traffic is either read from a raw capture of what the server sent,
+or generated so that it looks like what the Notification Server sends
+during a login, or what the Switchboard Servers send during a busy chat
+session."""
+
+import random
+import urllib
+
+from papyon.util.trace import TrafficCapture, CaptureRecord
+from papyon.util.trace import read_capture as read_capture_records
+
+__all__ = ['read_capture', 'ns_login_traffic', 'sb_chat_traffic',
+        'contact_accounts', 'split_reads']
+
+def read_capture(path, stream=0):
+    """Returns the bytes received from the server in a capture file,
+    either a raw dump written by a packet sniffer or a capture written by
+    L{papyon.util.trace.TrafficCapture}, in which case only the given
+    stream is returned"""
+    capture = open(path, 'rb')
+    try:
+        data = capture.read()
+    finally:
+        capture.close()
+    if not data.startswith(TrafficCapture.MAGIC):
+        return data
+    records = read_capture_records(path)
+    return "".join([chunk for kind, id, timestamp, chunk in records
+        if kind == CaptureRecord.RECEIVED and id == stream])
+
+def _account(i):
+    return "contact%05d@hotmail.com" % i
+
+def _msn_object(i):
+    return urllib.quote('<msnobj Creator="%s" Size="21439" Type="3" '
+            'Location="TFR%d.dat" Friendly="AAA=" '
+            'SHA1D="0DGJvbCrUbMbtPaV7+VWuQHz+FY=" '
+            'SHA1C="9hCBj0ABE9zWkhO26zx2pR2iWlw="/>' % (_account(i), i))
+
+def _profile_msg():
+    payload = "MIME-Version: 1.0\r\n" \
+        "Content-Type: text/x-msmsgsprofile; charset=UTF-8\r\n" \
+        "LoginTime: 1224519617\r\n" \
+        "EmailEnabled: 0\r\n" \
+        "MemberIdHigh: 12345\r\n" \
+        "MemberIdLow: -1234567\r\n" \
+        "lang_preference: 1033\r\n" \
+        "country: FR\r\n" \
+        "Kid: 0\r\n" \
+        "Flags: 1073742915\r\n" \
+        "sid: 72652\r\n" \
+        "ClientIP: 192.0.2.12\r\n" \
+        "ClientPort: 39485\r\n" \
+        "ABCHMigrated: 1\r\n" \
+        "MPOPEnabled: 0\r\n\r\n"
+    return "MSG Hotmail Hotmail %d\r\n%s" % (len(payload), payload)
+
+def _ubx(i):
+    payload = "<Data><PSM>Status message of contact %d</PSM>" \
+        "<CurrentMedia></CurrentMedia>" \
+        "<MachineGuid>{F26D1F07-95E2-403C-BC18-D4BFED493428}</MachineGuid>" \
+        "</Data>" % i
+    return "UBX %s 1 %d\r\n%s" % (_account(i), len(payload), payload)
+
+def ns_login_traffic(contacts=5000, seed=0):
+    """Generates the traffic received from the Notification Server during
+    the synchronisation phase of a login.
+
+        @param contacts: number of contacts of the generated contact list
+        @type contacts: integer
+
+        @rtype: string"""
+    rand = random.Random(seed)
+    result = ["VER 1 MSNP15 CVR0\r\n",
+            "CVR 2 8.5.1288 8.5.1288 8.1.0178 "
+            "http://msgr.dlservice.microsoft.com http://messenger.msn.com\r\n",
+            "USR 3 OK papyon@hotmail.com 1 0\r\n",
+            "SBS 0 null\r\n",
+            _profile_msg(),
+            "BLP 4 BL\r\n",
+            "ADL 5 OK\r\n",
+            "CHG 6 NLN 2789003324 0\r\n"]
+    for i in xrange(contacts):
+        presence = rand.choice(("NLN", "BSY", "AWY", "IDL"))
+        nick = urllib.quote("Contact number %d" % i)
+        result.append("ILN 6 %s %s 1 %s 2789003324 %s\r\n" %
+                (presence, _account(i), nick, _msn_object(i)))
+        if rand.random() < 0.6:
+            result.append(_ubx(i))
+    return "".join(result)
+
+def contact_accounts(contacts=5000):
+    """Returns the accounts of the contacts of the generated traffic
+
+        @rtype: list of strings"""
+    return [_account(i) for i in xrange(contacts)]
+
+def _text_msg(account, nick, i):
+    payload = "MIME-Version: 1.0\r\n" \
+        "Content-Type: text/plain; charset=UTF-8\r\n" \
+        "X-MMS-IM-Format: FN=Segoe%%20UI; EF=; CO=0; CS=1; PF=0\r\n" \
+        "\r\n" \
+        "Message %d, some text to make it look like a real one" % i
+    return "MSG %s %s %d\r\n%s" % (account, nick, len(payload), payload)
+
+def _typing_msg(account, nick):
+    payload = "MIME-Version: 1.0\r\n" \
+        "Content-Type: text/x-msmsgscontrol\r\n" \
+        "TypingUser: %s\r\n" \
+        "\r\n\r\n" % account
+    return "MSG %s %s %d\r\n%s" % (account, nick, len(payload), payload)
+
+def sb_chat_traffic(switchboards=100, messages=200, participants=3,
+        contacts=5000, seed=0):
+    """Generates the traffic received on the Switchboard Servers during a
+    busy chat session: on each switchboard the participants join, then
+    send text messages and typing notifications, mixed with the
+    acknowledgements of our own messages.
+
+        @param switchboards: number of switchboards
+        @type switchboards: integer
+
+        @param messages: number of messages received on each switchboard
+        @type messages: integer
+
+        @param participants: number of contacts joining each switchboard
+        @type participants: integer
+
+        @param contacts: the participants are picked among that many
+            contacts, see L{contact_accounts}
+        @type contacts: integer
+
+        @return: the traffic of each switchboard
+        @rtype: list of strings"""
+    rand = random.Random(seed)
+    result = []
+    for sb in xrange(switchboards):
+        joined = [(_account(i), urllib.quote("Contact number %d" % i))
+                for i in rand.sample(xrange(contacts), participants)]
+        traffic = ["USR 1 OK papyon@hotmail.com Papyon\r\n"]
+        for account, nick in joined:
+            traffic.append("JOI %s %s 2789003324\r\n" % (account, nick))
+        trid = 2
+        for i in xrange(messages):
+            account, nick = rand.choice(joined)
+            draw = rand.random()
+            if draw < 0.6:
+                traffic.append(_text_msg(account, nick, i))
+            elif draw < 0.9:
+                traffic.append(_typing_msg(account, nick))
+            else:
+                traffic.append("ACK %d\r\n" % trid)
+                trid += 1
+        for account, nick in joined:
+            traffic.append("BYE %s\r\n" % account)
+        result.append("".join(traffic))
+    return result
+
+def split_reads(data, min_size=1, max_size=1460, seed=0):
+    """Splits data in reads of random sizes, like a socket would return it
+
+        @rtype: list of strings"""
+    rand = random.Random(seed)
+    reads = []
+    offset = 0
+    while offset < len(data):
+        size = rand.randint(min_size, max_size)
+        reads.append(data[offset:offset + size])
+        offset += size
+    return reads
@@ -89,6 +89,8 @@ import papyon.service.OfflineIM as OIM
 import papyon.service.Spaces as Spaces
 
 from papyon.util.decorator import rw_property
+from papyon.gnet.eventloop import get_event_loop
+from papyon.gnet.resolver import HostnameResolver, WELL_KNOWN_HOSTS
 from papyon.transport import *
 from papyon.switchboard_manager import SwitchboardManager
 from papyon.msnp2p import P2PSessionManager
@@ -109,9 +111,31 @@ logger = logging.getLogger('papyon.client')
 class Client(EventsDispatcher):
     """This class provides way to connect to the notification server as well
     as methods to manage the contact list, and the personnal settings.
+
+    The notification server an account was redirected to is remembered, the
+    next logins go straight to it. When the connection is lost after the
+    login completed, the client reconnects to that server, reusing the
+    security tokens and the address book it already has, and only reports
+    a network error once all the L{RECONNECT_DELAYS} attempts failed.
+
+    The presence related changes of the contacts can be coalesced, see
+    L{set_presence_batching}, and the address book can be kept on disk so
+    that only its changes are downloaded at login, see
+    L{set_cache_directory}.
+
         @sort: __init__, login, logout, state, profile, address_book,
                 msn_object_store, oim_box, spaces"""
 
+    RECONNECT_DELAYS = (1, 5, 15) # in seconds
+
+    _ns_endpoints = {} # account => (host, port) of its notification server
+
+    # contact properties delivered by on_contacts_presence_batch when
+    # the presence batching is enabled
+    PRESENCE_BATCH_PROPERTIES = ('presence', 'display-name',
+            'personal-message', 'current-media', 'msn-object',
+            'client-capabilities')
+
     def __init__(self, server, proxies={}, transport_class=DirectConnection,
             version=15, client_type=msnp.ClientTypes.COMPUTER):
         """Initializer
@@ -132,6 +156,9 @@ class Client(EventsDispatcher):
         self._proxies = proxies
         self._transport_class = transport_class
         self._client_type = client_type
+        self._server = server
+
+        HostnameResolver().prefetch((server[0],) + WELL_KNOWN_HOSTS)
 
         self._transport = transport_class(server, ServerType.NOTIFICATION,
                 self._proxies)
@@ -159,6 +186,14 @@ class Client(EventsDispatcher):
         self._mailbox = None
 
         self.__die = False
+        self.__resuming = False
+        self.__reconnect_attempt = 0
+        self.__reconnect_source = None
+        self.__endpoint_from_cache = False
+        self.__presence_batch_interval = 0
+        self.__presence_batch = {} # contact => [property name, ...]
+        self.__presence_batch_source = None
+        self.__cache_directory = None
         self.__connect_transport_signals()
         self.__connect_protocol_signals()
         self.__connect_switchboard_manager_signals()
@@ -253,6 +288,12 @@ class Client(EventsDispatcher):
         self.__connect_profile_signals()
         self._mailbox = msnp.Mailbox(self._protocol)
         self.__connect_mailbox_signals()
+        self.__stop_reconnecting()
+        endpoint = Client._ns_endpoints.get(account, self._server)
+        self.__endpoint_from_cache = (endpoint != self._server)
+        if endpoint != self._transport.endpoint:
+            logger.info("Connecting directly to %s:%d" % endpoint)
+            self._transport.set_endpoint(endpoint)
         self._transport.establish_connection()
 
     def logout(self):
@@ -261,13 +302,40 @@ class Client(EventsDispatcher):
             logger.warning('alreay logged out')
             return
         self.__die = True
+        resuming = self.__resuming
+        self.__stop_reconnecting()
+        self.__flush_presence_batch()
         self._switchboard_manager.close()
-        if self.__state < ClientState.AUTHENTICATING:
+        if resuming or self.__state < ClientState.AUTHENTICATING:
             self._transport.lose_connection()
         else:
             self._protocol.signoff()
         self.__state = ClientState.CLOSED
 
+    def set_presence_batching(self, interval):
+        """Coalesces the changes of the L{PRESENCE_BATCH_PROPERTIES} of the
+        contacts: instead of an on_contact_*_changed event per change, the
+        changes collected during interval are delivered at once by
+        on_contacts_presence_batch. Useful during the presence storm that
+        follows the login with a large contact list.
+
+            @param interval: how long, in milliseconds, the changes are
+                collected, 0 (the default) disables the batching
+            @type interval: integer"""
+        self.__presence_batch_interval = max(0, interval)
+        if self.__presence_batch_interval == 0:
+            self.__flush_presence_batch()
+
+    def set_cache_directory(self, directory):
+        """Keeps the address book on disk between the sessions, so that
+        only the changes made since the previous session are downloaded
+        at login. Must be set before logging in.
+
+            @param directory: where the address books are stored, None (the
+                default) disables the cache
+            @type directory: string"""
+        self.__cache_directory = directory
+
     ### protected:
     @rw_property
     def _state():
@@ -293,6 +361,85 @@ class Client(EventsDispatcher):
         del self._external_conversations[contact]
 
     ### private:
+    def __schedule_reconnect(self):
+        """Plans the next fast reconnection attempt, returns False when
+        all of them were used"""
+        if self.__reconnect_attempt >= len(self.RECONNECT_DELAYS):
+            self.__stop_reconnecting()
+            return False
+        delay = self.RECONNECT_DELAYS[self.__reconnect_attempt]
+        self.__reconnect_attempt += 1
+        logger.info("Reconnecting in %d seconds (attempt %d)" % \
+                (delay, self.__reconnect_attempt))
+        # the state is left as is, the session is resumed silently
+        self.__resuming = True
+        self.__endpoint_from_cache = True
+        self.__reconnect_source = get_event_loop().timeout_add(delay * 1000,
+                self.__reconnect)
+        return True
+
+    def __reconnect(self):
+        self.__reconnect_source = None
+        self._transport.establish_connection()
+        return False
+
+    def __stop_reconnecting(self):
+        if self.__reconnect_source is not None:
+            get_event_loop().source_remove(self.__reconnect_source)
+            self.__reconnect_source = None
+        self.__resuming = False
+        self.__reconnect_attempt = 0
+
+    def __resume_session(self):
+        """Restores what the server forgot with the previous connection"""
+        self.__stop_reconnecting()
+        presence = self.profile.presence
+        if presence != profile.Presence.OFFLINE:
+            self._protocol.set_presence(presence, self.profile.client_id,
+                    self.profile.msn_object)
+        if self.profile.personal_message or self.profile.current_media:
+            self._protocol.set_personal_message(self.profile.personal_message,
+                    self.profile.current_media)
+
+    def __forget_endpoint(self):
+        """Falls back to the dispatch server if the cached notification
+        server can't be reached, returns True if it did"""
+        if not self.__endpoint_from_cache or \
+                self._transport.endpoint == self._server:
+            return False
+        self.__endpoint_from_cache = False
+        logger.info("Notification server %s:%d unreachable" % \
+                self._transport.endpoint)
+        Client._ns_endpoints.pop(self.profile.account, None)
+        self._transport.set_endpoint(self._server)
+        return True
+
+    def __queue_presence_change(self, contact, name):
+        changes = self.__presence_batch.get(contact, None)
+        if changes is None:
+            changes = self.__presence_batch[contact] = []
+        if name not in changes:
+            changes.append(name)
+        if self.__presence_batch_source is None:
+            self.__presence_batch_source = get_event_loop().timeout_add(
+                    self.__presence_batch_interval,
+                    self.__on_presence_batch_timeout)
+
+    def __on_presence_batch_timeout(self):
+        self.__presence_batch_source = None
+        self.__flush_presence_batch()
+        return False
+
+    def __flush_presence_batch(self):
+        if self.__presence_batch_source is not None:
+            get_event_loop().source_remove(self.__presence_batch_source)
+            self.__presence_batch_source = None
+        if len(self.__presence_batch) == 0:
+            return
+        changes = self.__presence_batch
+        self.__presence_batch = {}
+        self._dispatch("on_contacts_presence_batch", changes)
+
     def __connect_profile_signals(self):
         """Connect profile signals"""
         def property_changed(profile, pspec):
@@ -326,6 +473,10 @@ class Client(EventsDispatcher):
             self._dispatch(method_name, contact, *event_args)
 
         def property_changed(contact, pspec):
+            if self.__presence_batch_interval > 0 and \
+                    pspec.name in self.PRESENCE_BATCH_PROPERTIES:
+                self.__queue_presence_change(contact, pspec.name)
+                return
             method_name = "on_contact_%s_changed" % pspec.name.replace("-", "_")
             self._dispatch(method_name, contact)
 
@@ -344,10 +495,19 @@ class Client(EventsDispatcher):
     def __connect_transport_signals(self):
         """Connect transport signals"""
         def connect_success(transp):
+            self.__endpoint_from_cache = False
+            if self.__resuming:
+                # keep the tokens and the address book of the lost session
+                return
             self._sso = SSO.SingleSignOn(self.profile.account,
                                          self.profile.password,
                                          self._proxies)
-            self._address_book = AB.AddressBook(self._sso, self, self._proxies)
+            cache = None
+            if self.__cache_directory is not None:
+                cache = AB.AddressBookCache(self.__cache_directory,
+                        self.profile.account)
+            self._address_book = AB.AddressBook(self._sso, self, self._proxies,
+                    cache)
             self.__connect_addressbook_signals()
             self._oim_box = OIM.OfflineMessagesBox(self._sso, self, self._proxies)
             self.__connect_oim_box_signals()
@@ -356,10 +516,26 @@ class Client(EventsDispatcher):
             self._state = ClientState.CONNECTED
 
         def connect_failure(transp, reason):
+            cached_endpoint_failed = self.__forget_endpoint()
+            if self.__resuming:
+                if self.__schedule_reconnect():
+                    return
+            elif cached_endpoint_failed:
+                self._transport.establish_connection()
+                return
             self._dispatch("on_client_error", ClientErrorType.NETWORK, reason)
             self._state = ClientState.CLOSED
 
         def disconnected(transp, reason):
+            if not self.__die and (self.__resuming or
+                    self._state == ClientState.OPEN):
+                if not self.__resuming:
+                    # presences will be sent again once reconnected
+                    for contact in self.address_book.contacts:
+                        contact._server_property_changed("presence",
+                                profile.Presence.OFFLINE)
+                if self.__schedule_reconnect():
+                    return
             if not self.__die:
                 self._dispatch("on_client_error", ClientErrorType.NETWORK, reason)
             self.__die = False
@@ -373,6 +549,15 @@ class Client(EventsDispatcher):
         """Connect protocol signals"""
         def state_changed(proto, param):
             state = proto.state
+            if state == msnp.ProtocolState.AUTHENTICATED:
+                Client._ns_endpoints[self.profile.account] = \
+                        self._transport.endpoint
+            if self.__resuming:
+                # the client stays OPEN while the session is resumed
+                if state == msnp.ProtocolState.OPEN:
+                    self.__resume_session()
+                return
+
             if state == msnp.ProtocolState.AUTHENTICATING:
                 self._state = ClientState.AUTHENTICATING
             elif state == msnp.ProtocolState.AUTHENTICATED:
@@ -405,6 +590,12 @@ class Client(EventsDispatcher):
             self.__die = True
             self._transport.lose_connection()
 
+        def disconnected_by_server(proto):
+            # the server ended the session on purpose, it is not resumed
+            self._dispatch("on_client_error", ClientErrorType.NETWORK, None)
+            self.__die = True
+            self._transport.lose_connection()
+
         def unmanaged_message_received(proto, sender, message):
             if sender in self._external_conversations:
                 conversation = self._external_conversations[sender]
@@ -420,6 +611,8 @@ class Client(EventsDispatcher):
         self._protocol.connect("authentication-failed", authentication_failed)
         self._protocol.connect("disconnected-by-other", disconnected_by_other)
         self._protocol.connect("server-down", server_down)
+        self._protocol.connect("disconnected-by-server",
+                disconnected_by_server)
         self._protocol.connect("unmanaged-message-received", unmanaged_message_received)
 
     def __connect_switchboard_manager_signals(self):
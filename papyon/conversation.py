@@ -29,9 +29,10 @@ import p2p
 from switchboard_manager import SwitchboardClient
 from papyon.event import EventsDispatcher
 from papyon.profile import NetworkID
+from papyon.gnet.constants import IoPriority
+from papyon.gnet.eventloop import get_event_loop
 
 import logging
-import gobject
 from urllib import quote, unquote
 
 __all__ = ['Conversation', 'ConversationInterface', 'ConversationMessage', 'TextFormat']
@@ -387,7 +388,7 @@ class ExternalNetworkConversation(AbstractConversation):
         AbstractConversation.__init__(self, client)
         self.participants = set(contacts)
         client._register_external_conversation(self)
-        gobject.idle_add(self._open)
+        get_event_loop().idle_add(self._open)
 
     def _open(self):
         for contact in self.participants:
@@ -444,4 +445,9 @@ class SwitchboardConversation(AbstractConversation, SwitchboardClient):
 
     def _send_message(self, content_type, body, headers={},
             ack=msnp.MessageAcknowledgement.HALF):
-        SwitchboardClient._send_message(self, content_type, body, headers, ack)
+        if content_type == "text/x-msmsgscontrol":
+            priority = IoPriority.HIGH # typing notifications
+        else:
+            priority = None
+        SwitchboardClient._send_message(self, content_type, body, headers, ack,
+                priority=priority)
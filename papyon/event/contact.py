@@ -80,6 +80,19 @@ class ContactEventInterface(BaseEventInterface):
             @type contact: L{Contact<papyon.profile.Contact>}"""
         pass
 
+    def on_contacts_presence_batch(self, changes):
+        """Called with the changes collected during the presence batching
+        window, see L{papyon.Client.set_presence_batching}. The default
+        implementation calls the on_contact_*_changed method matching
+        each change.
+            @param changes: the names of the properties that changed, for
+                each contact (e.g. "presence", "display-name")
+            @type changes: {L{Contact<papyon.profile.Contact>}: [string]}"""
+        for contact, properties in changes.iteritems():
+            for name in properties:
+                method_name = "on_contact_%s_changed" % name.replace("-", "_")
+                getattr(self, method_name)(contact)
+
     def on_contact_msn_object_changed(self, contact):
         """Called when the MSNObject of a contact changes.
             @param contact: the contact whose presence changed
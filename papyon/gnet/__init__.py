@@ -23,5 +23,6 @@
 The GNet library was designed as a replacement for the python asyncore
 and asynchat modules that easily integrate with the glib main loop.
 """
-from constants import IoStatus, IoError
+from constants import IoStatus, IoPriority, IoError
+import eventloop
 import io
@@ -37,6 +37,13 @@ class IoStatus(object):
     OPENING = 2
     OPEN    = 3
 
+class IoPriority(object):
+    """Priority classes of the outgoing data, higher priority data is
+    written first while the order within a class is kept"""
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
 class IoError(object):
     """I/O error codes"""
     UNKNOWN = 0
@@ -51,3 +58,5 @@ class IoError(object):
     PROXY_AUTHENTICATION_REQUIRED = 21
     PROXY_FORBIDDEN = 22
 
+    CONTENT_DECODING_FAILED = 30
+
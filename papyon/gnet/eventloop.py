@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+
+"""Main loop abstraction used by gnet.
+
+Every IO watch, timer and idle callback of gnet goes through the loop
+returned by L{get_event_loop}. By default it is the glib main loop, but a
+process hosting a lot of connections can switch to the lighter
+L{PollEventLoop} by calling L{set_event_loop} before creating any client.
+
+The callbacks follow the glib conventions: they return True to be called
+again and False to be removed, IO callbacks receive the file descriptor and
+the condition that triggered them."""
+
+import errno
+import heapq
+import logging
+import os
+import select
+import thread
+import threading
+import time
+
+__all__ = ['IO_IN', 'IO_OUT', 'IO_PRI', 'IO_ERR', 'IO_HUP', 'IO_NVAL',
+        'EventLoop', 'GObjectEventLoop', 'PollEventLoop',
+        'get_event_loop', 'set_event_loop']
+
+logger = logging.getLogger('papyon.gnet.eventloop')
+
+# same values as the glib GIOCondition flags and the poll(2) events
+IO_IN = 1
+IO_PRI = 2
+IO_OUT = 4
+IO_ERR = 8
+IO_HUP = 16
+IO_NVAL = 32
+
+
+class EventLoop(object):
+    """Interface of the main loop backends"""
+
+    def io_add_watch(self, fd, condition, callback, *args):
+        """Calls callback(fd, condition, *args) whenever fd matches condition
+
+            @param fd: the file descriptor, or an object with a fileno method
+            @param condition: a combination of the IO_* flags
+            @return: the source id"""
+        raise NotImplementedError
+
+    def timeout_add(self, interval, callback, *args):
+        """Calls callback(*args) every interval milliseconds
+
+            @return: the source id"""
+        raise NotImplementedError
+
+    def idle_add(self, callback, *args):
+        """Calls callback(*args) when the loop has nothing else to do, this
+        is the only method that can be called from another thread
+
+            @return: the source id"""
+        raise NotImplementedError
+
+    def source_remove(self, source_id):
+        """Removes an IO watch, timer or idle callback"""
+        raise NotImplementedError
+
+    def threads_init(self):
+        """Must be called before other threads use L{idle_add}"""
+        pass
+
+    def run(self):
+        """Runs the loop until L{quit} is called"""
+        raise NotImplementedError
+
+    def quit(self):
+        raise NotImplementedError
+
+
+class GObjectEventLoop(EventLoop):
+    """Backend running on the default glib main context"""
+
+    def __init__(self):
+        import gobject
+        self._gobject = gobject
+        self._mainloop = None
+
+    def io_add_watch(self, fd, condition, callback, *args):
+        if hasattr(fd, "fileno"):
+            fd = fd.fileno()
+        return self._gobject.io_add_watch(fd, condition, callback, *args)
+
+    def timeout_add(self, interval, callback, *args):
+        return self._gobject.timeout_add(interval, callback, *args)
+
+    def idle_add(self, callback, *args):
+        return self._gobject.idle_add(callback, *args)
+
+    def source_remove(self, source_id):
+        self._gobject.source_remove(source_id)
+
+    def threads_init(self):
+        # release the GIL while the main loop is polling, otherwise
+        # the other threads would never get a chance to run
+        self._gobject.threads_init()
+
+    def run(self):
+        self._mainloop = self._gobject.MainLoop(is_running=True)
+        self._mainloop.run()
+
+    def quit(self):
+        if self._mainloop is not None:
+            self._mainloop.quit()
+            self._mainloop = None
+
+
+class _Poller(object):
+    """Uses the best polling mechanism of the platform: epoll, poll or, as
+    a last resort, select"""
+
+    def __init__(self):
+        if hasattr(select, "epoll"):
+            self._epoll = select.epoll()
+            self._poll = self._epoll.poll
+            self._timeout_scale = 0.001
+            self.register = self._epoll.register
+            self.modify = self._epoll.modify
+            self.unregister = self._epoll.unregister
+        elif hasattr(select, "poll"):
+            poll = select.poll()
+            self._poll = poll.poll
+            self._timeout_scale = 1
+            self.register = poll.register
+            self.modify = poll.modify
+            self.unregister = poll.unregister
+        else:
+            self._fds = {}
+            self.register = self.modify = self._fds.__setitem__
+            self.unregister = self._fds.__delitem__
+            self._poll = self._select
+            self._timeout_scale = 0.001
+
+    def poll(self, timeout):
+        """Waits at most timeout milliseconds, forever if None"""
+        if timeout is None:
+            timeout = -1
+        else:
+            timeout *= self._timeout_scale
+        try:
+            return self._poll(timeout)
+        except (select.error, IOError), err:
+            if err.args[0] == errno.EINTR:
+                return []
+            raise
+
+    def _select(self, timeout):
+        if timeout < 0:
+            timeout = None
+        readers = [fd for fd, cond in self._fds.iteritems()
+                if cond & (IO_IN | IO_PRI)]
+        writers = [fd for fd, cond in self._fds.iteritems() if cond & IO_OUT]
+        readable, writable, failed = select.select(readers, writers,
+                self._fds.keys(), timeout)
+        events = {}
+        for fd in readable:
+            events[fd] = events.get(fd, 0) | IO_IN
+        for fd in writable:
+            events[fd] = events.get(fd, 0) | IO_OUT
+        for fd in failed:
+            events[fd] = events.get(fd, 0) | IO_ERR
+        return events.items()
+
+
+class PollEventLoop(EventLoop):
+    """Backend built on epoll (or poll/select where unavailable), it does
+    not depend on glib and has a much lower per event overhead, which
+    matters when a single process drives thousands of sockets."""
+
+    def __init__(self):
+        self._poller = _Poller()
+        self._next_id = 1
+        self._watches = {} # fd => {source_id: (condition, callback, args)}
+        self._watch_fds = {} # source_id => fd
+        self._timers = [] # heap of (deadline, source_id)
+        self._timer_sources = {} # source_id => (interval, callback, args)
+        self._idles = {} # source_id => (callback, args)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._poller.register(self._wakeup_read, IO_IN)
+
+    def _new_source_id(self):
+        self._lock.acquire()
+        try:
+            source_id = self._next_id
+            self._next_id += 1
+        finally:
+            self._lock.release()
+        return source_id
+
+    def io_add_watch(self, fd, condition, callback, *args):
+        if hasattr(fd, "fileno"):
+            fd = fd.fileno()
+        source_id = self._new_source_id()
+        watches = self._watches.get(fd, None)
+        if watches is None:
+            watches = self._watches[fd] = {}
+            watches[source_id] = (condition, callback, args)
+            self._poller.register(fd, condition)
+        else:
+            watches[source_id] = (condition, callback, args)
+            self._poller.modify(fd, self._condition(fd))
+        self._watch_fds[source_id] = fd
+        return source_id
+
+    def timeout_add(self, interval, callback, *args):
+        source_id = self._new_source_id()
+        self._timer_sources[source_id] = (interval, callback, args)
+        heapq.heappush(self._timers, (time.time() + interval / 1000.0,
+            source_id))
+        return source_id
+
+    def idle_add(self, callback, *args):
+        source_id = self._new_source_id()
+        self._lock.acquire()
+        try:
+            self._idles[source_id] = (callback, args)
+        finally:
+            self._lock.release()
+        if self._thread is not None and self._thread != thread.get_ident():
+            os.write(self._wakeup_write, "x")
+        return source_id
+
+    def source_remove(self, source_id):
+        if source_id in self._watch_fds:
+            fd = self._watch_fds.pop(source_id)
+            watches = self._watches[fd]
+            del watches[source_id]
+            if len(watches) == 0:
+                del self._watches[fd]
+                try:
+                    self._poller.unregister(fd)
+                except (IOError, OSError, KeyError, ValueError):
+                    pass # the file descriptor is already closed
+            else:
+                self._poller.modify(fd, self._condition(fd))
+        elif source_id in self._timer_sources:
+            # the heap entry is dropped when it expires
+            del self._timer_sources[source_id]
+        else:
+            self._lock.acquire()
+            try:
+                self._idles.pop(source_id, None)
+            finally:
+                self._lock.release()
+
+    def _condition(self, fd):
+        condition = 0
+        for cond, callback, args in self._watches[fd].itervalues():
+            condition |= cond
+        return condition
+
+    def iteration(self, block=True):
+        """Runs one iteration of the loop: waits for events, and dispatches
+        the IO watches, the expired timers and the idle callbacks"""
+        self._thread = thread.get_ident()
+        if not block or len(self._idles) > 0:
+            timeout = 0
+        elif len(self._timers) > 0:
+            timeout = max(0, (self._timers[0][0] - time.time()) * 1000)
+        else:
+            timeout = None
+
+        for fd, events in self._poller.poll(timeout):
+            if fd == self._wakeup_read:
+                os.read(self._wakeup_read, 4096)
+                continue
+            self._dispatch_io(fd, events)
+        self._dispatch_timers()
+        self._dispatch_idles()
+
+    def _dispatch_io(self, fd, events):
+        watches = self._watches.get(fd, None)
+        if watches is None:
+            return
+        for source_id, (cond, callback, args) in watches.items():
+            if source_id not in self._watch_fds:
+                continue # removed by a previous callback
+            triggered = events & (cond | IO_ERR | IO_HUP | IO_NVAL)
+            if triggered == 0:
+                continue
+            if not callback(fd, triggered, *args):
+                if source_id in self._watch_fds:
+                    self.source_remove(source_id)
+
+    def _dispatch_timers(self):
+        now = time.time()
+        while len(self._timers) > 0 and self._timers[0][0] <= now:
+            deadline, source_id = heapq.heappop(self._timers)
+            source = self._timer_sources.get(source_id, None)
+            if source is None:
+                continue
+            interval, callback, args = source
+            if callback(*args) and source_id in self._timer_sources:
+                heapq.heappush(self._timers,
+                        (now + interval / 1000.0, source_id))
+            else:
+                self._timer_sources.pop(source_id, None)
+
+    def _dispatch_idles(self):
+        self._lock.acquire()
+        try:
+            idles = self._idles.items()
+        finally:
+            self._lock.release()
+        for source_id, (callback, args) in idles:
+            if source_id not in self._idles:
+                continue
+            if not callback(*args):
+                self.source_remove(source_id)
+
+    def run(self):
+        self._running = True
+        while self._running:
+            self.iteration()
+
+    def quit(self):
+        self._running = False
+        if self._thread is not None and self._thread != thread.get_ident():
+            os.write(self._wakeup_write, "x")
+
+
+_event_loop = None
+
+def get_event_loop():
+    """Returns the loop used by gnet, the glib main loop unless
+    L{set_event_loop} was called"""
+    global _event_loop
+    if _event_loop is None:
+        _event_loop = GObjectEventLoop()
+    return _event_loop
+
+def set_event_loop(loop):
+    """Selects the loop used by gnet, must be called before any client is
+    created"""
+    global _event_loop
+    _event_loop = loop
@@ -21,6 +21,7 @@
 by higher level classes"""
 
 from abstract import *
+from shaper import *
 from sock import *
 from tcp import *
 from ssl_socket import *
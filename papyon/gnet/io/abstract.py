@@ -65,6 +65,14 @@ class AbstractClient(gobject.GObject):
             "sent": (gobject.SIGNAL_RUN_FIRST,
                 gobject.TYPE_NONE,
                 (object, gobject.TYPE_ULONG)),
+
+            "congested": (gobject.SIGNAL_RUN_FIRST,
+                gobject.TYPE_NONE,
+                ()),
+
+            "writable": (gobject.SIGNAL_RUN_FIRST,
+                gobject.TYPE_NONE,
+                ()),
             }
 
     def __init__(self, host, port, domain=AF_INET, type=SOCK_STREAM):
@@ -121,7 +129,7 @@ class AbstractClient(gobject.GObject):
         """Close the connection."""
         raise NotImplementedError
 
-    def send(self, buffer, callback=None, *args):
+    def send(self, buffer, callback=None, *args, **kwargs):
         """Send data to the server.
 
             @param buffer: data buffer.
@@ -132,6 +140,10 @@ class AbstractClient(gobject.GObject):
             @type callback: callback
 
             @param args: callback arguments to be passed to the callback.
+
+            @keyword priority: the class of the data, data of a higher
+                priority is sent before the data already queued with a
+                lower one, defaults to L{IoPriority.NORMAL}
         """
         raise NotImplementedError
 
@@ -152,6 +164,17 @@ class AbstractClient(gobject.GObject):
         return self._transport.getsockname()
     sockname = property(__get_sockname, None)
 
+    @property
+    def queued_bytes(self):
+        """Number of bytes given to L{send} but not written yet"""
+        return 0
+
+    @property
+    def congested(self):
+        """True between the "congested" signal, emitted when too much data
+        is waiting to be written, and the following "writable" signal"""
+        return False
+
     @property
     def domain(self):
         return self._domain
@@ -19,10 +19,15 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 #
 from papyon.gnet.constants import *
+from papyon.gnet.eventloop import *
 from papyon.gnet.resolver import *
+from papyon.util.trace import TrafficCapture
 from abstract import AbstractClient
+from shaper import TokenBucket
 
 import gobject
+import time
+from collections import deque
 from errno import *
 
 __all__ = ['GIOChannelClient']
@@ -32,14 +37,24 @@ class OutgoingPacket(object):
     def __init__(self, buffer, size, callback=None, *cb_args):
         self.buffer = buffer
         self.size = size
+        self.queued_at = time.time()
         self._sent = 0
         self._callback = callback
         self._callback_args = cb_args
 
+    @property
+    def remaining(self):
+        """number of bytes still waiting to be transmitted"""
+        return self.size - self._sent
+
     def read(self, size=2048):
-        if size is not None:
-            return self.buffer[self._sent:][0:size]
-        return self.buffer[self._sent:]
+        """return the data still to be sent, at most size bytes, as a
+        read-only view on the packet buffer so that no copy is made"""
+        if size is None or size > self.remaining:
+            size = self.remaining
+        if self._sent == 0 and size == self.size:
+            return self.buffer
+        return buffer(self.buffer, self._sent, size)
 
     def sent(self, size):
         """update how many bytes have been sent"""
@@ -55,6 +70,88 @@ class OutgoingPacket(object):
             self._callback(*self._callback_args)
 
 
+class OutgoingQueue(object):
+    """Queue of L{OutgoingPacket}s waiting to be sent, with one FIFO lane
+    per L{IoPriority}.
+
+    Small packets are gathered so that a single write can carry several
+    of them, the packets are only copied when they need to be coalesced.
+    Once returned by L{read}, packets are staged: they stay ahead of any
+    packet queued later, whatever its priority, so a partially written
+    packet is never interleaved and a write can be retried with the same
+    data."""
+
+    def __init__(self):
+        self._lanes = [deque() for i in range(IoPriority.LOW + 1)]
+        self._staged = deque()
+        self._count = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def size(self):
+        """number of bytes waiting in the queue"""
+        return self._size
+
+    def append(self, packet, priority=IoPriority.NORMAL):
+        self._lanes[priority].append(packet)
+        self._count += 1
+        self._size += packet.remaining
+
+    def clear(self):
+        for lane in self._lanes:
+            lane.clear()
+        self._staged.clear()
+        self._count = 0
+        self._size = 0
+
+    def read(self, size):
+        """return at most size bytes from the head of the queue"""
+        staged = self._staged
+        length = 0
+        for packet in staged:
+            length += packet.remaining
+        if length < size:
+            for lane in self._lanes:
+                while length < size and len(lane) > 0:
+                    packet = lane.popleft()
+                    staged.append(packet)
+                    length += packet.remaining
+
+        head = staged[0]
+        if head.remaining >= size or len(staged) == 1:
+            return head.read(size)
+
+        chunks = []
+        length = 0
+        for packet in staged:
+            chunk = packet.read(size - length)
+            if not isinstance(chunk, str):
+                chunk = str(chunk)
+            chunks.append(chunk)
+            length += len(chunk)
+            if length >= size:
+                break
+        return "".join(chunks)
+
+    def sent(self, size):
+        """mark size bytes as transmitted, and return the list of packets
+        that were completely sent"""
+        self._size -= size
+        completed = []
+        while size > 0:
+            packet = self._staged[0]
+            count = min(size, packet.remaining)
+            packet.sent(count)
+            size -= count
+            if packet.is_complete():
+                completed.append(self._staged.popleft())
+                self._count -= 1
+        return completed
+
+
 class GIOChannelClient(AbstractClient):
     """Base class for clients using GIOChannel facilities
 
@@ -63,22 +160,39 @@ class GIOChannelClient(AbstractClient):
 
         @since: 0.1"""
 
+    MAX_WRITE_SIZE = 16384
+
+    MIN_READ_SIZE = 4096
+    MAX_READ_SIZE = 262144
+    MAX_READ_PER_WAKEUP = 1048576
+
+    HIGH_WATERMARK = 262144
+    LOW_WATERMARK = 65536
+
+    MIN_SHAPED_WRITE_SIZE = 1024
+
     def __init__(self, host, port, domain=AF_INET, type=SOCK_STREAM):
         AbstractClient.__init__(self, host, port, domain, type)
+        self._outgoing_queue = OutgoingQueue()
+        self._high_watermark = self.HIGH_WATERMARK
+        self._low_watermark = self.LOW_WATERMARK
+        self._congested = False
+        self._bucket = TokenBucket()
+        self._throttle_source = None
+        self._throttle_start = None
+        self._send_delay_total = 0.0
+        self._send_delay_count = 0
 
     def _pre_open(self, io_object):
         io_object.setblocking(False)
-        channel = gobject.IOChannel(io_object.fileno())
-        channel.set_flags(channel.get_flags() | gobject.IO_FLAG_NONBLOCK)
-        channel.set_encoding(None)
-        channel.set_buffered(False)
-
         self._transport = io_object
-        self._channel = channel
 
         self._source_id = None
         self._source_condition = 0
-        self._outgoing_queue = []
+        self._outgoing_queue = OutgoingQueue()
+        self._retry_write_size = None
+        self._read_size = self.MIN_READ_SIZE
+        self._congested = False
         AbstractClient._pre_open(self)
 
     def _post_open(self):
@@ -94,23 +208,191 @@ class GIOChannelClient(AbstractClient):
             self.emit("error", IoError.CONNECTION_FAILED)
             self._transport.close()
             return
-        else:
-            host = resolve_response.answer[0][1]
-        err = self._transport.connect_ex((host, port))
-        self._watch_set_cond(gobject.IO_PRI | gobject.IO_IN | gobject.IO_OUT |
-                gobject.IO_HUP | gobject.IO_ERR | gobject.IO_NVAL,
-                lambda chan, cond: self._post_open())
+        err = self._transport.connect_ex((resolve_response.answer[0][1], port))
+        self._watch_set_cond(IO_PRI | IO_IN | IO_OUT | IO_HUP | IO_ERR | IO_NVAL,
+                lambda fd, cond: self._post_open())
         if err in (0, EINPROGRESS, EALREADY, EWOULDBLOCK, EISCONN):
             return
         elif err in (EHOSTUNREACH, EHOSTDOWN, ECONNREFUSED, ECONNABORTED,
                 ENETUNREACH, ENETDOWN):
+            HostnameResolver.invalidate(host) # the cached address may be stale
             self.emit("error", IoError.CONNECTION_FAILED)
             self._transport.close()
 
+    def _read(self, size):
+        """Read at most size bytes from the transport.
+
+            @return: the data read, None if no data is available or an
+                empty string if the connection was closed"""
+        raise NotImplementedError
+
+    def _process_incoming_data(self):
+        """Read from the transport until it would block, and emit all the
+        received data at once"""
+        chunks = []
+        received = 0
+        eof = False
+        while received < self.MAX_READ_PER_WAKEUP:
+            size = self._read_size
+            data = self._read(size)
+            if data is None:
+                break
+            elif data == "":
+                eof = True
+                break
+            chunks.append(data)
+            received += len(data)
+            if len(data) == size and size < self.MAX_READ_SIZE:
+                self._read_size = size * 2
+
+        if received < self._read_size / 4 and \
+                self._read_size > self.MIN_READ_SIZE:
+            self._read_size /= 2
+
+        if received > 0:
+            if len(chunks) == 1:
+                buf = chunks[0]
+            else:
+                buf = "".join(chunks)
+            capture = TrafficCapture.current()
+            if capture is not None:
+                capture.received(self, buf)
+            self.emit("received", buf, received)
+        if eof:
+            self.close()
+        return self._status == IoStatus.OPEN
+
+    def _write(self, data):
+        """Write data to the transport.
+
+            @return: the number of bytes written, 0 if the transport is not
+                ready, or None if the connection was closed"""
+        raise NotImplementedError
+
+    def _process_outgoing_queue(self):
+        """Write as much of the outgoing queue as the transport and the
+        token buckets accept"""
+        process_bucket = TokenBucket.default()
+        while len(self._outgoing_queue) > 0:
+            size = self._retry_write_size
+            if size is None:
+                # a retried write must not be shaped: some transports
+                # require the exact same data to be written again
+                needed = min(self.MAX_WRITE_SIZE, self._outgoing_queue.size)
+                size = min(needed, self._bucket.available(),
+                        process_bucket.available())
+                if size < needed and \
+                        size < self._min_shaped_write_size(process_bucket):
+                    self._throttle(needed)
+                    return True
+            data = self._outgoing_queue.read(size)
+            written = self._write(data)
+            if written is None:
+                return False
+            if written == 0:
+                # the same data must be written again on the next attempt
+                self._retry_write_size = len(data)
+                return True
+            self._retry_write_size = None
+            capture = TrafficCapture.current()
+            if capture is not None:
+                capture.sent(self, data[:written])
+            self._bucket.consume(written)
+            process_bucket.consume(written)
+            now = time.time()
+            for packet in self._outgoing_queue.sent(written):
+                self._send_delay_total += now - packet.queued_at
+                self._send_delay_count += 1
+                self.emit("sent", packet.buffer, packet.size)
+                packet.callback()
+                if self._status != IoStatus.OPEN:
+                    return False
+            if self._congested and \
+                    self._outgoing_queue.size <= self._low_watermark:
+                self._congested = False
+                self.emit("writable")
+            if written < len(data):
+                return True
+        self._watch_remove_cond(IO_OUT)
+        return True
+
+    def _min_shaped_write_size(self, process_bucket):
+        # a bucket never holds more than its burst, waiting for more
+        # tokens than that would stall the queue
+        size = self.MIN_SHAPED_WRITE_SIZE
+        for bucket in (self._bucket, process_bucket):
+            if bucket.limited:
+                size = min(size, bucket.burst)
+        return size
+
+    def _throttle(self, size):
+        delay = max(self._bucket.delay(size),
+                TokenBucket.default().delay(size))
+        self._watch_remove_cond(IO_OUT)
+        self._throttle_start = time.time()
+        self._throttle_source = get_event_loop().timeout_add(
+                int(delay * 1000) + 1, self._on_throttle_timeout)
+
+    def _on_throttle_timeout(self):
+        waited = time.time() - self._throttle_start
+        self._bucket.total_delay += waited
+        TokenBucket.default().total_delay += waited
+        self._throttle_source = None
+        if self._status == IoStatus.OPEN and len(self._outgoing_queue) > 0:
+            self._watch_add_cond(IO_OUT)
+        return False
+
+    def set_rate_limit(self, rate, burst=None):
+        """Limits the outgoing throughput of this connection, it comes in
+        addition to the limit of L{TokenBucket.default} which applies to
+        all the connections of the process.
+
+            @param rate: maximum throughput in bytes per second, 0 to
+                remove the limit
+            @type rate: integer
+
+            @param burst: the number of bytes that can be sent at once
+            @type burst: integer"""
+        self._bucket.set_rate(rate, burst)
+
+    @property
+    def send_rate(self):
+        """Outgoing throughput, in bytes per second"""
+        return self._bucket.current_rate
+
+    @property
+    def send_delay(self):
+        """Average time, in seconds, spent by the packets in the outgoing
+        queue"""
+        if self._send_delay_count == 0:
+            return 0.0
+        return self._send_delay_total / self._send_delay_count
+
+    @property
+    def shaping_delay(self):
+        """Total time, in seconds, the writes were held back by the rate
+        limits"""
+        return self._bucket.total_delay
+
+    def set_watermarks(self, high, low):
+        """Sets the outgoing queue sizes, in bytes, above which the client
+        becomes congested and below which it becomes writable again"""
+        assert low <= high
+        self._high_watermark = high
+        self._low_watermark = low
+
+    @property
+    def queued_bytes(self):
+        return self._outgoing_queue.size
+
+    @property
+    def congested(self):
+        return self._congested
+
     # convenience methods
     def _watch_remove(self):
         if self._source_id is not None:
-            gobject.source_remove(self._source_id)
+            get_event_loop().source_remove(self._source_id)
             self._source_id = None
             self._source_condition = 0
 
@@ -119,7 +401,8 @@ class GIOChannelClient(AbstractClient):
         self._source_condition = cond
         if handler is None:
             handler = self._io_channel_handler
-        self._source_id = self._channel.add_watch(cond, handler)
+        self._source_id = get_event_loop().io_add_watch(self._transport,
+                cond, handler)
 
     def _watch_add_cond(self, cond):
         if self._source_condition & cond == cond:
@@ -145,17 +428,28 @@ class GIOChannelClient(AbstractClient):
             return
         self._status = IoStatus.CLOSING
         self._watch_remove()
+        if self._throttle_source is not None:
+            get_event_loop().source_remove(self._throttle_source)
+            self._throttle_source = None
+        capture = TrafficCapture.current()
+        if capture is not None:
+            capture.closed(self)
         try:
-            self._channel.close()
             self._transport.shutdown(socket.SHUT_RDWR)
         except:
             pass
         self._transport.close()
         self._status = IoStatus.CLOSED
 
-    def send(self, buffer, callback=None, *args):
+    def send(self, buffer, callback=None, *args, **kwargs):
         assert(self._status == IoStatus.OPEN), self._status
+        priority = kwargs.get("priority", IoPriority.NORMAL)
         self._outgoing_queue.append(OutgoingPacket(buffer, len(buffer),
-            callback, *args))
-        self._watch_add_cond(gobject.IO_OUT)
+            callback, *args), priority)
+        if self._throttle_source is None:
+            self._watch_add_cond(IO_OUT)
+        if not self._congested and \
+                self._outgoing_queue.size >= self._high_watermark:
+            self._congested = True
+            self.emit("congested")
 gobject.type_register(GIOChannelClient)
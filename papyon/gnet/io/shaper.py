@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+import sys
+import time
+
+__all__ = ['TokenBucket']
+
+class TokenBucket(object):
+    """Token bucket used to shape the outgoing traffic.
+
+    Tokens are bytes, they accumulate at L{rate} bytes per second up to
+    L{burst} bytes. A bucket with a rate of 0 never limits anything but
+    still measures the throughput going through it.
+
+        @ivar total_bytes: number of bytes that went through the bucket
+        @ivar total_delay: time, in seconds, writes were held back by the
+            bucket"""
+
+    RATE_WINDOW = 1.0
+
+    _default = None
+
+    def __init__(self, rate=0, burst=None):
+        """Initializer
+
+            @param rate: the maximum throughput in bytes per second, 0 for
+                no limit
+            @type rate: integer
+
+            @param burst: the number of bytes that can be sent at once,
+                defaults to one second worth of traffic
+            @type burst: integer"""
+        now = time.time()
+        self.rate = 0
+        self._tokens = 0
+        self._stamp = now
+        self._window_start = now
+        self._window_bytes = 0
+        self._current_rate = 0.0
+        self.total_bytes = 0
+        self.total_delay = 0.0
+        self.set_rate(rate, burst)
+        self._tokens = self.burst
+
+    @staticmethod
+    def default():
+        """Returns the bucket shared by all the connections of the process,
+        it does not limit anything until L{set_rate} is called on it"""
+        if TokenBucket._default is None:
+            TokenBucket._default = TokenBucket()
+        return TokenBucket._default
+
+    def set_rate(self, rate, burst=None):
+        """Changes the limits of the bucket, can be called at any time"""
+        self._refill(time.time())
+        self.rate = max(0, rate)
+        self.burst = burst or self.rate
+        self._tokens = min(self._tokens, self.burst)
+
+    @property
+    def limited(self):
+        return self.rate > 0
+
+    @property
+    def current_rate(self):
+        """Throughput measured over the last L{RATE_WINDOW} seconds, in
+        bytes per second"""
+        elapsed = time.time() - self._window_start
+        if elapsed >= 2 * self.RATE_WINDOW:
+            return 0.0
+        return self._current_rate
+
+    def available(self):
+        """Returns the number of bytes that can be sent right now"""
+        if not self.limited:
+            return sys.maxint
+        self._refill(time.time())
+        return max(0, int(self._tokens))
+
+    def consume(self, size):
+        """Takes size tokens from the bucket, the bucket may go in debt
+        when a write could not be shaped"""
+        now = time.time()
+        if self.limited:
+            self._refill(now)
+            self._tokens -= size
+        self.total_bytes += size
+        self._window_bytes += size
+        elapsed = now - self._window_start
+        if elapsed >= self.RATE_WINDOW:
+            self._current_rate = self._window_bytes / elapsed
+            self._window_start = now
+            self._window_bytes = 0
+
+    def delay(self, size):
+        """Returns how long, in seconds, to wait before size bytes (or a
+        full burst) can be sent"""
+        if not self.limited:
+            return 0.0
+        self._refill(time.time())
+        missing = min(size, self.burst) - self._tokens
+        if missing <= 0:
+            return 0.0
+        return float(missing) / self.rate
+
+    def _refill(self, now):
+        if self.limited:
+            self._tokens = min(self.burst,
+                    self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
@@ -19,10 +19,12 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 #
 from papyon.gnet.constants import *
+from papyon.gnet.eventloop import *
 from iochannel import GIOChannelClient
 
 import gobject
 import socket
+from errno import EAGAIN, EWOULDBLOCK, EINTR
 
 
 __all__ = ['SocketClient']
@@ -52,47 +54,45 @@ class SocketClient(GIOChannelClient):
         GIOChannelClient._post_open(self)
         opts = self._transport.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
         if opts == 0:
-            self._watch_set_cond(gobject.IO_IN | gobject.IO_PRI |
-                               gobject.IO_ERR | gobject.IO_HUP)
+            self._watch_set_cond(IO_IN | IO_PRI | IO_ERR | IO_HUP)
             self._status = IoStatus.OPEN
         else:
             self.emit("error", IoError.CONNECTION_FAILED)
             self._status = IoStatus.CLOSED
         return False
 
-    def _io_channel_handler(self, chan, cond):
+    def _read(self, size):
+        try:
+            return self._transport.recv(size)
+        except socket.error, err:
+            if err.args[0] in (EAGAIN, EWOULDBLOCK, EINTR):
+                return None
+            return ""
+
+    def _write(self, data):
+        try:
+            return self._transport.send(data)
+        except socket.error, err:
+            if err.args[0] in (EAGAIN, EWOULDBLOCK, EINTR):
+                return 0
+            self.close()
+            return None
+
+    def _io_channel_handler(self, fd, cond):
         if self._status == IoStatus.CLOSED:
             return False
 
-        if cond & (gobject.IO_IN | gobject.IO_PRI):
-            buf = ""
-            try:
-                buf = self._channel.read(2048)
-            except gobject.GError:
-                pass
-            if buf == "":
-                self.close()
+        if cond & (IO_IN | IO_PRI):
+            if not self._process_incoming_data():
                 return False
-            self.emit("received", buf, len(buf))
 
         # Check for error/EOF
-        if cond & (gobject.IO_ERR | gobject.IO_HUP):
+        if cond & (IO_ERR | IO_HUP):
             self.close()
             return False
 
-        if cond & gobject.IO_OUT:
-            if len(self._outgoing_queue) > 0: # send next item
-                item = self._outgoing_queue[0]
-                item.sent(self._channel.write(item.read()))
-                if item.is_complete(): # sent item
-                    self.emit("sent", item.buffer, item.size)
-                    item.callback()
-                    del self._outgoing_queue[0]
-                    del item
-                if len(self._outgoing_queue) == 0:
-                    self._watch_remove_cond(gobject.IO_OUT)
-            else:
-                self._watch_remove_cond(gobject.IO_OUT)
+        if cond & IO_OUT:
+            return self._process_outgoing_queue()
 
         return True
 gobject.type_register(SocketClient)
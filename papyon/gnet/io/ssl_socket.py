@@ -19,13 +19,101 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 #
 from papyon.gnet.constants import *
+from papyon.gnet.eventloop import *
 from iochannel import GIOChannelClient
 
 import gobject
+import logging
 import socket
 import OpenSSL.SSL as OpenSSL
 
-__all__ = ['SSLSocketClient']
+__all__ = ['SSLSocketClient', 'SSLSessionCache']
+
+logger = logging.getLogger('papyon.gnet.io.ssl')
+
+class SSLSessionCache(object):
+    """Process wide TLS state shared by all the L{SSLSocketClient}s: a
+    single OpenSSL context, and the last session negotiated with each
+    server so that reconnections can use an abbreviated handshake.
+
+    Session resumption requires pyOpenSSL 0.14 or later, older versions
+    only share the context.
+
+        @ivar handshakes: number of completed handshakes
+        @ivar resumption_attempts: number of handshakes that offered a
+            cached session
+        @ivar resumed: number of handshakes that resumed a session"""
+
+    MAX_SESSIONS = 64
+
+    _default = None
+
+    def __init__(self):
+        self._context = None
+        self._sessions = {} # (host, port) => (session, master key)
+        self.handshakes = 0
+        self.resumption_attempts = 0
+        self.resumed = 0
+
+    @staticmethod
+    def default():
+        """Returns the cache shared by the whole process"""
+        if SSLSessionCache._default is None:
+            SSLSessionCache._default = SSLSessionCache()
+        return SSLSessionCache._default
+
+    @property
+    def context(self):
+        if self._context is None:
+            self._context = OpenSSL.Context(OpenSSL.SSLv23_METHOD)
+            if hasattr(self._context, "set_session_cache_mode"):
+                self._context.set_session_cache_mode(
+                        OpenSSL.SESS_CACHE_CLIENT)
+        return self._context
+
+    @property
+    def resumption_rate(self):
+        """Proportion of the handshakes that resumed a session"""
+        if self.handshakes == 0:
+            return 0.0
+        return float(self.resumed) / self.handshakes
+
+    def prepare(self, connection, host, port):
+        """Offers the cached session for host:port, if any, to the given
+        connection before its handshake"""
+        entry = self._sessions.get((host, port), None)
+        if entry is None or not hasattr(connection, "set_session"):
+            return
+        try:
+            connection.set_session(entry[0])
+        except OpenSSL.Error:
+            del self._sessions[(host, port)]
+            return
+        self.resumption_attempts += 1
+
+    def handshake_done(self, connection, host, port):
+        """Records the session negotiated by connection for host:port"""
+        self.handshakes += 1
+        if not hasattr(connection, "get_session"):
+            return
+        session = connection.get_session()
+        if session is None:
+            return
+        master_key = getattr(connection, "master_key", lambda: None)()
+        entry = self._sessions.get((host, port), None)
+        if entry is not None and master_key is not None and \
+                entry[1] == master_key:
+            self.resumed += 1
+        elif len(self._sessions) >= self.MAX_SESSIONS:
+            self._sessions.popitem()
+        self._sessions[(host, port)] = (session, master_key)
+        logger.debug("TLS handshake with %s:%d, resumption rate %.2f" % \
+                (host, port, self.resumption_rate))
+
+    def forget(self, host, port):
+        """Drops the session of host:port, after a failed handshake"""
+        self._sessions.pop((host, port), None)
+
 
 class SSLSocketClient(GIOChannelClient):
     """Asynchronous Socket client class.
@@ -37,6 +125,7 @@ class SSLSocketClient(GIOChannelClient):
 
     def __init__(self, host, port, domain=AF_INET, type=SOCK_STREAM):
         GIOChannelClient.__init__(self, host, port, domain, type)
+        self._pending_source = None
 
     def _pre_open(self, sock=None):
         if sock is None:
@@ -45,21 +134,64 @@ class SSLSocketClient(GIOChannelClient):
                 sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
             except AttributeError:
                 pass
-        context = OpenSSL.Context(OpenSSL.SSLv23_METHOD)
-        ssl_sock = OpenSSL.Connection(context, sock)
+        session_cache = SSLSessionCache.default()
+        ssl_sock = OpenSSL.Connection(session_cache.context, sock)
+        session_cache.prepare(ssl_sock, self._host, self._port)
+        if hasattr(ssl_sock, "set_tlsext_host_name"):
+            ssl_sock.set_tlsext_host_name(self._host)
         GIOChannelClient._pre_open(self, ssl_sock)
 
     def _post_open(self):
         GIOChannelClient._post_open(self)
         if self._transport.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
-            self._watch_set_cond(gobject.IO_IN | gobject.IO_PRI | gobject.IO_OUT |
-                               gobject.IO_ERR | gobject.IO_HUP)
+            self._watch_set_cond(IO_IN | IO_PRI | IO_OUT | IO_ERR | IO_HUP)
         else:
             self.emit("error", IoError.CONNECTION_FAILED)
             self._status = IoStatus.CLOSED
         return False
 
-    def _io_channel_handler(self, chan, cond):
+    def _read(self, size):
+        try:
+            return self._transport.recv(size)
+        except (OpenSSL.WantX509LookupError,
+                OpenSSL.WantReadError, OpenSSL.WantWriteError):
+            return None
+        except (OpenSSL.ZeroReturnError, OpenSSL.SysCallError):
+            return ""
+
+    def _write(self, data):
+        try:
+            return self._transport.send(data)
+        except (OpenSSL.WantX509LookupError,
+                OpenSSL.WantReadError, OpenSSL.WantWriteError):
+            return 0
+        except (OpenSSL.ZeroReturnError, OpenSSL.SysCallError):
+            self.close()
+            return None
+
+    def _process_incoming_data(self):
+        if not GIOChannelClient._process_incoming_data(self):
+            return False
+        # the reads stop at MAX_READ_PER_WAKEUP: the data already decrypted
+        # and buffered by OpenSSL does not make the socket readable again
+        if self._pending_source is None and self._transport.pending() > 0:
+            self._pending_source = get_event_loop().idle_add(
+                    self._on_pending_data)
+        return True
+
+    def _on_pending_data(self):
+        self._pending_source = None
+        if self._status == IoStatus.OPEN:
+            self._process_incoming_data()
+        return False
+
+    def close(self):
+        if self._pending_source is not None:
+            get_event_loop().source_remove(self._pending_source)
+            self._pending_source = None
+        GIOChannelClient.close(self)
+
+    def _io_channel_handler(self, fd, cond):
         if self._status == IoStatus.CLOSED:
             return False
         if self._status == IoStatus.OPENING:
@@ -69,50 +201,25 @@ class SSLSocketClient(GIOChannelClient):
                     OpenSSL.WantReadError, OpenSSL.WantWriteError):
                 return True
             except (OpenSSL.ZeroReturnError, OpenSSL.SysCallError):
+                SSLSessionCache.default().forget(self._host, self._port)
                 self.emit("error", IoError.SSL_CONNECTION_FAILED)
                 self.close()
                 return False
             else:
+                SSLSessionCache.default().handshake_done(self._transport,
+                        self._host, self._port)
                 self._status = IoStatus.OPEN
         elif self._status == IoStatus.OPEN:
-            if cond & (gobject.IO_IN | gobject.IO_PRI):
-                try:
-                    buf = ""
-                    while True:
-                        buf = self._transport.recv(2048)
-                        self.emit("received", buf, len(buf))
-                except (OpenSSL.WantX509LookupError,
-                        OpenSSL.WantReadError, OpenSSL.WantWriteError):
-                    return True
-                except (OpenSSL.ZeroReturnError, OpenSSL.SysCallError):
-                    self.close()
+            if cond & (IO_IN | IO_PRI):
+                if not self._process_incoming_data():
                     return False
 
-            if cond & (gobject.IO_ERR | gobject.IO_HUP):
+            if cond & (IO_ERR | IO_HUP):
                 self.close()
                 return False
 
-            if cond & gobject.IO_OUT:
-                if len(self._outgoing_queue) > 0: # send next item
-                    item = self._outgoing_queue[0]
-                    try:
-                        ret = self._transport.send(item.read())
-                    except (OpenSSL.WantX509LookupError,
-                            OpenSSL.WantReadError, OpenSSL.WantWriteError):
-                        return True
-                    except (OpenSSL.ZeroReturnError, OpenSSL.SysCallError):
-                        self.close()
-                        return False
-                    item.sent(ret)
-                    if item.is_complete(): # sent item
-                        self.emit("sent", item.buffer, item.size)
-                        item.callback()
-                        del self._outgoing_queue[0]
-                        del item
-                    if len(self._outgoing_queue) == 0:
-                        self._watch_remove_cond(gobject.IO_OUT)
-                else:
-                    self._watch_remove_cond(gobject.IO_OUT)
+            if cond & IO_OUT:
+                return self._process_outgoing_queue()
 
         return True
 
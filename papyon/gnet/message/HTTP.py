@@ -87,6 +87,15 @@ class HTTPMessage(object):
 
 
 class HTTPResponse(HTTPMessage):
+    """HTTP response
+
+        @ivar encoded_size: size of the body as transmitted, before the
+            content-coding is removed
+        @type encoded_size: integer
+
+        @ivar decoded_size: size of the decoded body
+        @type decoded_size: integer
+    """
     def __init__(self, headers=None, body="", status=200, reason="OK", version="1.0"):
         if headers is None:
             headers = {}
@@ -97,17 +106,27 @@ class HTTPResponse(HTTPMessage):
         self.status = status
         self.reason = reason
         self.version = version
+        self.encoded_size = len(body)
+        self.decoded_size = len(body)
 
     def parse(self, chunk):
         start_line, message = chunk.split("\r\n", 1)
-        
-        version, status, reason  = start_line.split(" ", 2)
-        self.status = int(status)
-        self.reason = reason
-        self.version = version.split("/",1)[1]
-
+        self.parse_start_line(start_line)
         HTTPMessage.parse(self, message)
 
+    def parse_start_line(self, start_line):
+        """Parses the status line of the response
+
+            @param start_line: the first line of the response
+            @type start_line: string"""
+        parts = start_line.split(" ", 2)
+        self.status = int(parts[1])
+        if len(parts) > 2:
+            self.reason = parts[2]
+        else:
+            self.reason = ""
+        self.version = parts[0].split("/",1)[1]
+
     def __str__(self):
         message = HTTPMessage.__str__(self)
         start_line = "HTTP/%s %d %s" % (self.version, self.status, self.reason)
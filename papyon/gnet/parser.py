@@ -69,6 +69,10 @@ class DelimiterParser(AbstractParser):
 
     A chunk is defined by a delimiter which is either a string or an integer.
 
+    The received data is appended to a single buffer which is consumed
+    from a moving offset, so that every received byte is copied and
+    scanned only once whatever the size of the chunks.
+
     @since: 0.1"""
 
     def __init__(self, transport):
@@ -80,41 +84,62 @@ class DelimiterParser(AbstractParser):
         self._chunk_delimiter = "\n"
 
     def _reset_state(self):
-        self._recv_cache = ""
+        self._recv_cache = bytearray()
+        self._recv_offset = 0
+        self._scan_offset = 0
 
     def _on_received(self, transport, buf, length):
         self._recv_cache += buf
         self._process_recv_cache()
 
-    def _process_recv_cache(self):
-        if len(self._recv_cache) == 0:
-            return
-        if self._chunk_delimiter is None or self._chunk_delimiter == "":
-            self.emit("received", self._recv_cache)
-            self._recv_cache = ""
-            return
+    def flush(self):
+        """Returns the data that was received but not yet emitted and
+        empties the buffer.
 
-        previous_length = len(self._recv_cache)
-        while len(self._recv_cache) != 0:
-            if isinstance(self._chunk_delimiter, int):
-                available = len(self._recv_cache)
-                required = self._chunk_delimiter
-                if required <= available:
-                    self.emit ("received", self._recv_cache[:required])
-                    self._recv_cache = self._recv_cache[required:]
+            @rtype: string"""
+        data = str(self._recv_cache[self._recv_offset:])
+        self._reset_state()
+        return data
+
+    def _process_recv_cache(self):
+        cache = self._recv_cache
+        # the delimiter may be changed and the state may be reset by the
+        # handlers of the received signal, so nothing is kept across chunks
+        while self._recv_cache is cache:
+            offset = self._recv_offset
+            available = len(cache) - offset
+            if available == 0:
+                break
+            delimiter = self._chunk_delimiter
+            if isinstance(delimiter, int):
+                if delimiter == 0 or delimiter > available:
+                    break
+                end = next = offset + delimiter
+            elif delimiter:
+                end = cache.find(delimiter, max(offset, self._scan_offset))
+                if end == -1:
+                    self._scan_offset = len(cache) - len(delimiter) + 1
+                    break
+                next = end + len(delimiter)
             else:
-                s = self._recv_cache.split(self._chunk_delimiter, 1)
-                if len(s) > 1:
-                    self.emit("received", s[0])
-                    self._recv_cache = s[1]
-                else:
-                    self._recv_cache = s[0]
-            if len(self._recv_cache) == previous_length: # noting got consumed, exit
-                return
-            previous_length = len(self._recv_cache)
+                end = next = len(cache)
+            self._recv_offset = next
+            self._scan_offset = next
+            self.emit("received", str(cache[offset:end]))
+
+        # drop the consumed data once it makes up half of the buffer
+        cache = self._recv_cache
+        if self._recv_offset == len(cache):
+            self._reset_state()
+        elif self._recv_offset > len(cache) / 2:
+            del cache[:self._recv_offset]
+            self._scan_offset -= self._recv_offset
+            self._recv_offset = 0
 
     def _set_chunk_delimiter(self, delimiter):
         self._chunk_delimiter = delimiter
+        # the previous scan was made for another delimiter
+        self._scan_offset = self._recv_offset
     def _get_chunk_delimiter(self):
         return self._chunk_delimiter
     delimiter = property(_get_chunk_delimiter,
@@ -128,11 +153,29 @@ class HTTPParser(AbstractParser):
     """Receiver class that emit received signal when an HTTP response is
     received.
 
+    The body length is given either by the Content-Length header, by the
+    chunked transfer-coding or by the end of the connection.
+
+    By default the body is stored in the emitted response, but a handler
+    of the headers-received signal can call L{stream_body} in order to
+    get the body data as it arrives instead.
+
     @since: 0.1"""
 
+    __gsignals__ = {
+            "headers-received": (gobject.SIGNAL_RUN_FIRST,
+                gobject.TYPE_NONE,
+                (object,))
+            }
+
     CHUNK_START_LINE = 0
     CHUNK_HEADERS = 1
     CHUNK_BODY = 2
+    CHUNK_SIZE = 3
+    CHUNK_DATA = 4
+    CHUNK_TRAILER = 5
+
+    STREAM_CHUNK_SIZE = 16384
 
     def __init__(self, transport):
         self._parser = DelimiterParser(transport)
@@ -142,49 +185,124 @@ class HTTPParser(AbstractParser):
 
     def _reset_state(self):
         self._next_chunk = self.CHUNK_START_LINE
-        self._receive_buffer = ""
-        self._content_length = None
+        self._response = None
+        self._body = []
+        self._body_size = 0
+        self._consumer = None
+        self._remaining = None
         self._parser.delimiter = "\r\n"
 
+    def stream_body(self, consumer):
+        """Deliver the body of the current response to consumer as it is
+        received, the body of the emitted response is then left empty.
+        This must be called from a headers-received signal handler.
+
+            @param consumer: callable receiving the body data
+            @type consumer: callable(string)"""
+        self._consumer = consumer
+
     def _on_status_change(self, transport, param):
         status = transport.get_property("status")
         if status == IoStatus.OPEN:
             self._reset_state()
         elif status == IoStatus.CLOSING:
-            self._receive_buffer += self._parser._recv_cache
+            if self._next_chunk == self.CHUNK_BODY:
+                self._deliver(self._parser.flush())
             self.__emit_result()
 
     def _on_chunk_received(self, parser, chunk):
-        complete = False
         if self._next_chunk == self.CHUNK_START_LINE:
-            self._receive_buffer += chunk + "\r\n"
+            if chunk == "":
+                return # ignore the empty lines between responses
+            self._response = HTTPResponse()
+            self._response.parse_start_line(chunk)
             self._next_chunk = self.CHUNK_HEADERS
         elif self._next_chunk == self.CHUNK_HEADERS:
-            self._receive_buffer += chunk + "\r\n"
             if chunk == "":
-                if self._content_length == 0:
-                    complete = True
-                else:
-                    self._parser.delimiter = self._content_length or 0
-                    self._next_chunk = self.CHUNK_BODY
+                self._on_headers_received()
             else:
                 header, value = chunk.split(":", 1)
-                header, value = header.strip(), value.strip()
-                if header == "Content-Length":
-                    self._content_length = int(value)
+                self._response.add_header(header.strip(), value.strip())
         elif self._next_chunk == self.CHUNK_BODY:
-            self._receive_buffer += chunk
-            if self._content_length is not None:
-                complete = True
-
-        if complete:
+            self._deliver(chunk)
+            if self._remaining is not None:
+                self._remaining -= len(chunk)
+                if self._remaining == 0:
+                    self.__emit_result()
+                else:
+                    self._parser.delimiter = self._read_size()
+        elif self._next_chunk == self.CHUNK_SIZE:
+            if chunk == "":
+                return # end of the previous chunk data
+            self._remaining = int(chunk.split(";", 1)[0].strip(), 16)
+            if self._remaining == 0:
+                self._next_chunk = self.CHUNK_TRAILER
+            else:
+                self._next_chunk = self.CHUNK_DATA
+                self._parser.delimiter = self._read_size()
+        elif self._next_chunk == self.CHUNK_DATA:
+            self._deliver(chunk)
+            self._remaining -= len(chunk)
+            if self._remaining == 0:
+                self._next_chunk = self.CHUNK_SIZE
+                self._parser.delimiter = "\r\n"
+            else:
+                self._parser.delimiter = self._read_size()
+        elif self._next_chunk == self.CHUNK_TRAILER:
+            if chunk == "":
+                self.__emit_result()
+            else:
+                header, value = chunk.split(":", 1)
+                self._response.add_header(header.strip(), value.strip())
+
+    def _on_headers_received(self):
+        response = self._response
+        self.emit("headers-received", response)
+        if self._response is not response:
+            return # the state was reset by a signal handler
+
+        headers = dict([(name.lower(), value) for name, value in \
+                response.headers.items()])
+        transfer_encoding = headers.get("transfer-encoding", "identity")
+        if response.status in (204, 304) or 100 <= response.status < 200:
             self.__emit_result()
+        elif transfer_encoding.lower() != "identity":
+            self._next_chunk = self.CHUNK_SIZE
+        elif "content-length" in headers:
+            self._remaining = int(headers["content-length"])
+            if self._remaining == 0:
+                self.__emit_result()
+            else:
+                self._next_chunk = self.CHUNK_BODY
+                self._parser.delimiter = self._read_size()
+        else: # the body ends with the connection
+            self._next_chunk = self.CHUNK_BODY
+            self._parser.delimiter = None
+
+    def _read_size(self):
+        if self._consumer is None:
+            return self._remaining
+        return min(self._remaining, self.STREAM_CHUNK_SIZE)
+
+    def _deliver(self, data):
+        if data == "":
+            return
+        self._body_size += len(data)
+        if self._consumer is not None:
+            self._consumer(data)
+        else:
+            self._body.append(data)
 
     def __emit_result(self):
-        if self._receive_buffer == "":
+        response = self._response
+        if response is None:
             return
-        response = HTTPResponse()
-        response.parse(self._receive_buffer)
-        self.emit("received", response)
+        if len(self._body) == 1:
+            response.body = self._body[0]
+        else:
+            response.body = "".join(self._body)
+        response.encoded_size = self._body_size
+        response.decoded_size = self._body_size
         self._reset_state()
-
+        self.emit("received", response)
+gobject.type_register(HTTPParser)
@@ -25,10 +25,80 @@ from papyon.gnet.parser import HTTPParser
 
 import gobject
 import base64
+import logging
 import platform
+import zlib
 
 __all__ = ['HTTP']
 
+logger = logging.getLogger('papyon.gnet.protocol.http')
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE')
+
+def _get_header(message, name, default=''):
+    name = name.lower()
+    for header, value in message.headers.items():
+        if header.lower() == name:
+            return value
+    return default
+
+
+class ContentDecoder(object):
+    """Incremental decoder for the gzip and deflate content-codings
+
+        @ivar body: the decoded data, when no consumer is given
+        @ivar encoded_size: number of bytes fed to the decoder
+        @ivar decoded_size: number of bytes produced by the decoder"""
+
+    ENCODINGS = ('gzip', 'x-gzip', 'deflate')
+
+    def __init__(self, encoding, consumer=None):
+        if encoding == 'deflate':
+            self._decompressor = zlib.decompressobj(zlib.MAX_WBITS)
+        else:
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._can_fallback = (encoding == 'deflate')
+        self._consumer = consumer
+        self._received = []
+        self._body = []
+        self.encoded_size = 0
+        self.decoded_size = 0
+
+    @property
+    def body(self):
+        return "".join(self._body)
+
+    def feed(self, data):
+        self.encoded_size += len(data)
+        if self._can_fallback:
+            self._received.append(data)
+        try:
+            decoded = self._decompressor.decompress(data)
+        except zlib.error:
+            if not self._can_fallback:
+                raise
+            # some servers send deflate data without the zlib wrapper
+            self._can_fallback = False
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            decoded = self._decompressor.decompress("".join(self._received))
+        if decoded != "":
+            self._can_fallback = False
+            self._received = []
+        self._output(decoded)
+
+    def flush(self):
+        self._output(self._decompressor.flush())
+
+    def _output(self, decoded):
+        if decoded == "":
+            return
+        self.decoded_size += len(decoded)
+        if self._consumer is not None:
+            self._consumer(decoded)
+        else:
+            self._body.append(decoded)
+
+
 
 class HTTP(gobject.GObject):
     """HTTP protocol client class."""
@@ -65,8 +135,12 @@ class HTTP(gobject.GObject):
         self.__proxy = proxy
         self._transport = None
         self._http_parser = None
-        self._outgoing_queue = []
-        self._waiting_response = False
+        self._outgoing_queue = [] # [(request, idempotent, consumer), ...]
+        self._in_flight = 0 # requests sent and waiting for their response
+        self._pipeline_depth = 1
+        self._decoder = None
+        self._decoding_failed = False
+        self._keep_alive = None # whether the last response kept the connection
 
     def _setup_transport(self):
         if self._transport is None:
@@ -75,26 +149,58 @@ class HTTP(gobject.GObject):
             else:
                 self._transport = TCPClient(self._host, self._port)
             self._http_parser = HTTPParser(self._transport)
+            self._http_parser.connect("headers-received",
+                    self._on_response_headers_received)
             self._http_parser.connect("received", self._on_response_received)
             self._transport.connect("notify::status", self._on_status_change)
             self._transport.connect("error", self._on_error)
-            self._transport.connect("sent", self._on_request_sent)
         
         if self._transport.get_property("status") != IoStatus.OPEN:
             self._transport.open()
 
     def _on_status_change(self, transport, param):
         if transport.get_property("status") == IoStatus.OPEN:
+            self._keep_alive = None
             self._process_queue()
         elif transport.get_property("status") == IoStatus.CLOSED and\
-                (self._waiting_response or len(self._outgoing_queue) > 0):
-            self._waiting_response = False
+                len(self._outgoing_queue) > 0:
+            if self._in_flight > 0 and self._pipeline_depth > 1 and \
+                    self._keep_alive is not False:
+                # the connection dropped in the middle of a pipeline while
+                # the server did not announce it, it may not support it
+                logger.info("Pipeline to %s:%d broken, disabling it" % \
+                        (self._host, self._port))
+                self._pipeline_depth = 1
+            # the unanswered requests are sent again on a new connection
+            self._in_flight = 0
             self._setup_transport()
 
-    def _on_request_sent(self, transport, request, length):
-        assert(str(self._outgoing_queue[0]) == request)
-        self._waiting_response = True
-        self.emit("request-sent", self._outgoing_queue[0])
+    def _on_request_sent(self, request):
+        self.emit("request-sent", request)
+
+    def _on_response_headers_received(self, parser, response):
+        if self._in_flight == 0 or \
+                (response.status >= 100 and response.status < 200):
+            return
+        consumer = self._outgoing_queue[0][2]
+        encoding = _get_header(response, 'Content-Encoding').strip().lower()
+        self._decoding_failed = False
+        if encoding in ContentDecoder.ENCODINGS:
+            self._decoder = ContentDecoder(encoding, consumer)
+            parser.stream_body(self._decode)
+        elif consumer is not None:
+            parser.stream_body(consumer)
+
+    def _decode(self, data):
+        if self._decoder is None:
+            return
+        try:
+            self._decoder.feed(data)
+        except zlib.error, err:
+            logger.warning("Unable to decode the response from %s:%d (%s)" % \
+                    (self._host, self._port, err))
+            self._decoder = None
+            self._decoding_failed = True
 
     def _on_response_received(self, parser, response):
         if response.status >= 100 and response.status < 200:
@@ -114,29 +220,107 @@ class HTTP(gobject.GObject):
         #        self._outgoing_queue[0].headers['Host'] = response.headers['Location']
         #        self._setup_transport()
         #        return
+        if self._in_flight == 0:
+            logger.warning("Unexpected response from %s:%d" % \
+                    (self._host, self._port))
+            return
         self._outgoing_queue.pop(0) # pop the request from the queue
-        self.emit("response-received", response)
-        self._waiting_response = False
+        self._in_flight -= 1
+        decoder, self._decoder = self._decoder, None
+        failed, self._decoding_failed = self._decoding_failed, False
+        if decoder is not None:
+            try:
+                decoder.flush()
+            except zlib.error, err:
+                logger.warning("Truncated response from %s:%d (%s)" % \
+                        (self._host, self._port, err))
+                failed = True
+            response.body = decoder.body
+            response.decoded_size = decoder.decoded_size
+        self._keep_alive = self._is_keep_alive(response)
+        if not self._keep_alive:
+            self._transport.close()
+        if failed:
+            # the body is incomplete, the request fails instead
+            self.emit("error", IoError.CONTENT_DECODING_FAILED)
+        else:
+            self.emit("response-received", response)
         self._process_queue() # next request ?
 
+    def _is_keep_alive(self, response):
+        connection = _get_header(response, 'Connection',
+                _get_header(response, 'Proxy-Connection')).lower()
+        if response.version == "1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
     def _on_error(self, transport, error):
         self.emit("error", error)
 
     def _process_queue(self):
-        if len(self._outgoing_queue) == 0 or \
-                self._waiting_response: # no pipelining
+        if len(self._outgoing_queue) <= self._in_flight:
             return
         if self._transport is None or \
                 self._transport.get_property("status") != IoStatus.OPEN:
             self._setup_transport()
             return
-        self._transport.send(str(self._outgoing_queue[0]))
+        while self._in_flight < len(self._outgoing_queue):
+            request, idempotent, consumer = \
+                    self._outgoing_queue[self._in_flight]
+            # only idempotent requests may follow each other, so that they
+            # can safely be sent again if the connection drops
+            if self._in_flight > 0 and (self._in_flight >= \
+                    self._pipeline_depth or not idempotent or \
+                    not self._outgoing_queue[self._in_flight - 1][1]):
+                break
+            self._in_flight += 1
+            self._transport.send(str(request), self._on_request_sent, request)
+
+    def is_reusable(self):
+        """Whether the connection is open and has no request in progress,
+        in which case it can be used for another request without going
+        through a new connection establishment"""
+        return self._transport is not None and \
+                self._transport.get_property("status") == IoStatus.OPEN and \
+                len(self._outgoing_queue) == 0
+
+    def close(self):
+        """Closes the connection, dropping the pending requests"""
+        self._outgoing_queue = []
+        self._in_flight = 0
+        if self._transport is not None:
+            self._transport.close()
+
+    def _get_pipeline_depth(self):
+        return self._pipeline_depth
+    def _set_pipeline_depth(self, depth):
+        self._pipeline_depth = max(1, depth)
+        self._process_queue()
+    pipeline_depth = property(_get_pipeline_depth, _set_pipeline_depth,
+        doc="""Maximum number of idempotent requests sent without waiting
+        for their response, 1 disables pipelining""")
+
+    def request(self, resource='/', headers=None, data='', method='GET',
+            idempotent=None, consumer=None):
+        """Queues a request.
+
+            @param idempotent: whether the request can safely be sent twice,
+                only idempotent requests are pipelined. When None, the
+                request method decides.
+            @type idempotent: boolean
 
-    def request(self, resource='/', headers=None, data='', method='GET'):
+            @param consumer: when set, the response body is given to this
+                callable as it is received instead of being stored in the
+                response emitted with the response-received signal
+            @type consumer: callable(string)"""
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
         if headers is None:
             headers = {}
         headers['Host'] = self._host + ':' + str(self._port)
         headers['Content-Length'] = str(len(data))
+        if 'Accept-Encoding' not in headers:
+            headers['Accept-Encoding'] = 'gzip, deflate'
         if 'User-Agent' not in headers:
             user_agent = GNet.NAME, GNet.VERSION, platform.system(), platform.machine()
             headers['User-Agent'] = "%s/%s (%s %s)" % user_agent
@@ -149,6 +333,6 @@ class HTTP(gobject.GObject):
                 headers['Proxy-Authorization'] = 'Basic ' + credentials
         else:
             url = resource
-        request  = HTTPRequest(headers, data, method, url)
-        self._outgoing_queue.append(request)
+        request  = HTTPRequest(headers, data, method, url, "1.1")
+        self._outgoing_queue.append((request, idempotent, consumer))
         self._process_queue()
@@ -51,10 +51,11 @@ class HTTPS(HTTP):
             else:
                 self._transport = transport
             self._http_parser = HTTPParser(self._transport)
+            self._http_parser.connect("headers-received",
+                    self._on_response_headers_received)
             self._http_parser.connect("received", self._on_response_received)
             self._transport.connect("notify::status", self._on_status_change)
             self._transport.connect("error", self._on_error)
-            self._transport.connect("sent", self._on_request_sent)
         
         if self._transport.get_property("status") != IoStatus.OPEN:
             self._transport.open()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+
+"""Process wide pool of persistent HTTP connections.
+
+Connections are keyed by (scheme, host, port, proxy), once a user is done
+with a connection it gives it back to the pool which keeps it open for
+L{HTTPConnectionPool.IDLE_TIMEOUT} seconds so that the next request to the
+same server does not have to go through the TCP and TLS handshakes
+again."""
+
+from papyon.gnet.constants import *
+from papyon.gnet.eventloop import get_event_loop
+from HTTP import HTTP
+from HTTPS import HTTPS
+
+import logging
+
+__all__ = ['HTTPConnectionPool']
+
+logger = logging.getLogger('papyon.gnet.protocol.pool')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+class HTTPConnectionPool(object):
+    """Pool of L{HTTP} connections
+
+    The pool does not limit the number of connections in use: a new
+    connection is created whenever no idle one is available.
+
+        @cvar IDLE_TIMEOUT: seconds an unused connection is kept open
+        @cvar MAX_IDLE_CONNECTIONS_PER_HOST: maximum number of idle
+            connections kept open to the same server, connections released
+            past this limit are closed"""
+
+    IDLE_TIMEOUT = 60
+    MAX_IDLE_CONNECTIONS_PER_HOST = 4
+
+    _default = None
+
+    def __init__(self):
+        self._idle = {}         # key => [(connection, timeout_id), ...]
+        self._connections = {}  # connection => key
+
+    @staticmethod
+    def default():
+        """Returns the pool shared by the whole process"""
+        if HTTPConnectionPool._default is None:
+            HTTPConnectionPool._default = HTTPConnectionPool()
+        return HTTPConnectionPool._default
+
+    def acquire(self, scheme, host, port=None, proxy=None):
+        """Returns a connection to the given server, either an idle one
+        or a newly created one.
+
+            @param scheme: 'http' or 'https'
+            @param host: the host to connect to
+            @param port: the port to connect to, None for the default one
+            @param proxy: proxy that we can use to connect
+            @type proxy: L{gnet.proxy.ProxyInfos}
+
+            @rtype: L{HTTP}"""
+        if port is None:
+            port = DEFAULT_PORTS[scheme]
+        key = self._key(scheme, host, port, proxy)
+
+        idle = self._idle.get(key, [])
+        while len(idle) > 0:
+            connection, timeout_id = idle.pop()
+            get_event_loop().source_remove(timeout_id)
+            if connection.is_reusable():
+                logger.debug("Reusing connection to %s:%d" % (host, port))
+                return connection
+            self._discard(connection)
+
+        if scheme == 'https':
+            connection = HTTPS(host, port, proxy=proxy)
+        else:
+            connection = HTTP(host, port, proxy=proxy)
+        self._connections[connection] = key
+        return connection
+
+    def release(self, connection):
+        """Gives a connection back to the pool, it must not be used
+        anymore by the caller.
+
+            @type connection: L{HTTP}"""
+        key = self._connections.get(connection, None)
+        idle = self._idle.get(key, [])
+        if key is None or not connection.is_reusable() or \
+                len(idle) >= self.MAX_IDLE_CONNECTIONS_PER_HOST:
+            self._discard(connection)
+            return
+        timeout_id = get_event_loop().timeout_add(self.IDLE_TIMEOUT * 1000,
+                self._on_idle_timeout, connection)
+        self._idle[key] = idle
+        idle.append((connection, timeout_id))
+
+    def clear(self):
+        """Closes all the idle connections"""
+        for idle in self._idle.values():
+            for connection, timeout_id in idle:
+                get_event_loop().source_remove(timeout_id)
+                self._discard(connection)
+        self._idle.clear()
+
+    def _key(self, scheme, host, port, proxy):
+        if proxy is None:
+            return (scheme, host, port, None)
+        return (scheme, host, port, (proxy.type, proxy.host, proxy.port,
+            proxy.user))
+
+    def _discard(self, connection):
+        self._connections.pop(connection, None)
+        connection.close()
+
+    def _on_idle_timeout(self, connection):
+        key = self._connections.get(connection, None)
+        idle = self._idle.get(key, [])
+        for i, (idle_connection, timeout_id) in enumerate(idle):
+            if idle_connection is connection:
+                del idle[i]
+                break
+        if len(idle) == 0 and key in self._idle:
+            del self._idle[key]
+        self._discard(connection)
+        return False
@@ -74,8 +74,8 @@ class HTTPConnectProxy(AbstractProxy):
         """Close the connection."""
         self._client._proxy_closed()
 
-    def send(self, buffer, callback=None, *args):
-        self._client.send(buffer, callback, *args)
+    def send(self, buffer, callback=None, *args, **kwargs):
+        self._client.send(buffer, callback, *args, **kwargs)
 
     # callbacks and signal handlers
     def _on_transport_status(self, transport, param):
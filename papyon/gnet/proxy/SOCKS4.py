@@ -89,8 +89,8 @@ class SOCKS4Proxy(AbstractProxy):
         """Close the connection."""
         self._client._proxy_closed()
 
-    def send(self, buffer, callback=None, *args):
-        self._client.send(buffer, callback, *args)
+    def send(self, buffer, callback=None, *args, **kwargs):
+        self._client.send(buffer, callback, *args, **kwargs)
 
     # Callbacks
     def _on_transport_status(self, transport, param):
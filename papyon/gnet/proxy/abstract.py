@@ -30,6 +30,8 @@ class AbstractProxy(AbstractClient):
         self._proxy = proxy_infos
         self._client.connect("sent", self._on_client_sent)
         self._client.connect("received", self._on_client_received)
+        self._client.connect("congested", self._on_client_congested)
+        self._client.connect("writable", self._on_client_writable)
         self._client.connect("notify::status", self._on_client_status)
         AbstractClient.__init__(self, self._proxy.host, self._proxy.port)
 
@@ -45,4 +47,18 @@ class AbstractProxy(AbstractClient):
 
     def _on_client_received(self, client, data, length):
         self.emit("received", data, length)
+
+    def _on_client_congested(self, client):
+        self.emit("congested")
+
+    def _on_client_writable(self, client):
+        self.emit("writable")
+
+    @property
+    def queued_bytes(self):
+        return self._client.queued_bytes
+
+    @property
+    def congested(self):
+        return self._client.congested
 gobject.type_register(AbstractProxy)
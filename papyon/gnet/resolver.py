@@ -17,15 +17,37 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 #
 
-"""GNet dns resolver"""
+"""GNet dns resolver
+
+Hostname resolution is done by a small pool of worker threads so that a
+slow DNS server never blocks the glib main loop, the answers are then
+delivered back to the main loop through an idle callback.
+
+All the L{HostnameResolver} instances share the same cache, successful
+answers are kept for L{HostnameResolver.POSITIVE_TTL} seconds and failures
+for L{HostnameResolver.NEGATIVE_TTL} seconds. Since getaddrinfo() does not
+expose the record TTL, these values act as the TTL of every answer."""
 
 import socket
+import threading
+import time
+import Queue
 
 import gobject
 
 from papyon.util.decorator import async
+from papyon.gnet.eventloop import get_event_loop
+
+__all__ = ['HostnameResolver', 'WELL_KNOWN_HOSTS']
 
-__all__ = ['HostnameResolver']
+WELL_KNOWN_HOSTS = ('messenger.hotmail.com',
+                    'login.live.com',
+                    'contacts.msn.com',
+                    'storage.msn.com',
+                    'rsi.hotmail.com',
+                    'ows.messenger.msn.com')
+"""Hostnames used by papyon during a login, suitable for
+L{HostnameResolver.prefetch}"""
 
 class HostnameResponse(object):
     def __init__(self, response):
@@ -50,23 +72,166 @@ class HostnameResponse(object):
     def __repr__(self):
         return repr(self._response)
 
+
+class _ResolverCache(object):
+    """Hostname => response cache, entries are dropped once their expiry
+    time is reached"""
+
+    def __init__(self):
+        self._entries = {}
+
+    def lookup(self, host):
+        response = self._entries.get(host, None)
+        if response is None:
+            return None
+        if response[2] <= time.time():
+            del self._entries[host]
+            return None
+        return response
+
+    def store(self, host, response):
+        self._entries[host] = response
+
+    def invalidate(self, host=None):
+        if host is None:
+            self._entries.clear()
+        elif host in self._entries:
+            del self._entries[host]
+
+
+class _ResolverPool(object):
+    """Runs the blocking getaddrinfo() calls in worker threads, only one
+    lookup per hostname is in flight at any given time."""
+
+    def __init__(self, max_workers):
+        self._max_workers = max_workers
+        self._workers = []
+        self._requests = Queue.Queue()
+        self._pending = {}
+
+    def submit(self, host, callback):
+        """Queue a lookup for host, callback is run in the main loop
+        with the response tuple, the method returns False if the lookup
+        was merged with an already running one"""
+        if host in self._pending:
+            self._pending[host].append(callback)
+            return False
+        self._pending[host] = [callback]
+        self._requests.put(host)
+        if len(self._workers) < min(self._max_workers, len(self._pending)):
+            self._spawn_worker()
+        return True
+
+    def _spawn_worker(self):
+        if len(self._workers) == 0:
+            get_event_loop().threads_init()
+        worker = threading.Thread(target=self._worker_loop,
+                name="gnet-resolver-%d" % len(self._workers))
+        worker.setDaemon(True)
+        self._workers.append(worker)
+        worker.start()
+
+    def _worker_loop(self):
+        while True:
+            host = self._requests.get()
+            try:
+                result = socket.getaddrinfo(host, None,
+                        socket.AF_INET, socket.SOCK_STREAM)
+            except (socket.gaierror, socket.herror, UnicodeError):
+                result = []
+            get_event_loop().idle_add(self._lookup_done, host, result)
+
+    def _lookup_done(self, host, result):
+        callbacks = self._pending.pop(host, [])
+        for callback in callbacks:
+            callback(result)
+        return False
+
+
 class HostnameResolver(object):
+    """Asynchronous hostname resolver.
+
+    The answer is given to the callback in the form of a L{HostnameResponse},
+    the callback is always invoked from the main loop, never from within
+    L{query} itself."""
+
+    POSITIVE_TTL = 300
+    NEGATIVE_TTL = 30
+    MAX_WORKERS = 4
+
+    _cache = _ResolverCache()
+    _pool = None
+
     def __init__(self):
         self._queries = {}
 
     def query(self, host, callback):
-        result = socket.getaddrinfo(host, None, socket.AF_INET, socket.SOCK_STREAM)
-        if len(result) == 0:
-            status = 1
-            cname = ''
-            expires = 0
-            addresses = ()
-        else:
-            status = 0
-            cname = result[0][3]
-            expires = 0
-            addresses = ((socket.AF_INET, result[0][4][0]),)
-        self._emit_response(callback, (status, cname, expires, addresses))
+        """Resolve host.
+
+            @param host: the hostname to resolve
+            @type host: string
+
+            @param callback: the callback to run once the hostname is
+                resolved, followed by its extra arguments
+            @type callback: tuple(callable, *args)"""
+        if self._is_address(host):
+            response = (0, host, time.time() + self.POSITIVE_TTL,
+                    ((socket.AF_INET, host),))
+            self._emit_response(callback, response)
+            return
+
+        response = HostnameResolver._cache.lookup(host)
+        if response is not None:
+            self._emit_response(callback, response)
+            return
+
+        self._get_pool().submit(host,
+                lambda result: self._on_lookup_done(host, result, callback))
+
+    def prefetch(self, hosts=WELL_KNOWN_HOSTS):
+        """Warm up the cache with the given hostnames, this is meant to
+        be called at startup so that the first connections don't wait for
+        the DNS.
+
+            @param hosts: the hostnames to resolve
+            @type hosts: sequence of strings"""
+        for host in hosts:
+            if self._is_address(host) or \
+                    HostnameResolver._cache.lookup(host) is not None:
+                continue
+            self._get_pool().submit(host,
+                    lambda result, host=host: self._on_lookup_done(host, result))
+
+    @staticmethod
+    def invalidate(host=None):
+        """Drop the cached answer for host, or the whole cache if host is
+        None"""
+        HostnameResolver._cache.invalidate(host)
+
+    @classmethod
+    def _get_pool(cls):
+        if HostnameResolver._pool is None:
+            HostnameResolver._pool = _ResolverPool(cls.MAX_WORKERS)
+        return HostnameResolver._pool
+
+    def _is_address(self, host):
+        try:
+            return socket.inet_aton(host) is not None and \
+                    host.count('.') == 3
+        except (socket.error, TypeError):
+            return False
+
+    def _on_lookup_done(self, host, result, callback=None):
+        response = HostnameResolver._cache.lookup(host)
+        if response is None:
+            if len(result) == 0:
+                response = (1, '', time.time() + self.NEGATIVE_TTL, ())
+            else:
+                response = (0, result[0][3], time.time() + self.POSITIVE_TTL,
+                        ((socket.AF_INET, result[0][4][0]),))
+            HostnameResolver._cache.store(host, response)
+        if callback is not None:
+            callback[0](HostnameResponse(response), *callback[1:])
 
     @async
     def _emit_response(self, callback, response):
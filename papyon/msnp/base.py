@@ -75,9 +75,9 @@ class BaseProtocol(object):
         self._proxies = proxies
 
     def _send_command(self, command, arguments=(), payload=None, 
-            increment=True, callback=None, *cb_args):
+            increment=True, callback=None, *cb_args, **kwargs):
         command = self._transport.send_command_ex(command, arguments, payload, 
-                                                increment, callback, *cb_args)
+                                increment, callback, *cb_args, **kwargs)
         return command.transaction_id
    
     # default handlers
@@ -101,12 +101,26 @@ class BaseProtocol(object):
     # callbacks
     def _dispatch_command(self, connection, command):
         if not command.is_error():
-            handler = getattr(self,
-                    '_handle_' + command.name,
-                    self._default_handler)
-            handler(command)
+            handler = self._dispatch_table().get(command.name, None)
+            if handler is None:
+                self._default_handler(command)
+            else:
+                handler(self, command)
         else:
             self._error_handler(command)
+
+    @classmethod
+    def _dispatch_table(cls):
+        """Returns the mapping from command names to the _handle_* methods
+        of the class, built on first use"""
+        table = cls.__dict__.get('_handlers', None)
+        if table is None:
+            table = {}
+            for attr in dir(cls):
+                if attr.startswith('_handle_'):
+                    table[attr[8:]] = getattr(cls, attr).im_func
+            cls._handlers = table
+        return table
    
     def _connect_cb(self, transport):
         pass
@@ -120,23 +120,30 @@ class Command(object):
         @ivar payload: the payload of the command
         @type payload: string or None"""
 
-    OUTGOING_NO_TRID = ('OUT', 'PNG')
-    INCOMING_NO_TRID = (
+    __slots__ = ('name', 'transaction_id', 'arguments', 'payload')
+
+    OUTGOING_NO_TRID = frozenset(('OUT', 'PNG'))
+    INCOMING_NO_TRID = frozenset((
             # NS commands
             'QNG', 'IPG', 'NOT', 'NLN', 'FLN', 'GCF',
             'QRY', 'SBS', 'UBN', 'UBM', 'UBX',
             # SW commands
-            'RNG', 'JOI', 'BYE', 'MSG')
+            'RNG', 'JOI', 'BYE', 'MSG'))
 
-    OUTGOING_PAYLOAD = (
+    OUTGOING_PAYLOAD = frozenset((
             'QRY', 'SDC', 'PGD', 'ADL', 'RML', 'UUN',
-            'UUM', 'UUX', 'MSG', 'FQY')
+            'UUM', 'UUX', 'MSG', 'FQY'))
 
-    INCOMING_PAYLOAD = (
+    INCOMING_PAYLOAD = frozenset((
             'GCF', 'MSG', 'UBN', 'UBM', 'UBX', 'IPG',
             'NOT', 'ADL', 'RML', 'FQY',
 
-            '241', '509')
+            '241', '509'))
+
+    _NO_TRID = INCOMING_NO_TRID | OUTGOING_NO_TRID
+
+    # every error code is a 3 digits number
+    _ERROR_CODES = frozenset(["%03d" % code for code in xrange(1000)])
 
     def __init__(self):
         self._reset()
@@ -174,11 +181,13 @@ class Command(object):
 
             @param buf: the data to parse
             @type buf: string"""
-        self._reset()
-        lines = buf.split('\r\n', 1)
-        self.__parse_command(lines[0])
-        if len(lines) > 1: # payload
-            self.payload = lines[1]
+        end = buf.find('\r\n')
+        if end < 0:
+            self.__parse_command(buf)
+            self.payload = None
+        else:
+            self.__parse_command(buf[:end])
+            self.payload = buf[end + 2:]
             # remove the last argument as it is the data length
             self.arguments = self.arguments[:-1]
 
@@ -186,12 +195,7 @@ class Command(object):
         """Tells if the current command is an error code
 
             @rtype: bool"""
-        try:
-            int(self.name)
-        except ValueError:
-            return False
-        else:
-            return True
+        return self.name in self._ERROR_CODES
 
     def is_payload(self):
         """Tells if the current comment is a payload command
@@ -201,33 +205,30 @@ class Command(object):
 
     ### private and special methods
     def __str__(self):
-        result = self.name[:]
+        parts = [self.name]
         if self.transaction_id is not None:
-            result += ' ' + str(self.transaction_id)
+            parts.append(str(self.transaction_id))
 
-        if self.arguments is not None and len(self.arguments) > 0:
-            arguments = [str(arg) for arg in self.arguments]
-            result += ' ' + ' '.join(arguments)
+        if self.arguments:
+            parts.extend([str(arg) for arg in self.arguments])
 
         if self.payload is not None:
             payload = str(self.payload)
-            length = len(payload)
-            if length > 0:
-                result += ' ' + str(length) + '\r\n' + payload
-                return result
+            if len(payload) > 0:
+                parts.append(str(len(payload)))
+                return ' '.join(parts) + '\r\n' + payload
 
-        return result + '\r\n'
+        return ' '.join(parts) + '\r\n'
 
     def __unicode__(self):
         return unicode(CommandPrinter(self))
 
     def __parse_command(self, buf):
         words = buf.split()
-        self.name, pos = words[0], 1
-        if (words[0] not in self.INCOMING_NO_TRID) and\
-                (words[0] not in self.OUTGOING_NO_TRID) and\
-                len(words) > pos:
-            self.transaction_id = int(words[pos])
-            pos += 1
-        if len(words) > pos:
-            self.arguments = words[pos:]
+        self.name = name = words[0]
+        if name not in self._NO_TRID and len(words) > 1:
+            self.transaction_id = int(words[1])
+            self.arguments = words[2:] or None
+        else:
+            self.transaction_id = None
+            self.arguments = words[1:] or None
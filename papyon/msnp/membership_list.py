@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Payloads of the ADL and RML commands."""
+
+from papyon.profile import Membership, NetworkID
+
+__all__ = ['MembershipListBuilder']
+
+class MembershipListBuilder(object):
+    """Builds the <ml> payloads of the ADL and RML commands for many
+    contacts at once.
+
+    The contacts are grouped by domain, the memberships of a contact added
+    several times are merged, and the payloads are filled up to
+    L{MAX_PAYLOAD_SIZE} so that as few commands as possible are sent.
+
+        >>> builder = MembershipListBuilder()
+        >>> builder.add("foo@hotmail.com", NetworkID.MSN, Membership.ALLOW)
+        >>> list(builder.payloads())
+        ['<ml><d n="hotmail.com"><c n="foo" l="2" t="1"/></d></ml>']"""
+
+    MAX_PAYLOAD_SIZE = 7500
+
+    def __init__(self, initial=False, max_size=MAX_PAYLOAD_SIZE):
+        """Initializer
+
+            @param initial: whether the payloads are the ones of the initial
+                ADL, sent once the address book is synchronized
+            @type initial: bool
+
+            @param max_size: the payloads are kept under that size
+            @type max_size: integer"""
+        self._initial = initial
+        self._header = initial and '<ml l="1">' or '<ml>'
+        self._max_size = max_size
+        self._domains = {} # domain => {(user, network_id): memberships}
+        self._phones = {} # phone number => memberships
+
+    def __len__(self):
+        count = len(self._phones)
+        for contacts in self._domains.itervalues():
+            count += len(contacts)
+        return count
+
+    def add(self, account, network_id, membership):
+        """Adds a contact to the payloads, contacts without any membership
+        are ignored
+
+            @param account: the contact account, or its phone number for
+                mobile contacts
+            @type account: string
+
+            @param network_id: the contact network
+            @type network_id: L{NetworkID<papyon.profile.NetworkID>}
+
+            @param membership: the lists
+            @type membership: L{Membership<papyon.profile.Membership>}"""
+        if membership == Membership.NONE:
+            return
+        if network_id == NetworkID.MOBILE:
+            self._phones[account] = self._phones.get(account, 0) | membership
+            return
+        user, domain = account.split("@", 1)
+        contacts = self._domains.get(domain, None)
+        if contacts is None:
+            contacts = self._domains[domain] = {}
+        key = (user, network_id)
+        contacts[key] = contacts.get(key, 0) | membership
+
+    def payloads(self):
+        """Iterates over the payloads, the initial list always has at least
+        one payload, even empty, as the server needs it to complete the
+        login
+
+            @rtype: iterator over strings"""
+        sections = []
+        for domain, contacts in self._domains.iteritems():
+            nodes = ['<c n="%s" l="%d" t="%d"/>' % (user, lists, network_id)
+                    for (user, network_id), lists in contacts.iteritems()]
+            sections.append(('<d n="%s">' % domain, '</d>', nodes))
+        if self._phones:
+            nodes = ['<c n="tel:%s" l="%d"/>' % (number, lists)
+                    for number, lists in self._phones.iteritems()]
+            sections.append(('<t>', '</t>', nodes))
+
+        header, footer = self._header, '</ml>'
+        parts, size = [header], len(header)
+        empty = True
+        for opening, closing, nodes in sections:
+            opened = False
+            for node in nodes:
+                needed = len(node) + len(closing) + len(footer)
+                if not opened:
+                    needed += len(opening)
+                if size + needed >= self._max_size and len(parts) > 1:
+                    if opened:
+                        parts.append(closing)
+                    parts.append(footer)
+                    yield "".join(parts)
+                    parts, size = [header], len(header)
+                    empty = False
+                    opened = False
+                if not opened:
+                    parts.append(opening)
+                    size += len(opening)
+                    opened = True
+                parts.append(node)
+                size += len(node)
+            if opened:
+                parts.append(closing)
+                size += len(closing)
+
+        if len(parts) > 1 or (empty and self._initial):
+            parts.append(footer)
+            yield "".join(parts)
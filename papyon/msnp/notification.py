@@ -27,6 +27,7 @@ from base import BaseProtocol, ProtocolState
 from message import Message
 from constants import ProtocolConstant
 from challenge import _msn_challenge
+from membership_list import MembershipListBuilder
 
 import papyon
 from papyon.gnet.message.HTTP import HTTPMessage
@@ -72,6 +73,10 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
                 gobject.TYPE_NONE,
                 ()),
 
+            "disconnected-by-server" : (gobject.SIGNAL_RUN_FIRST,
+                gobject.TYPE_NONE,
+                ()),
+
             "buddy-notification-received" : (gobject.SIGNAL_RUN_FIRST,
                 gobject.TYPE_NONE,
                 (object, object,)),
@@ -113,6 +118,7 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
         BaseProtocol.__init__(self, client, transport, proxies)
         gobject.GObject.__init__(self)
         self.__state = ProtocolState.CLOSED
+        self.__address_book = None
         self._protocol_version = version
         self._url_callbacks = {} # tr_id=>callback
 
@@ -233,16 +239,7 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
             @param membership: the list to be added to
             @type membership: integer
             @see L{papyon.profile.Membership}"""
-
-        if network_id == profile.NetworkID.MOBILE:
-            payload = '<ml><t><c n="tel:%s" l="%d" /></t></ml>' % \
-                    (account, membership)
-            self._send_command("ADL", payload=payload)
-        else:
-            user, domain = account.split("@", 1)
-            payload = '<ml><d n="%s"><c n="%s" l="%d" t="%d"/></d></ml>' % \
-                    (domain, user, membership, network_id)
-            self._send_command("ADL", payload=payload)
+        self.add_contacts_to_membership([(account, network_id, membership)])
 
     def remove_contact_from_membership(self, account,
             network_id=profile.NetworkID.MSN,
@@ -259,16 +256,31 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
             @param membership: the list to be added to
             @type membership: integer
             @see L{papyon.profile.Membership}"""
+        self.remove_contacts_from_membership(
+                [(account, network_id, membership)])
 
-        if network_id == profile.NetworkID.MOBILE:
-            payload = '<ml><t><c n="tel:%s" l="%d" /></t></ml>' % \
-                    (account, membership)
-            self._send_command("RML", payload=payload)
-        else:
-            user, domain = account.split("@", 1)
-            payload = '<ml><d n="%s"><c n="%s" l="%d" t="%d"/></d></ml>' % \
-                    (domain, user, membership, network_id)
-            self._send_command("RML", payload=payload)
+    def add_contacts_to_membership(self, contacts):
+        """Add many contacts to memberships, using as few ADL commands as
+        possible.
+
+            @param contacts: the contacts to add
+            @type contacts: iterable of (account, network_id, membership)"""
+        self.__send_membership_list("ADL", contacts)
+
+    def remove_contacts_from_membership(self, contacts):
+        """Remove many contacts from memberships, using as few RML commands
+        as possible.
+
+            @param contacts: the contacts to remove
+            @type contacts: iterable of (account, network_id, membership)"""
+        self.__send_membership_list("RML", contacts)
+
+    def __send_membership_list(self, command, contacts):
+        builder = MembershipListBuilder()
+        for account, network_id, membership in contacts:
+            builder.add(account, network_id, membership)
+        for payload in builder.payloads():
+            self._send_command(command, payload=payload)
 
     def send_user_notification(self, message, contact, type):
         self._send_command("UUN", (contact.account, type), message)
@@ -354,6 +366,9 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
                     (lambda *args: self.emit("authentication-failed"),),
                     SSO.LiveService.MESSENGER_CLEAR)
 
+                if self._client.address_book is self.__address_book:
+                    return # reconnection, the handlers are already set
+                self.__address_book = self._client.address_book
                 self._client.address_book.connect("notify::state",
                     self._address_book_state_changed_cb)
 
@@ -390,7 +405,7 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
         elif reason == "SSD":
             self.emit("server-down")
         else:
-            self._transport.lose_connection()
+            self.emit("disconnected-by-server")
 
     # --------- Presence & Privacy -------------------------------------------
     def _handle_BLP(self, command):
@@ -416,9 +431,8 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
     def _handle_FLN(self,command):
         idx, network_id, account = self._parse_account(command)
 
-        contacts = self._client.address_book.contacts.\
-                search_by_network_id(network_id).\
-                search_by_account(account)
+        contacts = self._client.address_book.contacts.lookup(network_id,
+                account)
 
         if len(contacts) == 0:
             logger.warning("Contact (network_id=%d) %s not found" % \
@@ -431,9 +445,8 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
     def _handle_NLN(self,command):
         idx, network_id, account = self._parse_account(command, 1)
 
-        contacts = self._client.address_book.contacts.\
-                search_by_network_id(network_id).\
-                search_by_account(account)
+        contacts = self._client.address_book.contacts.lookup(network_id,
+                account)
 
         if len(contacts) == 0:
             logger.warning("Contact (network_id=%d) %s not found" % \
@@ -515,9 +528,8 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
         else:
             ss = None
 
-        contacts = self._client.address_book.contacts.\
-                search_by_network_id(network_id).\
-                search_by_account(account)
+        contacts = self._client.address_book.contacts.lookup(network_id,
+                account)
 
         if len(contacts) == 0:
             logger.warning("Contact (network_id=%d) %s not found" % \
@@ -562,7 +574,12 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
             self._send_command("BLP",
                     (self._client.profile.privacy,))
             self._state = ProtocolState.SYNCHRONIZING
-            self._client.address_book.sync()
+            address_book = self._client.address_book
+            if address_book.state == AB.AddressBookState.SYNCHRONIZED:
+                # reconnection, the address book we have is still valid
+                self._address_book_state_changed_cb(address_book, None)
+            else:
+                address_book.sync()
         elif content_type[0] in \
                 ('text/x-msmsgsinitialmdatanotification', \
                  'text/x-msmsgsoimnotification'):
@@ -618,9 +635,8 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
     def _handle_UBM(self, command):
         idx, network_id, account = self._parse_account(command)
 
-        contacts = self._client.address_book.contacts.\
-                search_by_network_id(network_id).\
-                search_by_account(account)
+        contacts = self._client.address_book.contacts.lookup(network_id,
+                account)
 
         if len(contacts) == 0:
             logger.warning("Contact (network_id=%d) %s not found" % \
@@ -724,7 +740,6 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
         self._send_command("USR", arguments)
 
     def _address_book_state_changed_cb(self, address_book, pspec):
-        MAX_PAYLOAD_SIZE = 7500
         if self._state != ProtocolState.SYNCHRONIZING:
             return
         if address_book.state != AB.AddressBookState.SYNCHRONIZED:
@@ -732,31 +747,12 @@ class NotificationProtocol(BaseProtocol, gobject.GObject):
         self._client.profile._server_property_changed("display-name",
                 address_book.profile.display_name)
 
-        contacts = address_book.contacts.group_by_domain()
-
-        payloads = ['<ml l="1">']
+        builder = MembershipListBuilder(initial=True)
         mask = ~(profile.Membership.REVERSE | profile.Membership.PENDING)
-        for domain, contacts in contacts.iteritems():
-            payloads[-1] += '<d n="%s">' % domain
-            for contact in contacts:
-                user = contact.account.split("@", 1)[0]
-                lists = contact.memberships & mask
-                if lists == profile.Membership.NONE:
-                    continue
-                network_id = contact.network_id
-                node = '<c n="%s" l="%d" t="%d"/>' % (user, lists, network_id)
-                size = len(payloads[-1]) + len(node) + len('</d></ml>')
-                if size >= MAX_PAYLOAD_SIZE:
-                    payloads[-1] += '</d></ml>'
-                    payloads.append('<ml l="1"><d n="%s">' % domain)
-                payloads[-1] += node
-            payloads[-1] += '</d>'
-        payloads[-1] += '</ml>'
-
-        import re
-        pattern = re.compile ('<d n="[^"]+"></d>')
-        for payload in payloads:
-            payload = pattern.sub('', payload)
+        for contact in address_book.contacts:
+            builder.add(contact.account, contact.network_id,
+                    contact.memberships & mask)
+        for payload in builder.payloads():
             self._send_command("ADL", payload=payload)
         self._state = ProtocolState.SYNCHRONIZED
 
@@ -71,7 +71,15 @@ class SwitchboardProtocol(BaseProtocol, gobject.GObject):
 
             "user-invitation-failed": (gobject.SIGNAL_RUN_FIRST,
                 gobject.TYPE_NONE,
-                (object,))}
+                (object,)),
+
+            "congested": (gobject.SIGNAL_RUN_FIRST,
+                gobject.TYPE_NONE,
+                ()),
+
+            "writable": (gobject.SIGNAL_RUN_FIRST,
+                gobject.TYPE_NONE,
+                ())}
 
     __gproperties__ = {
             "state":  (gobject.TYPE_INT,
@@ -114,6 +122,8 @@ class SwitchboardProtocol(BaseProtocol, gobject.GObject):
         self.__inviting = False
 
         self.__invitations = {}
+        transport.connect("congested", lambda t: self.emit("congested"))
+        transport.connect("writable", lambda t: self.emit("writable"))
 
     # Properties ------------------------------------------------------------
     def __get_state(self):
@@ -133,6 +143,12 @@ class SwitchboardProtocol(BaseProtocol, gobject.GObject):
     inviting = property(__get_inviting)
     _inviting = property(__get_inviting, __set_inviting)
 
+    @property
+    def congested(self):
+        """True while messages should not be sent, until the writable
+        signal is emitted"""
+        return self._transport.congested
+
     def do_get_property(self, pspec):
         if pspec.name == "state":
             return self.__state
@@ -155,18 +171,22 @@ class SwitchboardProtocol(BaseProtocol, gobject.GObject):
         self._inviting = True
         self._send_command('CAL', (contact.account,) )
 
-    def send_message(self, message, ack, callback=None, cb_args=()):
+    def send_message(self, message, ack, callback=None, cb_args=(),
+            priority=None):
         """Send a message to all contacts in this switchboard
 
             @param message: the message to send
-            @type message: L{message.Message}"""
+            @type message: L{message.Message}
+
+            @param priority: the L{gnet.IoPriority} of the message
+            @type priority: integer"""
         assert(self.state == ProtocolState.OPEN)
         self._send_command('MSG',
                 (ack,),
                 message,
                 True,
                 self.__on_message_sent,
-                message, callback, cb_args)
+                message, callback, cb_args, priority=priority)
 
     def __on_message_sent(self, message, user_callback, user_cb_args):
         self.emit("message-sent", message)
@@ -69,7 +69,6 @@ class BaseP2PTransport(gobject.GObject):
             self._control_blob_queue.append((blob, callback, errback))
         else:
             self._data_blob_queue.append((blob, callback, errback))
-        gobject.timeout_add(200, self._process_send_queues)
         self._process_send_queues()
 
     def close(self):
@@ -78,6 +77,11 @@ class BaseP2PTransport(gobject.GObject):
     def _send_chunk(self, chunk):
         raise NotImplementedError
 
+    def _is_congested(self):
+        """Whether the underlying link can't take more chunks for now,
+        subclasses must call L{_process_send_queues} once it drains"""
+        return False
+
     # Helper methods
     def _reset(self):
         self._control_blob_queue = []
@@ -122,6 +126,11 @@ class BaseP2PTransport(gobject.GObject):
         self._process_send_queues()
 
     def _process_send_queues(self):
+        while not self._is_congested():
+            if not self._send_next_chunk():
+                break
+
+    def _send_next_chunk(self):
         if len(self._control_blob_queue) > 0:
             queue = self._control_blob_queue
         elif len(self._data_blob_queue) > 0:
@@ -18,6 +18,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+from papyon.gnet.constants import IoPriority
 from papyon.msnp.message import MessageAcknowledgement
 from papyon.msnp2p.transport.TLP import MessageChunk
 from papyon.msnp2p.transport.base import BaseP2PTransport
@@ -34,8 +35,8 @@ logger = logging.getLogger('papyon.msnp2p.transport')
 
 class SwitchboardP2PTransport(BaseP2PTransport, SwitchboardClient):
     def __init__(self, client, contacts, transport_manager):
-        SwitchboardClient.__init__(self, client, contacts)
         BaseP2PTransport.__init__(self, transport_manager, "switchboard")
+        SwitchboardClient.__init__(self, client, contacts)
 
 
     def close(self):
@@ -65,8 +66,25 @@ class SwitchboardP2PTransport(BaseP2PTransport, SwitchboardClient):
         headers = {'P2P-Dest': self.peer.account}
         content_type = 'application/x-msnmsgrp2p'
         body = str(chunk) + struct.pack('>L', chunk.application_id)
+        if chunk.is_control_chunk():
+            priority = IoPriority.HIGH
+        else:
+            priority = IoPriority.LOW
         self._send_message(content_type, body, headers,
-                MessageAcknowledgement.MSNC, self._on_chunk_sent, (chunk,))
+                MessageAcknowledgement.MSNC, self._on_chunk_sent, (chunk,),
+                priority)
+
+    def _is_congested(self):
+        # keep the chunks in our own queues until the switchboard took
+        # the previous ones, they would otherwise pile up as pending messages
+        if len(self._pending_messages) > 0:
+            return True
+        return self.switchboard is not None and self.switchboard.congested
+
+    def _process_pending_queues(self):
+        # also called when the switchboard becomes writable again
+        SwitchboardClient._process_pending_queues(self)
+        self._process_send_queues()
 
     def _on_message_received(self, message):
         chunk = MessageChunk.parse(message.body[:-4])
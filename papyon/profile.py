@@ -404,8 +404,8 @@ class Profile(gobject.GObject):
         self._signature_sound = None
         self._end_point_name = ""
 
-        self.client_id = ClientCapabilities(10)
-        self.client_id.supports_sip_invite = True
+        self._client_id = ClientCapabilities(10)
+        self._client_id.supports_sip_invite = True
         #self.client_id.supports_tunneled_sip = True
         self._client_id.connect("capability-changed", self._client_capability_changed)
 
@@ -686,6 +686,9 @@ class Contact(gobject.GObject):
         self._msn_object = None
         self._infos = {}
         self._attributes = {'icon_url' : None}
+        # weak references to the storages indexing the contact, see
+        # L{papyon.service.AddressBook.AddressBookStorage}
+        self._storages = []
 
     def __repr__(self):
         def memberships_str():
@@ -830,11 +833,15 @@ class Contact(gobject.GObject):
         return (not self.is_member(Membership.FORWARD) and self.id != blank_id)
 
     def _set_memberships(self, memberships):
+        old_memberships = self._memberships
         self._memberships = memberships
+        self._index_changed("memberships", old_memberships)
         self.notify("memberships")
 
     def _add_membership(self, membership):
+        old_memberships = self._memberships
         self._memberships |= membership
+        self._index_changed("memberships", old_memberships)
         self.notify("memberships")
 
     def _remove_membership(self, membership):
@@ -842,9 +849,18 @@ class Contact(gobject.GObject):
 
             @param membership: the membership to remove
             @type membership: int L{Membership}"""
+        old_memberships = self._memberships
         self._memberships ^= membership
+        self._index_changed("memberships", old_memberships)
         self.notify("memberships")
 
+    def _set_ids(self, id, cid):
+        old_id, old_cid = self._id, self._cid
+        self._id = id or "00000000-0000-0000-0000-000000000000"
+        self._cid = cid or "00000000-0000-0000-0000-000000000000"
+        self._index_changed("id", old_id)
+        self._index_changed("cid", old_cid)
+
     def _server_property_changed(self, name, value): #FIXME, should not be used for memberships
         if name == "client-capabilities":
             value = ClientCapabilities(client_id=value)
@@ -863,9 +879,8 @@ class Contact(gobject.GObject):
         self.notify("infos")
 
     def _reset(self):
-        self._id = "00000000-0000-0000-0000-000000000000"
-        self._cid = "00000000-0000-0000-0000-000000000000"
-        self._groups = set()
+        self._set_ids(None, None)
+        self._set_groups(())
 
         self._server_property_changed("presence", Presence.OFFLINE)
         self._server_property_changed("display-name", self._account)
@@ -878,10 +893,31 @@ class Contact(gobject.GObject):
 
     ### group management
     def _add_group_ownership(self, group):
+        if group in self._groups:
+            return
+        old_groups = set(self._groups)
         self._groups.add(group)
+        self._index_changed("groups", old_groups)
 
     def _delete_group_ownership(self, group):
+        if group not in self._groups:
+            return
+        old_groups = set(self._groups)
         self._groups.discard(group)
+        self._index_changed("groups", old_groups)
+
+    def _set_groups(self, groups):
+        old_groups = self._groups
+        self._groups = set(groups)
+        self._index_changed("groups", old_groups)
+
+    def _index_changed(self, field, old_value):
+        for ref in self._storages[:]:
+            storage = ref()
+            if storage is None:
+                self._storages.remove(ref)
+            else:
+                storage._contact_changed(self, field, old_value)
 
     def do_get_property(self, pspec):
         name = pspec.name.lower().replace("-", "_")
@@ -147,6 +147,10 @@ class Contact(object):
 
 
 class AB(SOAPService):
+    PIPELINED_METHODS = ('ABFindAll',)
+    PIPELINE_DEPTH = 4
+    STREAMED_METHODS = {'ABFindAll': ('ab:Group', 'ab:Contact')}
+
     def __init__(self, sso, proxies=None):
         self._sso = sso
         self._tokens = {}
@@ -178,18 +182,25 @@ class AB(SOAPService):
                 (XMLTYPE.bool.encode(deltas_only), self._last_changes),
                 callback, errback)
 
+    def _ParseABFindAllElement(self, element):
+        if element.tag.endswith("}Group"):
+            return Group(element)
+        return Contact(element)
+
     def _HandleABFindAllResponse(self, callback, errback, response, user_data):
-        last_changes = response[0].find("./ab:lastChange")
-        if last_changes is not None:
-            self._last_changes = last_changes.text
+        response, parsed = response
+        if response[0] is not None:
+            last_changes = response[0].find("./ab:lastChange")
+            if last_changes is not None:
+                self._last_changes = last_changes.text
 
         groups = []
         contacts = []
-        for group in response[1]:
-            groups.append(Group(group))
-
-        for contact in response[2]:
-            contacts.append(Contact(contact))
+        for item in parsed:
+            if isinstance(item, Group):
+                groups.append(item)
+            else:
+                contacts.append(item)
 
         #FIXME: add support for the ab param
         address_book =  ABResult(None, contacts, groups)
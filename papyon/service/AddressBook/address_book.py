@@ -22,6 +22,7 @@
 import ab
 import sharing
 import scenario
+from cache import AddressBookCache
 
 import papyon
 import papyon.profile as profile
@@ -30,26 +31,290 @@ from papyon.util.decorator import rw_property
 from papyon.profile import ContactType
 from papyon.service.AddressBook.constants import *
 from papyon.service.description.AB.constants import *
+from papyon.service.AddressBook.scenario.base import Scenario
 from papyon.service.AddressBook.scenario.contacts import *
 
+from papyon.gnet.eventloop import get_event_loop
+
 import gobject
+import weakref
+
+__all__ = ['AddressBook', 'AddressBookState', 'AddressBookCache']
 
-__all__ = ['AddressBook', 'AddressBookState']
+BLANK_ID = "00000000-0000-0000-0000-000000000000"
 
 class AddressBookStorage(set):
+    """Set of contacts indexed on their account, network id, id, cid,
+    memberships and groups.
+
+    The indexes are built by the first search and then kept up to date as
+    contacts are added and removed, and as their indexed fields change.
+    L{search} answers a query on several fields by intersecting the
+    indexes, which the search_by_* methods use as well.
+
+    The storages returned by the searches are not indexed themselves: they
+    are answered from the indexes of the storage they come from, as long as
+    neither of them was modified, and by going through their contacts
+    otherwise.
+
+        >>> storage.search(network_id=NetworkID.MSN,
+        ...         memberships=Membership.FORWARD | Membership.ALLOW)"""
+
+    INDEXED_FIELDS = ('account', 'network_id', 'id', 'cid', 'memberships',
+            'groups')
+
+    # field => {key: set(contact, ...)}, the keys being the lowercased
+    # strings, each bit of the memberships and each group
+    _indexes = None
+    # the contacts in iteration order, for __getitem__
+    _sequence = None
+    # search results never build indexes, they use the ones of _parent
+    # while its _generation, increased by each change, is _parent_generation
+    _derived = False
+    _parent = None
+    _parent_generation = 0
+    _generation = 0
+
     def __init__(self, initial_set=()):
         set.__init__(self, initial_set)
 
+    def add(self, contact):
+        if contact in self:
+            return
+        set.add(self, contact)
+        self._changed()
+        if self._indexes is not None:
+            self._index(contact)
+
+    def discard(self, contact):
+        if contact not in self:
+            return
+        set.discard(self, contact)
+        self._changed()
+        if self._indexes is not None:
+            self._unindex(contact)
+
+    def remove(self, contact):
+        if contact not in self:
+            raise KeyError(contact)
+        self.discard(contact)
+
+    def search(self, **criteria):
+        """Returns the contacts matching all the given criteria, the
+        indexed fields are looked up in the indexes, the other ones are
+        compared like L{search_by} does
+
+            @param criteria: field => value, the memberships criterion is a
+                bitmask the contacts must all be members of, the groups
+                criterion a list of groups they must all belong to
+            @rtype: L{AddressBookStorage}"""
+        indexed = self._indexed_storage()
+        if indexed is None:
+            return self._derive([contact for contact in self
+                if self._match_all(contact, criteria)])
+
+        indexes = indexed._get_indexes()
+        candidates = []
+        others = []
+        for field, value in criteria.iteritems():
+            if field not in indexes:
+                others.append((field, value))
+                continue
+            index = indexes[field]
+            if field == 'groups':
+                keys = value
+            else:
+                keys = self._keys(field, value)
+            for key in keys:
+                candidates.append(index.get(key, ()))
+
+        if indexed is not self:
+            candidates.append(self)
+        if candidates:
+            candidates.sort(key=len)
+            result = set(candidates[0])
+            for contacts in candidates[1:]:
+                if not result:
+                    break
+                result &= contacts
+        else:
+            result = set(self)
+        for field, value in others:
+            result = [contact for contact in result
+                    if self._match(contact, field, value)]
+        return self._derive(result)
+
+    def lookup(self, network_id, account):
+        """Returns the contacts with the given network id and account,
+        the account is case insensitive
+
+            @rtype: tuple of L{papyon.profile.Contact}"""
+        indexed = self._indexed_storage()
+        if indexed is None:
+            contacts = [contact for contact in self
+                    if self._match(contact, 'account', account)]
+        else:
+            contacts = indexed._get_indexes()['account'].get(account.lower(),
+                    ())
+        return tuple([contact for contact in contacts
+            if contact.network_id == network_id and contact in self])
+
+    def _derive(self, contacts):
+        """Builds a search result, answered from our indexes"""
+        result = AddressBookStorage(contacts)
+        result._derived = True
+        indexed = self._indexed_storage()
+        if indexed is not None:
+            result._parent = indexed
+            result._parent_generation = indexed._generation
+        return result
+
+    def _indexed_storage(self):
+        """Returns the storage whose indexes cover our contacts, or None
+        if they have to be searched one by one"""
+        if not self._derived:
+            return self
+        parent = self._parent
+        if parent is not None and parent._generation == self._parent_generation:
+            return parent
+        return None
+
+    def _changed(self):
+        self._sequence = None
+        self._generation += 1
+        self._parent = None
+
+    def _get_indexes(self):
+        assert not self._derived
+        if self._indexes is None:
+            self._indexes = dict([(field, {})
+                for field in self.INDEXED_FIELDS])
+            for contact in self:
+                self._index(contact)
+        return self._indexes
+
+    def _drop_indexes(self):
+        self._changed()
+        if self._indexes is None:
+            return
+        for contact in self:
+            self._unregister(contact)
+        self._indexes = None
+
+    def _index(self, contact):
+        for field in self.INDEXED_FIELDS:
+            index = self._indexes[field]
+            for key in self._keys(field, getattr(contact, field)):
+                contacts = index.get(key, None)
+                if contacts is None:
+                    contacts = index[key] = set()
+                contacts.add(contact)
+        contact._storages.append(weakref.ref(self))
+
+    def _unindex(self, contact):
+        for field in self.INDEXED_FIELDS:
+            index = self._indexes[field]
+            for key in self._keys(field, getattr(contact, field)):
+                self._unindex_key(index, key, contact)
+        self._unregister(contact)
+
+    def _unregister(self, contact):
+        for ref in contact._storages:
+            if ref() is self:
+                contact._storages.remove(ref)
+                break
+
+    @staticmethod
+    def _unindex_key(index, key, contact):
+        contacts = index.get(key, None)
+        if contacts is not None:
+            contacts.discard(contact)
+            if len(contacts) == 0:
+                del index[key]
+
+    def _contact_changed(self, contact, field, old_value):
+        """Called by the contacts when one of their indexed fields changed"""
+        if self._indexes is None or contact not in self:
+            return
+        index = self._indexes[field]
+        old_keys = set(self._keys(field, old_value))
+        new_keys = set(self._keys(field, getattr(contact, field)))
+        for key in old_keys - new_keys:
+            self._unindex_key(index, key, contact)
+        for key in new_keys - old_keys:
+            contacts = index.get(key, None)
+            if contacts is None:
+                contacts = index[key] = set()
+            contacts.add(contact)
+
+    @staticmethod
+    def _keys(field, value):
+        if field == 'memberships':
+            bits = []
+            bit = 1
+            while bit <= value:
+                if value & bit:
+                    bits.append(bit)
+                bit <<= 1
+            return bits
+        elif field == 'groups':
+            return value
+        elif isinstance(value, basestring):
+            return (value.lower(),)
+        return (value,)
+
+    @classmethod
+    def _match_all(cls, contact, criteria):
+        for field, value in criteria.iteritems():
+            if field == 'memberships':
+                if contact.memberships & value != value:
+                    return False
+            elif field == 'groups':
+                for group in value:
+                    if group not in contact.groups:
+                        return False
+            elif not cls._match(contact, field, value):
+                return False
+        return True
+
+    @staticmethod
+    def _match(contact, field, value):
+        if isinstance(value, basestring):
+            value = value.lower()
+        contact_field_value = getattr(contact, field)
+        if isinstance(contact_field_value, basestring):
+            contact_field_value = contact_field_value.lower()
+        return contact_field_value == value
+
+    def __invalidating(method):
+        def invalidate(self, *args):
+            self._drop_indexes()
+            return method(self, *args)
+        invalidate.__name__ = method.__name__
+        return invalidate
+
+    update = __invalidating(set.update)
+    clear = __invalidating(set.clear)
+    pop = __invalidating(set.pop)
+    difference_update = __invalidating(set.difference_update)
+    intersection_update = __invalidating(set.intersection_update)
+    symmetric_difference_update = \
+            __invalidating(set.symmetric_difference_update)
+    __ior__ = __invalidating(set.__ior__)
+    __iand__ = __invalidating(set.__iand__)
+    __isub__ = __invalidating(set.__isub__)
+    __ixor__ = __invalidating(set.__ixor__)
+    del __invalidating
+
     def __repr__(self):
         return "AddressBook : %d contact(s)" % len(self)
 
     def __getitem__(self, key):
-        i = 0
-        for contact in self:
-            if i == key:
-                return contact
-            i += 1
-        raise IndexError("Index out of range")
+        if self._sequence is None:
+            self._sequence = tuple(self)
+        if key < 0 or key >= len(self._sequence):
+            raise IndexError("Index out of range")
+        return self._sequence[key]
 
     def __getattr__(self, name):
         if name.startswith("search_by_"):
@@ -68,30 +333,20 @@ class AddressBookStorage(set):
             raise AttributeError, name
 
     def search_by_memberships(self, memberships):
-        result = []
-        for contact in self:
-            if contact.is_member(memberships):
-                result.append(contact)
-                # Do not break here, as the account
-                # might exist in multiple networks
-        return AddressBookStorage(result)
+        return self.search(memberships=memberships)
 
     def search_by_groups(self, *groups):
-        result = []
-        groups = set(groups)
-        for contact in self:
-            if groups <= contact.groups:
-                result.append(contact)
-        return AddressBookStorage(result)
+        return self.search(groups=groups)
 
     def group_by_group(self):
         result = {}
-        for contact in self:
-            groups = contact.groups
-            for group in groups:
-                if group not in result:
-                    result[group] = set()
-                result[group].add(contact)
+        if self._derived:
+            for contact in self:
+                for group in contact.groups:
+                    result.setdefault(group, set()).add(contact)
+            return result
+        for group, contacts in self._get_indexes()['groups'].iteritems():
+            result[group] = set(contacts)
         return result
 
     def search_by_predicate(self, predicate):
@@ -99,29 +354,26 @@ class AddressBookStorage(set):
         for contact in self:
             if predicate(contact):
                 result.append(contact)
-        return AddressBookStorage(result)
+        return self._derive(result)
 
     def search_by(self, field, value):
+        if field in ('account', 'network_id', 'id', 'cid'):
+            return self.search(**{field: value})
         result = []
-        if isinstance(value, basestring):
-            value = value.lower()
         for contact in self:
-            contact_field_value = getattr(contact, field)
-            if isinstance(contact_field_value, basestring):
-                contact_field_value = contact_field_value.lower()
-            if contact_field_value == value:
+            if self._match(contact, field, value):
                 result.append(contact)
                 # Do not break here, as the account
                 # might exist in multiple networks
-        return AddressBookStorage(result)
+        return self._derive(result)
 
     def group_by(self, field):
-        result = {}
+        groups = {}
         for contact in self:
-            value = getattr(contact, field)
-            if value not in result:
-                result[value] = AddressBookStorage()
-            result[value].add(contact)
+            groups.setdefault(getattr(contact, field), []).append(contact)
+        result = {}
+        for value, contacts in groups.iteritems():
+            result[value] = self._derive(contacts)
         return result
 
 
@@ -190,15 +442,28 @@ class AddressBook(gobject.GObject):
                    gobject.PARAM_READABLE)
         }
 
-    def __init__(self, sso, client, proxies=None):
-        """The address book object."""
+    # number of contacts or members converted per main loop iteration
+    # during the synchronization
+    SYNC_BATCH_SIZE = 200
+
+    def __init__(self, sso, client, proxies=None, cache=None):
+        """The address book object.
+
+            @param cache: where the address book is kept between sessions,
+                only the changes are then requested when synchronizing
+            @type cache: L{AddressBookCache}"""
         gobject.GObject.__init__(self)
 
         self._ab = ab.AB(sso, proxies)
         self._sharing = sharing.Sharing(sso, proxies)
         self._client = client
+        self._cache = cache
 
         self.__state = AddressBookState.NOT_SYNCHRONIZED
+        # (contact id, callback, errback) waiting for the ABFindAll sent, and
+        # the ones that came after it was sent
+        self.__changes_request = None
+        self.__changes_joined = []
 
         self.groups = set()
         self.contacts = AddressBookStorage()
@@ -228,33 +493,35 @@ class AddressBook(gobject.GObject):
         self._state = AddressBookState.SYNCHRONIZING
 
         def callback(address_book, memberships):
-            ab = address_book.ab
-            contacts = address_book.contacts
-            groups = address_book.groups
-            for group in groups:
-                g = profile.Group(group.Id, group.Name.encode("utf-8"))
-                self.groups.add(g)
-            for contact in contacts:
-                c = self.__build_contact(contact, Membership.FORWARD)
-                if c is None:
-                    continue
-                if contact.Type == ContactType.ME:
-                    self._profile = c
-                else:
-                    self.contacts.add(c)
-            self.__update_memberships(memberships)
-            self._state = AddressBookState.SYNCHRONIZED
+            def memberships_updated():
+                self._state = AddressBookState.SYNCHRONIZED
+                self.__save_cache()
+
+            def address_book_built():
+                # the large lists are converted a batch at a time so
+                # that the main loop keeps running
+                self.__run_in_batches(memberships, self.__update_member,
+                        memberships_updated)
+
+            if initial_sync.deltas_only:
+                self.__apply_address_book_changes(address_book)
+                address_book_built()
+            else:
+                self.groups.clear()
+                self.contacts.clear()
+                self._profile = None
+                self.__build_address_book(address_book, address_book_built)
 
         initial_sync = scenario.InitialSyncScenario(self._ab, self._sharing,
                 (callback,),
                 (self.__common_errback, None),
                 self._client.profile.account)
+        initial_sync.deltas_only = self.__load_cache()
         initial_sync()
 
     # Public API
     def search_contact(self, account, network_id):
-        contacts = self.contacts.search_by_network_id(network_id).\
-                search_by_account(account)
+        contacts = self.contacts.lookup(network_id, account)
         if len(contacts) == 0:
             return None
         return contacts[0]
@@ -273,8 +540,17 @@ class AddressBook(gobject.GObject):
 
     def accept_contact_invitation(self, pending_contact, add_to_contact_list=True,
             done_cb=None, failed_cb=None):
-        def callback(contact_infos, memberships):
-            self.__update_contact(pending_contact, memberships, contact_infos)
+        def callback(contact_guid, memberships):
+            if contact_guid is None:
+                changes_applied(contact_guid, memberships)
+            else:
+                self.__fetch_changes(contact_guid,
+                        (changes_applied, contact_guid, memberships),
+                        (self.__common_errback, failed_cb))
+
+        def changes_applied(contact_guid, memberships):
+            self.__update_contact(pending_contact, memberships,
+                    id=contact_guid)
             self.__common_callback('contact-accepted', done_cb, pending_contact)
         ai = scenario.AcceptInviteScenario(self._ab, self._sharing,
                  (callback,),
@@ -302,9 +578,14 @@ class AddressBook(gobject.GObject):
     def add_messenger_contact(self, account, invite_display_name='',
             invite_message='', groups=[], network_id=NetworkID.MSN,
             auto_allow=True, done_cb=None, failed_cb=None):
-        def callback(contact_infos, memberships):
+        def callback(contact_guid, memberships):
+            self.__fetch_changes(contact_guid,
+                    (changes_applied, contact_guid, memberships),
+                    (self.__common_errback, failed_cb))
+
+        def changes_applied(contact_guid, memberships):
             c = self.__build_or_update_contact(account, network_id,
-                    memberships, contact_infos)
+                    memberships, id=contact_guid)
             self.__common_callback('messenger-contact-added', done_cb, c)
             for group in groups:
                 self.add_contact_to_group(group, c)
@@ -439,7 +720,7 @@ class AddressBook(gobject.GObject):
 
     def delete_group(self, group, done_cb=None, failed_cb=None):
         def callback():
-            for contact in self.contacts:
+            for contact in self.contacts.search_by_groups(group):
                 contact._delete_group_ownership(group)
             self.groups.discard(group)
             self.__common_callback('group-deleted', done_cb, group)
@@ -484,6 +765,209 @@ class AddressBook(gobject.GObject):
         dc()
     # End of public API
 
+    def __fetch_changes(self, contact_guid, callback, errback):
+        """Applies the changes made to the address book since the last
+        ABFindAll, then calls callback once the contact with the given id
+        is known. A request already in progress is shared if its response
+        contains that contact, otherwise the next request is.
+
+            @param contact_guid: the id of the contact that must be known
+            @param callback: tuple(callable, *args)
+            @param errback: tuple(callable, *args)"""
+        waiter = (contact_guid, callback, errback)
+        if self.__changes_request is None:
+            self.__changes_request = [waiter]
+            self.__request_changes(True)
+        else:
+            self.__changes_joined.append(waiter)
+
+    def __request_changes(self, deltas_only):
+        if self._ab._last_changes == DEFAULT_TIMESTAMP:
+            deltas_only = False # FindAll would make it a full request
+        self._ab.FindAll((self.__changes_callback, deltas_only),
+                (self.__changes_errback, deltas_only),
+                Scenario.CONTACT_SAVE, deltas_only)
+
+    def __changes_callback(self, address_book, deltas_only):
+        self.__apply_address_book_changes(address_book, not deltas_only)
+        self.__save_cache()
+        done = self.__changes_request
+        pending = []
+        # the request may have been sent before those contacts were added
+        for waiter in self.__changes_joined:
+            if self.__search_contact_by_id(waiter[0]) is not None:
+                done.append(waiter)
+            else:
+                pending.append(waiter)
+        self.__changes_request = None
+        self.__changes_joined = []
+        if pending:
+            self.__changes_request = pending
+            self.__request_changes(True)
+        for contact_guid, callback, errback in done:
+            callback[0](*callback[1:])
+
+    def __changes_errback(self, error_code, deltas_only):
+        if error_code == 'FullSyncRequired' and deltas_only:
+            self.__request_changes(False)
+            return
+        failed = self.__changes_request + self.__changes_joined
+        self.__changes_request = None
+        self.__changes_joined = []
+        for contact_guid, callback, errback in failed:
+            errback[0](AddressBookError.UNKNOWN, *errback[1:])
+
+    def __load_cache(self):
+        if self._cache is None:
+            return False
+        cached = self._cache.load()
+        if cached is None:
+            return False
+        groups, owner, contacts, ab_last_changes, sharing_last_changes = cached
+        if DEFAULT_TIMESTAMP in (ab_last_changes, sharing_last_changes):
+            # the services would silently answer with the full lists, which
+            # must not be applied as changes
+            return False
+        self.groups.update(groups)
+        self._profile = owner
+        self.contacts.update(contacts)
+        self._ab._last_changes = ab_last_changes
+        self._sharing._last_changes = sharing_last_changes
+        return True
+
+    def __save_cache(self):
+        if self._cache is None:
+            return
+        self._cache.save(self.groups, self._profile, self.contacts,
+                self._ab._last_changes, self._sharing._last_changes)
+
+    def __build_address_book(self, address_book, callback):
+        def add_contact(contact):
+            c = self.__build_contact(contact, Membership.FORWARD)
+            if c is None:
+                return
+            if contact.Type == ContactType.ME:
+                self._profile = c
+            else:
+                self.contacts.add(c)
+
+        for group in address_book.groups:
+            g = profile.Group(group.Id, group.Name.encode("utf-8"))
+            self.groups.add(g)
+        self.__run_in_batches(address_book.contacts, add_contact, callback)
+
+    def __run_in_batches(self, items, function, callback):
+        """Calls function with each item, L{SYNC_BATCH_SIZE} items per main
+        loop iteration, then calls callback. The items are removed from the
+        list as they are processed."""
+        items.reverse()
+        def step():
+            for i in xrange(self.SYNC_BATCH_SIZE):
+                if not items:
+                    callback()
+                    return False
+                function(items.pop())
+            return True
+        if step():
+            get_event_loop().idle_add(step)
+
+    def __apply_address_book_changes(self, address_book, full=False):
+        """Applies the result of an ABFindAll request to the groups and the
+        contacts: the new, changed and deleted ones for a deltas_only
+        request, or everything when full is set, the groups and contacts
+        missing from the result are then deleted"""
+        synchronized = (self.state == AddressBookState.SYNCHRONIZED)
+        groups = {}
+        for group in self.groups:
+            groups[group.id] = group
+
+        if full:
+            deleted = set(groups.keys())
+            for group in address_book.groups:
+                deleted.discard(group.Id)
+            for group_id in deleted:
+                self.__delete_group(groups.pop(group_id), synchronized)
+        for group in address_book.groups:
+            g = groups.get(group.Id, None)
+            if group.Deleted:
+                if g is not None:
+                    self.__delete_group(groups.pop(group.Id), synchronized)
+            elif g is None:
+                g = profile.Group(group.Id, group.Name.encode("utf-8"))
+                self.groups.add(g)
+                groups[group.Id] = g
+                if synchronized:
+                    self.emit('group-added', g)
+            elif g.name != group.Name.encode("utf-8"):
+                g._server_property_changed("name", group.Name.encode("utf-8"))
+                if synchronized:
+                    self.emit('group-renamed', g)
+
+        if full:
+            ids = set([contact.Id for contact in address_book.contacts])
+            for contact in list(self.contacts):
+                if contact.id != BLANK_ID and contact.id not in ids:
+                    self.__delete_contact(contact, synchronized)
+
+        for contact in address_book.contacts:
+            if contact.Type == ContactType.ME:
+                current = self._profile
+            else:
+                current = self.__search_contact_by_id(contact.Id)
+
+            if contact.Deleted:
+                if current is not None and current is not self._profile:
+                    self.__delete_contact(current, synchronized)
+                continue
+
+            c = self.__build_contact(contact, Membership.FORWARD)
+            if c is None:
+                continue
+            if current is None:
+                # a contact only known through its memberships so far
+                current = self.search_contact(c.account, c.network_id)
+            if current is None:
+                if contact.Type == ContactType.ME:
+                    self._profile = c
+                else:
+                    self.contacts.add(c)
+                    if synchronized:
+                        self.emit('contact-added', c)
+                continue
+
+            current.freeze_notify()
+            current._set_ids(c.id, c.cid)
+            current._server_property_changed("display-name", c.display_name)
+            if c.is_member(Membership.FORWARD):
+                if not current.is_member(Membership.FORWARD):
+                    current._add_membership(Membership.FORWARD)
+            elif current.is_member(Membership.FORWARD):
+                current._remove_membership(Membership.FORWARD)
+            current._set_groups(c.groups)
+            current._server_infos_changed(c.infos)
+            current.thaw_notify()
+
+    def __delete_group(self, group, emit):
+        for contact in self.contacts.search_by_groups(group):
+            contact._delete_group_ownership(group)
+        self.groups.discard(group)
+        if emit:
+            self.emit('group-deleted', group)
+
+    def __delete_contact(self, contact, emit):
+        if contact.is_member(Membership.FORWARD):
+            contact._remove_membership(Membership.FORWARD)
+        contact._reset()
+        if emit:
+            self.emit('contact-deleted', contact)
+        if contact.memberships == Membership.NONE:
+            self.contacts.discard(contact)
+
+    def __search_contact_by_id(self, id):
+        for contact in self.contacts.search_by_id(id):
+            return contact
+        return None
+
     def __build_contact(self, contact=None, memberships=Membership.NONE):
         external_email = None
         is_messenger_enabled = False
@@ -545,13 +1029,15 @@ class AddressBook(gobject.GObject):
             return c
         return None
 
-    def __update_contact(self, contact, memberships=None, infos=None):
+    def __update_contact(self, contact, memberships=None, infos=None, id=None):
         contact.freeze_notify()
         if memberships is not None:
             contact._set_memberships(memberships)
+        if infos is None and id is not None and contact.id == BLANK_ID:
+            # the changes did not list the contact yet
+            contact._set_ids(id, contact.cid)
         if infos is not None:
-            contact._id = infos.Id
-            contact._cid = infos.CID
+            contact._set_ids(infos.Id, infos.CID)
             contact._display_name = infos.DisplayName
             contact._server_infos_changed(infos.contact_infos)
             for group in self.groups:
@@ -560,15 +1046,15 @@ class AddressBook(gobject.GObject):
         contact.thaw_notify()
 
     def __build_or_update_contact(self, account, network_id=NetworkID.MSN,
-            memberships=None, infos=None):
+            memberships=None, infos=None, id=None):
         contact = self.search_contact(account, network_id)
         if contact is not None:
-            self.__update_contact(contact, memberships, infos)
+            self.__update_contact(contact, memberships, infos, id)
         else:
             if infos is None:
                 display_name = ""
-                contact = profile.Contact(None, network_id, account,
-                        display_name, memberships)
+                contact = profile.Contact(id, network_id, account,
+                        display_name, memberships=memberships)
             else:
                 contact = self.__build_contact(infos, memberships)
             self.contacts.add(contact)
@@ -576,6 +1062,10 @@ class AddressBook(gobject.GObject):
         return contact
 
     def __update_memberships(self, members):
+        for member in members:
+            self.__update_member(member)
+
+    def __update_member(self, member):
         role_to_membership = {
             "Allow"   : Membership.ALLOW,
             "Block"   : Membership.BLOCK,
@@ -583,35 +1073,45 @@ class AddressBook(gobject.GObject):
             "Pending" : Membership.PENDING
         }
 
-        for member in members:
-            if isinstance(member, sharing.PassportMember):
-                network = NetworkID.MSN
-            elif isinstance(member, sharing.EmailMember):
-                network = NetworkID.EXTERNAL
-            else:
-                continue
-
-            contact = self.search_contact(member.Account, network)
-            new_contact = False
-            if contact is None:
-                new_contact = True
-                cid = getattr(member, "CID", None)
-                account = member.Account.encode("utf-8")
-                display_name = (member.DisplayName or member.Account).encode("utf-8")
-                msg = member.Annotations.get('MSN.IM.InviteMessage', u'')
-                c = profile.Contact(None, network, account, display_name, cid)
-                c._server_attribute_changed('invite_message', msg.encode("utf-8"))
-                self.contacts.add(c)
-                contact = c
+        if isinstance(member, sharing.PassportMember):
+            network = NetworkID.MSN
+        elif isinstance(member, sharing.EmailMember):
+            network = NetworkID.EXTERNAL
+        else:
+            return
 
-            for role in member.Roles:
-                membership = role_to_membership.get(role, None)
-                if membership is None:
-                    raise NotImplementedError("Unknown Membership:" + membership)
-                contact._add_membership(membership)
+        contact = self.search_contact(member.Account, network)
+        new_contact = False
+        if contact is None:
+            new_contact = True
+            cid = getattr(member, "CID", None)
+            account = member.Account.encode("utf-8")
+            display_name = (member.DisplayName or member.Account).encode("utf-8")
+            msg = member.Annotations.get('MSN.IM.InviteMessage', u'')
+            c = profile.Contact(None, network, account, display_name, cid)
+            c._server_attribute_changed('invite_message', msg.encode("utf-8"))
+            self.contacts.add(c)
+            contact = c
+
+        for role in member.Roles:
+            membership = role_to_membership.get(role, None)
+            if membership is None:
+                raise NotImplementedError("Unknown Membership:" + membership)
+            contact._add_membership(membership)
+
+        for role in member.DeletedRoles:
+            membership = role_to_membership.get(role, None)
+            if membership is not None and contact.is_member(membership):
+                contact._remove_membership(membership)
+
+        if member.DeletedRoles and contact.memberships == Membership.NONE \
+                and contact.id == BLANK_ID:
+            # not a member of any list nor of the address book anymore
+            self.contacts.discard(contact)
+            return
 
-            if new_contact and self.state == AddressBookState.SYNCHRONIZED:
-                self.emit('contact-added', contact)
+        if new_contact and self.state == AddressBookState.SYNCHRONIZED:
+            self.emit('contact-added', contact)
 
     # Callbacks
     def __common_callback(self, signal, callback, *args):
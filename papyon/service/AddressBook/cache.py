@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""On-disk copy of the address book, used to only request the changes
+made since the previous session when logging in."""
+
+import papyon.profile as profile
+
+import cPickle
+import errno
+import logging
+import os
+import urllib
+
+__all__ = ['AddressBookCache']
+
+logger = logging.getLogger('papyon.service')
+
+class AddressBookCache(object):
+    """Stores the groups, the contacts, their memberships and the
+    timestamps of the last changes of the address book of one account.
+
+    Only plain python values are written, the contacts are rebuilt when
+    the cache is loaded. An unreadable or outdated cache is ignored, the
+    address book is then fully synchronized."""
+
+    VERSION = 1
+
+    def __init__(self, directory, account):
+        """Initializer
+
+            @param directory: the directory where the caches are kept
+            @type directory: string
+
+            @param account: the account owning the address book
+            @type account: string"""
+        self._directory = directory
+        self._account = account.lower()
+        self._path = os.path.join(directory,
+                "%s.abcache" % urllib.quote(self._account, '@'))
+
+    @property
+    def path(self):
+        return self._path
+
+    def load(self):
+        """Reads the cache
+
+            @return: the groups, the address book owner, the contacts and
+                the timestamps of the last changes of the AB and Sharing
+                services, or None if there is no usable cache
+            @rtype: (set(L{Group<papyon.profile.Group>}),
+                L{Contact<papyon.profile.Contact>},
+                [L{Contact<papyon.profile.Contact>}, ...],
+                string, string)"""
+        try:
+            cache_file = open(self._path, 'rb')
+        except IOError, err:
+            if err.errno != errno.ENOENT:
+                logger.warning("Unable to open the address book cache %s: %s"
+                        % (self._path, err))
+            return None
+        try:
+            try:
+                data = cPickle.load(cache_file)
+            finally:
+                cache_file.close()
+            if data['version'] != self.VERSION or \
+                    data['account'] != self._account:
+                return None
+            groups = {}
+            for group_id, name in data['groups']:
+                groups[group_id] = profile.Group(group_id, name)
+            owner = None
+            if data['profile'] is not None:
+                owner = self._load_contact(data['profile'], groups)
+            contacts = [self._load_contact(record, groups)
+                    for record in data['contacts']]
+            return (set(groups.values()), owner, contacts,
+                    data['ab_last_changes'], data['sharing_last_changes'])
+        except Exception, err:
+            logger.warning("Ignoring the corrupted address book cache %s: %s"
+                    % (self._path, err))
+            return None
+
+    def save(self, groups, owner, contacts, ab_last_changes,
+            sharing_last_changes):
+        """Writes the cache, the previous one is replaced atomically
+
+            @param groups: the groups of the address book
+            @type groups: iterable of L{Group<papyon.profile.Group>}
+
+            @param owner: the contact of the address book owner
+            @type owner: L{Contact<papyon.profile.Contact>}
+
+            @param contacts: the contacts of the address book
+            @type contacts: iterable of L{Contact<papyon.profile.Contact>}
+
+            @param ab_last_changes: timestamp of the last AB change
+            @type ab_last_changes: string
+
+            @param sharing_last_changes: timestamp of the last Sharing change
+            @type sharing_last_changes: string"""
+        data = {'version': self.VERSION,
+                'account': self._account,
+                'ab_last_changes': ab_last_changes,
+                'sharing_last_changes': sharing_last_changes,
+                'groups': [(group.id, group.name) for group in groups],
+                'profile': owner and self._dump_contact(owner),
+                'contacts': [self._dump_contact(contact)
+                    for contact in contacts]}
+
+        temporary_path = self._path + ".tmp"
+        try:
+            if not os.path.isdir(self._directory):
+                os.makedirs(self._directory, 0700)
+            fd = os.open(temporary_path,
+                    os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+            cache_file = os.fdopen(fd, 'wb')
+            try:
+                cPickle.dump(data, cache_file, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                cache_file.close()
+            os.rename(temporary_path, self._path)
+        except (IOError, OSError), err:
+            logger.warning("Unable to write the address book cache %s: %s"
+                    % (self._path, err))
+
+    def clear(self):
+        """Removes the cache from the disk"""
+        try:
+            os.remove(self._path)
+        except OSError, err:
+            if err.errno != errno.ENOENT:
+                logger.warning("Unable to remove the address book cache %s: %s"
+                        % (self._path, err))
+
+    @staticmethod
+    def _dump_contact(contact):
+        return (contact.id, contact.network_id, contact.account,
+                contact.display_name, contact.cid, contact.memberships,
+                contact.contact_type, [group.id for group in contact.groups],
+                dict(contact.infos), dict(contact.attributes))
+
+    @staticmethod
+    def _load_contact(record, groups):
+        id, network_id, account, display_name, cid, memberships, \
+                contact_type, group_ids, infos, attributes = record
+        contact = profile.Contact(id, network_id, account, display_name, cid,
+                memberships, contact_type)
+        for group_id in group_ids:
+            if group_id in groups:
+                contact._add_group_ownership(groups[group_id])
+        contact._infos.update(infos)
+        contact._attributes.update(attributes)
+        return contact
@@ -65,9 +65,9 @@ class AcceptInviteScenario(BaseScenario):
                  self.network)
         am()
 
-    def __update_memberships(self, contact, new_membership):
+    def __update_memberships(self, contact_guid, new_membership):
         um = UpdateMembershipsScenario(self.__sharing,
-                (self.__update_memberships_callback, contact),
+                (self.__update_memberships_callback, contact_guid),
                 self._errback,
                 self._scenario,
                 self.account,
@@ -77,12 +77,12 @@ class AcceptInviteScenario(BaseScenario):
                 new_membership)
         um()
 
-    def __add_contact_callback(self, contact, memberships):
+    def __add_contact_callback(self, contact_guid, memberships):
         memberships &= ~Membership.PENDING
         memberships |= Membership.REVERSE
-        self.callback(contact, memberships)
+        self.callback(contact_guid, memberships)
 
-    def __update_memberships_callback(self, memberships, contact):
+    def __update_memberships_callback(self, memberships, contact_guid):
         memberships &= ~Membership.PENDING
         memberships |= Membership.REVERSE
-        self.callback(contact, memberships)
+        self.callback(contact_guid, memberships)
@@ -19,7 +19,6 @@
 
 from papyon.service.AddressBook.scenario.base import BaseScenario
 from papyon.service.AddressBook.scenario.base import Scenario
-from contact_find import FindContactScenario
 
 from papyon.service.AddressBook.constants import *
 from papyon.service.description.AB.constants import ContactEmailType
@@ -36,7 +35,8 @@ class MessengerContactAddScenario(BaseScenario):
                  contact_info={},
                  invite_display_name='',
                  invite_message=''):
-        """Adds a messenger contact and updates the address book.
+        """Adds a messenger contact, the callback is given the id of the
+        new contact and its memberships.
 
             @param ab: the address book service
             @param callback: tuple(callable, *args)
@@ -87,15 +87,7 @@ class MessengerContactAddScenario(BaseScenario):
         if self.auto_manage_allow_list and not allowed_or_blocked:
             self.memberships |= Membership.ALLOW
 
-        fc = FindContactScenario(self._ab,
-                (self.__find_contact_callback,),
-                self._errback,
-                self._scenario)
-        fc.id = contact_guid
-        fc()
-
-    def __find_contact_callback(self, contact):
-        self.callback(contact, self.memberships)
+        self.callback(contact_guid, self.memberships)
 
     def __contact_add_errback(self, error_code):
         errcode = AddressBookError.UNKNOWN
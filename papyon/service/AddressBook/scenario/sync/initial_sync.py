@@ -25,6 +25,11 @@ class InitialSyncScenario(BaseScenario):
     def __init__(self, address_book, membership, callback, errback, account=''):
         """Synchronizes the membership content when logging in.
 
+            When deltas_only is set, only the changes made since the last
+            synchronization are requested. If the server refuses to send
+            them, a full synchronization is made instead and deltas_only
+            is reset, the callback must then discard the previous content.
+
             @param membership: the address book service
             @param callback: tuple(callable, *args)
             @param errback: tuple(callable, *args)
@@ -36,30 +41,46 @@ class InitialSyncScenario(BaseScenario):
         self.__membership_response = None
         self.__ab_response = None
         self.__creating_ab = False
+        self.__attempt = 0
 
         self.__account = account
+        self.deltas_only = False
 
     def execute(self):
-        self.__address_book.FindAll((self.__ab_findall_callback,),
-                                    (self.__ab_findall_errback,),
-                                    self._scenario, False)
-        self.__membership.FindMembership((self.__membership_findall_callback,),
-                                         (self.__membership_findall_errback,),
-                                         self._scenario, ['Messenger'],
-                                         False)
-
-    def __membership_findall_callback(self, result):
+        # the responses of a previous attempt are ignored
+        self.__attempt += 1
+        self.__membership_response = None
+        self.__ab_response = None
+        attempt, deltas_only = self.__attempt, self.deltas_only
+        self.__address_book.FindAll(
+                (self.__ab_findall_callback, attempt),
+                (self.__ab_findall_errback, attempt),
+                self._scenario, deltas_only)
+        self.__membership.FindMembership(
+                (self.__membership_findall_callback, attempt),
+                (self.__membership_findall_errback, attempt),
+                self._scenario, ['Messenger'], deltas_only)
+
+    def __membership_findall_callback(self, result, attempt):
+        if attempt != self.__attempt:
+            return
         self.__membership_response = result
         self.__sync_callback()
 
-    def __ab_findall_callback(self, result):
+    def __ab_findall_callback(self, result, attempt):
+        if attempt != self.__attempt:
+            return
         self.__ab_response = result
         self.__sync_callback()
 
-    def __membership_findall_errback(self, error_code):
+    def __membership_findall_errback(self, error_code, attempt):
+        if attempt != self.__attempt:
+            return
         self.__sync_errback(error_code)
 
-    def __ab_findall_errback(self, error_code):
+    def __ab_findall_errback(self, error_code, attempt):
+        if attempt != self.__attempt:
+            return
         self.__sync_errback(error_code)
 
     def __sync_callback(self):
@@ -70,6 +91,10 @@ class InitialSyncScenario(BaseScenario):
             self.__ab_response = None
 
     def __sync_errback(self, error_code):
+        if error_code == 'FullSyncRequired' and self.deltas_only:
+            self.deltas_only = False
+            self.execute()
+            return
         if error_code == 'ABDoesNotExist':
             if not self.__creating_ab:
                 self.__creating_ab = True
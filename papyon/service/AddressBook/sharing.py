@@ -22,12 +22,14 @@ from papyon.service.SOAPService import SOAPService
 from papyon.util.element_tree import XMLTYPE
 from papyon.service.SingleSignOn import *
 from papyon.service.AddressBook.common import *
+from papyon.service.AddressBook.constants import *
 
 __all__ = ['Sharing']
 
 class Member(object):
     def __init__(self, member):
         self.Roles = {}
+        self.DeletedRoles = {}
         self.MembershipId = member.findtext("./ab:MembershipId")
         self.Account = self.MembershipId
         self.Type = member.findtext("./ab:Type")
@@ -126,12 +128,16 @@ class ServiceMember(Member):
 
 
 class Sharing(SOAPService):
+    PIPELINED_METHODS = ('FindMembership',)
+    PIPELINE_DEPTH = 4
+    STREAMED_METHODS = {'FindMembership': ('ab:MemberRole', 'ab:Member')}
+
     def __init__(self, sso, proxies=None):
         self._sso = sso
         self._tokens = {}
         SOAPService.__init__(self, "Sharing", proxies)
 
-        self._last_changes = "0001-01-01T00:00:00.0000000-08:00"
+        self._last_changes = DEFAULT_TIMESTAMP
 
     def FindMembership(self, callback, errback, scenario, services, deltas_only):
         """Requests the membership list.
@@ -148,21 +154,34 @@ class Sharing(SOAPService):
         self.__soap_request(self._service.FindMembership, scenario,
                 (services, deltas_only, self._last_changes), callback, errback)
 
+    def _ParseFindMembershipElement(self, element):
+        # each list of members follows the role they have
+        if element.tag.endswith("}MemberRole"):
+            return element.text
+        return Member.new(element)
+
     def _HandleFindMembershipResponse(self, callback, errback, response, user_data):
+        response, parsed = response
         if response[1] is not None:
             self._last_changes = response[1]
 
         memberships = {}
-        for role, members in response[0].iteritems():
-            for member in members:
-                membership_id = XMLTYPE.int.decode(member.find("./ab:MembershipId").text)
-                member_obj = Member.new(member)
-                member_id = hash(member_obj)
-                if member_id in memberships:
-                    memberships[member_id].Roles[role] = membership_id
-                else:
-                    member_obj.Roles[role] = membership_id
-                    memberships[member_id] = member_obj
+        role = None
+        for member_obj in parsed:
+            if isinstance(member_obj, basestring):
+                role = member_obj
+                continue
+            membership_id = XMLTYPE.int.decode(member_obj.MembershipId)
+            member_id = hash(member_obj)
+            if member_id in memberships:
+                target = memberships[member_id]
+            else:
+                target = memberships[member_id] = member_obj
+            # the deltas also list the roles the member was removed from
+            if member_obj.Deleted:
+                target.DeletedRoles[role] = membership_id
+            else:
+                target.Roles[role] = membership_id
         callback[0](memberships.values(), *callback[1:])
 
     def AddMember(self, callback, errback, scenario, member_role, type,
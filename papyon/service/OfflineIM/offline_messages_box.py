@@ -263,8 +263,7 @@ class OfflineMessagesBox(gobject.GObject):
 
             try:
                 sender = self._client.address_book.contacts.\
-                    search_by_account(account).\
-                    search_by_network_id(network_id)[0]
+                    lookup(network_id, account)[0]
             except IndexError:
                 sender = None
 
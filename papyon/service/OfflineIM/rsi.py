@@ -31,6 +31,9 @@ __all__ = ['RSI']
 logger = logging.getLogger('papyon.service')
 
 class RSI(SOAPService):
+    PIPELINED_METHODS = ('GetMetadata', 'GetMessage')
+    PIPELINE_DEPTH = 4
+
     def __init__(self, sso, proxies=None):
         self._sso = sso
         self._tokens = {}
@@ -23,6 +23,7 @@ import description
 from SOAPUtils import *
 
 import papyon.gnet.protocol
+from papyon.gnet.eventloop import get_event_loop
 import papyon.util.element_tree as ElementTree
 import papyon.util.string_io as StringIO
 import re
@@ -136,6 +137,9 @@ class SOAPResponse(ElementTree.XMLResponse):
             and self.tree is not None
 
     def _parse(self, data):
+        if ElementTree.iselement(data):
+            # already parsed by a SOAPResponseParser
+            return data
         events = ("start", "end", "start-ns", "end-ns")
         ns = []
         data = StringIO.StringIO(data)
@@ -150,13 +154,110 @@ class SOAPResponse(ElementTree.XMLResponse):
         data.close()
         return context.root
 
+class SOAPResponseParser(object):
+    """Parses a SOAP response a few elements at a time, yielding to the
+    main loop in between.
+
+    Each element named in tags is handed to element_handler as soon as it
+    is complete, and is then removed from the tree, so that large lists
+    never exist as a whole tree. Once the document is parsed, what is
+    left of it is given to response_handler as a L{SOAPResponse}. If the
+    document is malformed or element_handler fails, error_handler is
+    called with the exception instead."""
+
+    BATCH_SIZE = 100
+
+    def __init__(self, data, tags, element_handler, response_handler,
+            error_handler):
+        """Initializer
+
+            @param data: the SOAP document
+            @type data: string
+
+            @param tags: the elements handed to element_handler, using the
+                namespace shorthands of L{SOAPResponse}, "ab:Contact"
+            @type tags: sequence of strings
+
+            @param element_handler: called with each of those elements
+            @type element_handler: callable(element)
+
+            @param response_handler: called with the remaining response
+            @type response_handler: callable(L{SOAPResponse})
+
+            @param error_handler: called when the response can't be parsed
+            @type error_handler: callable(Exception)"""
+        self._tags = set()
+        for tag in tags:
+            shorthand, name = tag.split(":", 1)
+            self._tags.add("{%s}%s" % (SOAPResponse.NS_SHORTHANDS[shorthand],
+                name))
+        self._element_handler = element_handler
+        self._response_handler = response_handler
+        self._error_handler = error_handler
+        self._events = ElementTree.iterparse(StringIO.StringIO(data),
+                events=("start", "end", "start-ns", "end-ns"))
+        self._ns = []
+        self._parents = []
+        self._root = None
+
+    def start(self):
+        if self._step():
+            get_event_loop().idle_add(self._step)
+
+    def _step(self):
+        handled = 0
+        try:
+            for event, elem in self._events:
+                if event == "start":
+                    elem.set("(xmlns)", tuple(self._ns))
+                    if self._root is None:
+                        self._root = elem
+                    self._parents.append(elem)
+                elif event == "end":
+                    self._parents.pop()
+                    if elem.tag not in self._tags:
+                        continue
+                    self._element_handler(ElementTree._Element(elem,
+                        SOAPResponse.NS_SHORTHANDS))
+                    if self._parents:
+                        self._parents[-1].remove(elem)
+                    handled += 1
+                    if handled == self.BATCH_SIZE:
+                        return True
+                elif event == "start-ns":
+                    self._ns.append(elem)
+                else:
+                    self._ns.pop()
+        except Exception, error:
+            self._events = None
+            self._error_handler(error)
+            return False
+        self._events = None
+        self._response_handler(SOAPResponse(self._root))
+        return False
+
+
 class SOAPService(object):
+    """Base class of the SOAP services
+
+        @cvar PIPELINED_METHODS: names of the methods without side effects,
+            their requests can be pipelined on a single connection
+        @cvar PIPELINE_DEPTH: maximum number of pipelined requests
+        @cvar STREAMED_METHODS: name of a method => elements of its response
+            parsed one at a time by _Parse<name>Element while the main loop
+            keeps running, the handler of the response is then given the
+            (response, [parsed element, ...]) tuple"""
+
+    PIPELINED_METHODS = ()
+    PIPELINE_DEPTH = 1
+    STREAMED_METHODS = {}
 
     def __init__(self, name, proxies=None):
         self._name = name
         self._service = getattr(description, self._name)
         self._active_transports = {}
         self._proxies = proxies or {}
+        self._pool = papyon.gnet.protocol.HTTPConnectionPool.default()
 
     def _send_request(self, name, url, soap_header, soap_body, soap_action,
             callback, errback=None, transport_headers={}, user_data=None):
@@ -176,7 +277,8 @@ class SOAPService(object):
 
         transport = self._get_transport(name, scheme, host, port,
                 callback, errback, user_data)
-        transport.request(resource, http_headers, request, 'POST')
+        transport.request(resource, http_headers, request, 'POST',
+                idempotent=(name in self.PIPELINED_METHODS))
 
     def _soap_request(self, method, header_args, body_args, callback, errback,
             user_data=None):
@@ -193,9 +295,33 @@ class SOAPService(object):
 
     def _response_handler(self, transport, http_response):
         logger.debug("<<< " + unicode(http_response))
-        soap_response = SOAPResponse(http_response.body)
+        logger.debug("%s response body: %d bytes received, %d bytes decoded" % \
+                (self._name, http_response.encoded_size,
+                    http_response.decoded_size))
         request_id, callback, errback, user_data = self._unref_transport(transport)
 
+        if request_id in self.STREAMED_METHODS:
+            parse_element = getattr(self, "_Parse" + request_id + "Element")
+            parsed = []
+            def element_handler(element):
+                parsed.append(parse_element(element))
+            def response_handler(soap_response):
+                self._dispatch_response(request_id, soap_response, callback,
+                        errback, user_data, parsed)
+            def error_handler(error):
+                self._HandleParseError(request_id, callback, errback, error,
+                        user_data)
+            parser = SOAPResponseParser(http_response.body,
+                    self.STREAMED_METHODS[request_id],
+                    element_handler, response_handler, error_handler)
+            parser.start()
+        else:
+            soap_response = SOAPResponse(http_response.body)
+            self._dispatch_response(request_id, soap_response, callback,
+                    errback, user_data)
+
+    def _dispatch_response(self, request_id, soap_response, callback,
+            errback, user_data, parsed=None):
         if not soap_response.is_valid():
             logger.warning("Invalid SOAP Response")
             return #FIXME: propagate the error up
@@ -206,6 +332,8 @@ class SOAPService(object):
                     None)
             method = getattr(self._service, request_id)
             response = method.process_response(soap_response)
+            if parsed is not None:
+                response = (response, parsed)
 
             if handler is not None:
                 handler(callback, errback, response, user_data)
@@ -228,7 +356,8 @@ class SOAPService(object):
     def _error_handler(self, transport, error):
         logger.warning("Transport Error :" + str(error))
         request_id, callback, errback, user_data = self._unref_transport(transport)
-        return request_id, callback, errback #FIXME: do something sensible here
+        if errback is not None:
+            errback[0](error, *errback[1:])
 
     # Handlers
     def _HandleSOAPFault(self, request_id, callback, errback,
@@ -239,6 +368,13 @@ class SOAPService(object):
             response, user_data):
         logger.warning("Unhandled Response to %s" % request_id)
 
+    def _HandleParseError(self, request_id, callback, errback,
+            error, user_data):
+        logger.warning("Unable to parse the response to %s: %s" % \
+                (request_id, error))
+        if errback is not None:
+            errback[0](error, *errback[1:])
+
     # Transport management
     def _get_transport(self, request_id, scheme, host, port,
             callback, errback, user_data):
@@ -249,8 +385,8 @@ class SOAPService(object):
             trans[1].append((request_id, callback, errback, user_data))
         else:
             proxy = self._proxies.get(scheme, None)
-            transport = papyon.gnet.protocol.ProtocolFactory(scheme,
-                    host, port, proxy=proxy)
+            transport = self._pool.acquire(scheme, host, port, proxy)
+            transport.pipeline_depth = self.PIPELINE_DEPTH
             handler_id = [transport.connect("response-received",
                     self._response_handler),
                 transport.connect("request-sent", self._request_handler),
@@ -271,6 +407,7 @@ class SOAPService(object):
                 for handle in trans[2]:
                     transport.disconnect(handle)
                 del self._active_transports[key]
+                self._pool.release(transport)
                 return response
         return None
 
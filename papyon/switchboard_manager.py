@@ -28,6 +28,7 @@ import gobject
 import weakref
 
 import papyon.msnp as msnp
+from papyon.gnet.eventloop import get_event_loop
 from papyon.transport import ServerType
 from papyon.util.weak import WeakSet
 from papyon.event import ConversationErrorType, ContactInviteError, MessageError
@@ -79,18 +80,21 @@ class SwitchboardClient(object):
                 lambda sb, contact: self.__on_user_invitation_failed(contact))
         self.switchboard.connect("message-undelivered",
                 lambda sb, command: self.__on_message_undelivered(command))
+        self.switchboard.connect("writable",
+                lambda sb: self._process_pending_queues())
         logger.info("New switchboard attached")
         def process_pending_queues():
             self._process_pending_queues()
             return False
-        gobject.idle_add(process_pending_queues)
+        get_event_loop().idle_add(process_pending_queues)
 
     _switchboard = property(__get_switchboard, __set_switchboard)
     switchboard = property(__get_switchboard)
 
     # protected
     def _send_message(self, content_type, body, headers={},
-            ack=msnp.MessageAcknowledgement.HALF, callback=None, cb_args=()):
+            ack=msnp.MessageAcknowledgement.HALF, callback=None, cb_args=(),
+            priority=None):
         message = msnp.Message(self._client.profile)
         message.add_header('MIME-Version', '1.0')
         message.content_type = content_type
@@ -98,7 +102,8 @@ class SwitchboardClient(object):
             message.add_header(key, value)
         message.body = body
 
-        self._pending_messages.append((message, ack, callback, cb_args))
+        self._pending_messages.append((message, ack, callback, cb_args,
+            priority))
         self._process_pending_queues()
 
     def _invite_user(self, contact):
@@ -168,9 +173,14 @@ class SwitchboardClient(object):
         self._pending_invites = set()
 
         if not self.switchboard.inviting:
-            for message, ack, callback, cb_args in self._pending_messages:
-                self.switchboard.send_message(message, ack, callback, cb_args)
-            self._pending_messages = []
+            # stop when the socket is saturated, the remaining messages are
+            # sent once the switchboard becomes writable again
+            while len(self._pending_messages) > 0 and \
+                    not self.switchboard.congested:
+                message, ack, callback, cb_args, priority = \
+                        self._pending_messages.pop(0)
+                self.switchboard.send_message(message, ack, callback, cb_args,
+                        priority)
 
     def _request_switchboard(self):
         if (self.switchboard is not None) and \
@@ -32,6 +32,8 @@ G{classtree BaseTransport}"""
 
 import gnet
 import gnet.protocol
+from gnet.eventloop import get_event_loop
+from papyon.util.trace import trace
 import msnp
 
 import logging
@@ -90,6 +92,14 @@ class BaseTransport(gobject.GObject):
             transmitted to the server
         @type command-sent: FIXME
 
+        @cvar congested: signal emitted when too much data is waiting to be
+            sent, producers should hold back until the writable signal
+        @type congested: ()
+
+        @cvar writable: signal emitted when the waiting data went back
+            below the low watermark
+        @type writable: ()
+
         @undocumented: __gsignals__"""
     
     __gsignals__ = {
@@ -116,6 +126,14 @@ class BaseTransport(gobject.GObject):
             "command-sent": (gobject.SIGNAL_RUN_FIRST,
                 gobject.TYPE_NONE,
                 (object,)),
+
+            "congested": (gobject.SIGNAL_RUN_FIRST,
+                gobject.TYPE_NONE,
+                ()),
+
+            "writable": (gobject.SIGNAL_RUN_FIRST,
+                gobject.TYPE_NONE,
+                ()),
             }   
 
     def __init__(self, server, server_type=ServerType.NOTIFICATION, proxies={}):
@@ -140,6 +158,25 @@ class BaseTransport(gobject.GObject):
     def transaction_id(self):
         return self._transaction_id
 
+    @property
+    def congested(self):
+        """True while the transport asks producers to hold back"""
+        return False
+
+    @property
+    def endpoint(self):
+        """The MSN server at the other end of the transport, it differs
+        from L{server} when going through a gateway"""
+        return self.server
+
+    def set_endpoint(self, server):
+        """Changes the MSN server used by the next call to
+        L{establish_connection}
+
+            @param server: the server to connect to
+            @type server: tuple(host, port)"""
+        self.server = server
+
     # Connection
     def establish_connection(self):
         """Connect to the server server"""
@@ -158,7 +195,8 @@ class BaseTransport(gobject.GObject):
         raise NotImplementedError
 
     # Command Sending
-    def send_command(self, command, increment=True, callback=None, *cb_args):
+    def send_command(self, command, increment=True, callback=None, *cb_args,
+            **kwargs):
         """
         Sends a L{msnp.Command} to the server.
 
@@ -174,11 +212,15 @@ class BaseTransport(gobject.GObject):
 
             @param cb_args: callback arguments
             @type cb_args: Any, ...
+
+            @keyword priority: a L{gnet.IoPriority} used to send the command
+                ahead of less urgent traffic, by default it depends on the
+                command name
         """
         raise NotImplementedError
 
     def send_command_ex(self, command, arguments=(), payload=None, 
-            increment=True, callback=None, *cb_args):
+            increment=True, callback=None, *cb_args, **kwargs):
         """
         Builds a command object then send it to the server.
         
@@ -201,10 +243,12 @@ class BaseTransport(gobject.GObject):
 
             @param cb_args: callback arguments
             @type cb_args: tuple
+
+            @keyword priority: see L{send_command}
         """
         cmd = msnp.Command()
         cmd.build(command, self._transaction_id, payload, *arguments)
-        self.send_command(cmd, increment, callback, *cb_args)
+        self.send_command(cmd, increment, callback, *cb_args, **kwargs)
         return cmd
 
     def enable_ping(self):
@@ -222,12 +266,21 @@ gobject.type_register(BaseTransport)
 class DirectConnection(BaseTransport):
     """Implements a direct connection to the net using TCP/1863"""
 
+    # commands that must not wait behind bulk traffic, every other command
+    # is sent with the normal priority
+    COMMAND_PRIORITIES = {
+            'PNG': gnet.IoPriority.HIGH,
+            'QRY': gnet.IoPriority.HIGH,
+            }
+
     def __init__(self, server, server_type=ServerType.NOTIFICATION, proxies={}):
         BaseTransport.__init__(self, server, server_type, proxies)
 
-        transport = gnet.io.TCPClient(server[0], server[1])
+        transport = self._create_client(server)
         transport.connect("notify::status", self.__on_status_change)
         transport.connect("error", self.__on_error)
+        transport.connect("congested", lambda t: self.emit("congested"))
+        transport.connect("writable", lambda t: self.emit("writable"))
 
         receiver = gnet.parser.DelimiterParser(transport)
         receiver.connect("received", self.__on_received)
@@ -242,22 +295,37 @@ class DirectConnection(BaseTransport):
 
     __init__.__doc__ = BaseTransport.__init__.__doc__
 
+    def _create_client(self, server):
+        """Creates the L{gnet.io.AbstractClient} carrying the connection"""
+        return gnet.io.TCPClient(server[0], server[1])
+
     ### public commands
 
     @property
     def sockname(self):
         return self._transport.sockname
 
+    @property
+    def congested(self):
+        return self._transport.congested
+
+    def set_endpoint(self, server):
+        self._transport.set_property("host", server[0])
+        self._transport.set_property("port", server[1])
+        self.server = server
+
     def establish_connection(self):
         logger.debug('<-> Connecting to %s:%d' % self.server )
+        # drop what was left of the previous connection, if any
+        self._receiver.flush()
+        self._receiver.delimiter = "\r\n"
+        self.__pending_chunk = None
         self._transport.open()
 
     def lose_connection(self):
         self.__resetting = False
         self._transport.close()
-        if self.__png_timeout is not None:
-            gobject.source_remove(self.__png_timeout)
-            self.__png_timeout = None
+        self.__stop_ping()
 
     def reset_connection(self, server=None):
         if server:
@@ -265,16 +333,20 @@ class DirectConnection(BaseTransport):
             self._transport.set_property("port", server[1])
             self.server = server
         self.__resetting = True
-        if self.__png_timeout is not None:
-            gobject.source_remove(self.__png_timeout)
-            self.__png_timeout = None
+        self.__stop_ping()
         self._transport.close()
         self._transport.open()
 
-    def send_command(self, command, increment=True, callback=None, *cb_args):
-        logger.debug('>>> ' + unicode(command))
+    def send_command(self, command, increment=True, callback=None, *cb_args,
+            **kwargs):
+        trace(logger, '>>> ', command)
+        priority = kwargs.get('priority', None)
+        if priority is None:
+            priority = self.COMMAND_PRIORITIES.get(command.name,
+                    gnet.IoPriority.NORMAL)
         our_cb_args = (command, callback, cb_args)
-        self._transport.send(str(command), self.__on_command_sent, *our_cb_args)
+        self._transport.send(str(command), self.__on_command_sent,
+                *our_cb_args, **{'priority': priority})
         if increment:
             self._increment_transaction_id()
 
@@ -290,9 +362,15 @@ class DirectConnection(BaseTransport):
         if user_callback:
             user_callback(*user_cb_args)
 
+    def __stop_ping(self):
+        if self.__png_timeout is not None:
+            get_event_loop().source_remove(self.__png_timeout)
+            self.__png_timeout = None
+
     def __handle_ping_reply(self, command):
         timeout = int(command.arguments[0])
-        self.__png_timeout = gobject.timeout_add(timeout * 1000, self.enable_ping)
+        self.__stop_ping()
+        self.__png_timeout = get_event_loop().timeout_add(timeout * 1000, self.enable_ping)
 
     ### callbacks
     def __on_status_change(self, transport, param):
@@ -303,6 +381,8 @@ class DirectConnection(BaseTransport):
                 self.__resetting = False
             self.emit("connection-success")
         elif status == gnet.IoStatus.CLOSED:
+            # the ping must not outlive the connection
+            self.__stop_ping()
             if not self.__resetting and not self.__error:
                 self.emit("connection-lost", None)
             self.__error = False
@@ -310,6 +390,7 @@ class DirectConnection(BaseTransport):
     def __on_error(self, transport, reason):
         status = transport.get_property("status")
         self.__error = True
+        self.__stop_ping()
         if status == gnet.IoStatus.OPEN:
             self.emit("connection-lost", reason)
         else:
@@ -334,7 +415,7 @@ class DirectConnection(BaseTransport):
                     self.__pending_chunk = chunk
                     self._receiver.delimiter = payload_len
                     return
-        logger.debug('<<< ' + unicode(cmd))
+        trace(logger, '<<< ', cmd)
         if cmd.name == 'QNG':
             self.__handle_ping_reply(cmd)
         else:
@@ -345,7 +426,17 @@ gobject.type_register(DirectConnection)
 class HTTPPollConnection(BaseTransport):
     """Implements an HTTP polling transport, basically it encapsulates the MSNP
     commands into an HTTP request, and receive responses by polling a specific
-    url"""
+    url.
+
+    The commands queued while a request is in progress are sent together in
+    the body of the next request. The server is polled every
+    L{MIN_POLL_INTERVAL} ms while there is traffic, and the interval doubles
+    up to L{MAX_POLL_INTERVAL} ms while the connection is idle."""
+
+    MIN_POLL_INTERVAL = 1000
+    MAX_POLL_INTERVAL = 10000
+    MAX_BATCH_SIZE = 16384
+
     def __init__(self, server, server_type=ServerType.NOTIFICATION, proxies={}):
         self._target_server = server
         server = ("gateway.messenger.hotmail.com", 80)
@@ -353,8 +444,12 @@ class HTTPPollConnection(BaseTransport):
         self._setup_transport()
         
         self._command_queue = []
+        self._sent_commands = []
         self._waiting_for_response = False # are we waiting for a response
         self._session_id = None
+        self._polling = False
+        self._polling_source_id = None
+        self._poll_interval = self.MIN_POLL_INTERVAL
         self.__error = False
 
     def _setup_transport(self):
@@ -371,29 +466,58 @@ class HTTPPollConnection(BaseTransport):
 
     def establish_connection(self):
         logger.debug('<-> Connecting to %s:%d' % self.server)
-        self._polling_source_id = gobject.timeout_add(5000, self._poll)
+        self._polling = True
+        self._poll_interval = self.MIN_POLL_INTERVAL
+        self._schedule_poll()
         self.emit("connection-success")
 
     def lose_connection(self):
-        gobject.source_remove(self._polling_source_id)
-        del self._polling_source_id
+        self._polling = False
+        self._cancel_poll()
         if not self.__error:
             self.emit("connection-lost", None)
         self.__error = False
 
+    @property
+    def endpoint(self):
+        return self._target_server
+
+    def set_endpoint(self, server):
+        self._target_server = server
+        self._session_id = None
+
     def reset_connection(self, server=None):
         if server:
             self._target_server = server
         self.emit("connection-reset")
 
-    def send_command(self, command, increment=True, callback=None, *cb_args):
-        self._command_queue.append((command, increment, callback, cb_args))
+    def send_command(self, command, increment=True, callback=None, *cb_args,
+            **kwargs):
+        # commands are batched in the order they are sent, the priority
+        # does not apply
+        self._command_queue.append((command, callback, cb_args))
+        if increment:
+            self._increment_transaction_id()
+        self._poll_interval = self.MIN_POLL_INTERVAL
         self._send_command()
 
-    def _send_command(self):
-        if len(self._command_queue) == 0 or self._waiting_for_response:
+    def _send_command(self, poll=False):
+        if self._waiting_for_response:
+            return
+        if len(self._command_queue) == 0 and not poll:
             return
-        command, increment = self._command_queue[0][0:2]
+
+        batch = []
+        size = 0
+        for command, callback, cb_args in self._command_queue:
+            str_command = str(command)
+            if len(batch) > 0 and size + len(str_command) > self.MAX_BATCH_SIZE:
+                break
+            batch.append(str_command)
+            size += len(str_command)
+        self._sent_commands = self._command_queue[:len(batch)]
+        del self._command_queue[:len(batch)]
+
         resource = "/gateway/gateway.dll"
         headers = {
             "Accept": "*/*",
@@ -405,29 +529,35 @@ class HTTPPollConnection(BaseTransport):
             "Proxy-Connection": "Keep-Alive"
         }
         
-        str_command = str(command)
         if self._session_id is None:            
             resource += "?Action=open&Server=%s&IP=%s" % (self.server_type,
                     self._target_server[0])
-        elif command == None:# Polling the server for queued messages
+        elif len(batch) == 0: # Polling the server for queued messages
             resource += "?Action=poll&SessionID=%s" % self._session_id 
-            str_command = ""
         else:
             resource += "?SessionID=%s" % self._session_id
 
-        self._transport.request(resource, headers, str_command, "POST")
+        self._transport.request(resource, headers, "".join(batch), "POST")
         self._waiting_for_response = True
         
-        if command is not None:
-            logger.debug('>>> ' + unicode(command))
-        
-        if increment:
-            self._increment_transaction_id()
-        
+        for command, callback, cb_args in self._sent_commands:
+            trace(logger, '>>> ', command)
+
+    def _schedule_poll(self):
+        self._cancel_poll()
+        self._polling_source_id = get_event_loop().timeout_add(
+                self._poll_interval, self._poll)
+
+    def _cancel_poll(self):
+        if self._polling_source_id is not None:
+            get_event_loop().source_remove(self._polling_source_id)
+            self._polling_source_id = None
+
     def _poll(self):
+        self._polling_source_id = None
         if not self._waiting_for_response:
-            self.send_command(None)
-        return True
+            self._send_command(True)
+        return False
     
     def __on_error(self, transport, reason):
         self.__error = True
@@ -453,16 +583,22 @@ class HTTPPollConnection(BaseTransport):
         self._waiting_for_response = False
 
         commands = http_response.body
+        if len(commands) == 0 and len(self._command_queue) == 0:
+            self._poll_interval = min(self._poll_interval * 2,
+                    self.MAX_POLL_INTERVAL)
+        else:
+            self._poll_interval = self.MIN_POLL_INTERVAL
         while len(commands) != 0:
             commands = self.__extract_command(commands)
         
         self._send_command()
+        if self._polling:
+            self._schedule_poll()
 
     def __on_sent(self, transport, http_request):
-        if len(self._command_queue) == 0:
-            return
-        command, increment, callback, cb_args = self._command_queue.pop(0)
-        if command is not None:
+        sent_commands = self._sent_commands
+        self._sent_commands = []
+        for command, callback, cb_args in sent_commands:
             if callback:
                 callback(*cb_args)
             self.emit("command-sent", command)
@@ -479,11 +615,11 @@ class HTTPPollConnection(BaseTransport):
                 payload_len = 0
             if payload_len > 0:
                 cmd.payload = rest[:payload_len].strip()
-            logger.debug('<<< ' + unicode(cmd))
+            trace(logger, '<<< ', cmd)
             self.emit("command-received", cmd)
             return rest[payload_len:]
         else:
-            logger.debug('<<< ' + unicode(cmd))
+            trace(logger, '<<< ', cmd)
             self.emit("command-received", cmd)
             return rest
 
@@ -18,29 +18,23 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
-import struct
+import binascii
+import re
 
 """Utility functions used for debug output processing"""
 
-def escape_string(string):
-    result = ""
-    for c in string:
-        v = ord(c)
-        if (v >= 32 and v <= 127) or c in ("\t", "\r", "\n"):
-            result += c
-        else:
-            result += "\\x%02x" % ord(c)
+_UNPRINTABLE = re.compile('[^\t\r\n\x20-\x7f]')
 
-    return result
+def _escape_char(match):
+    return "\\x%02x" % ord(match.group())
 
-def hexify_string(string):
-    result = ""
-    for i, c in enumerate(string):
-        if result:
-            if i % 16 != 0:
-                result += " "
-            else:
-                result += "\r\n"
-        result += "%02x" % ord(c)
-    return result
+def escape_string(string):
+    return _UNPRINTABLE.sub(_escape_char, string)
 
+def hexify_string(string):
+    hex = binascii.hexlify(string)
+    lines = []
+    for start in xrange(0, len(hex), 32):
+        line = hex[start:start + 32]
+        lines.append(" ".join([line[i:i + 2] for i in xrange(0, len(line), 2)]))
+    return "\r\n".join(lines)
@@ -23,8 +23,6 @@ import sys
 import warnings
 import time
 
-import gobject
-
 
 def decorator(function):
     """decorator to be used on decorators, it preserves the docstring and
@@ -80,10 +78,12 @@ def async(func):
     """Make a function mainloop friendly. the function will be called at the
     next mainloop idle state."""
     def new_function(*args, **kwargs):
+        # imported here since papyon.gnet itself uses these decorators
+        from papyon.gnet.eventloop import get_event_loop
         def async_function():
             func(*args, **kwargs)
             return False
-        gobject.idle_add(async_function)
+        get_event_loop().idle_add(async_function)
     return new_function
 
 class throttled(object):
@@ -113,7 +113,9 @@ class throttled(object):
                 self._queue.append((func, args, kwargs))
                 last_call_delta = now - self._last_call_time
                 process_queue_timeout = int(self._min_delay * len(self._queue) - last_call_delta)
-                gobject.timeout_add(process_queue_timeout, process_queue)
+                from papyon.gnet.eventloop import get_event_loop
+                get_event_loop().timeout_add(process_queue_timeout,
+                        process_queue)
 
         new_function.__name__ = func.__name__
         new_function.__doc__ = func.__doc__
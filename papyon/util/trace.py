@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Protocol tracing.
+
+L{trace} only formats a command when its logger would output it, the
+pretty printing of the commands is expensive and the transports trace
+every command.
+
+L{TrafficCapture} records the raw traffic of every gnet connection in a
+compact file, it can be read back with L{read_capture}. The file starts
+with L{TrafficCapture.MAGIC}, followed by records made of a header packed
+as L{TrafficCapture.RECORD} (kind, stream, timestamp, length) and of
+length bytes of data. An OPEN record carries the "host:port" name of the
+stream."""
+
+import logging
+import struct
+import time
+import weakref
+
+__all__ = ['trace', 'TrafficCapture', 'CaptureRecord', 'read_capture']
+
+def trace(logger, prefix, command, level=logging.DEBUG):
+    """Logs prefix followed by the pretty printed command, the command is
+    only formatted if the logger is enabled for level"""
+    if logger.isEnabledFor(level):
+        logger.log(level, prefix + unicode(command))
+
+
+class CaptureRecord(object):
+    OPEN = 0
+    RECEIVED = 1
+    SENT = 2
+    CLOSE = 3
+
+
+class TrafficCapture(object):
+    """Writes the traffic of the gnet connections to a capture file, only
+    one capture can be active at a time.
+
+        >>> capture = TrafficCapture.start("/tmp/papyon.cap")
+        >>> # ... login, chat ...
+        >>> capture.stop()"""
+
+    MAGIC = "PAPYCAP1"
+    RECORD = struct.Struct(">BHdI")
+
+    _current = None
+
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        self._file.write(self.MAGIC)
+        self._streams = weakref.WeakKeyDictionary() # connection => stream id
+        self._next_stream = 0
+
+    @staticmethod
+    def start(path):
+        """Starts capturing the traffic to the file at path, replacing the
+        capture in progress if any"""
+        if TrafficCapture._current is not None:
+            TrafficCapture._current.stop()
+        TrafficCapture._current = TrafficCapture(path)
+        return TrafficCapture._current
+
+    @staticmethod
+    def current():
+        """Returns the active capture, or None"""
+        return TrafficCapture._current
+
+    def stop(self):
+        if TrafficCapture._current is self:
+            TrafficCapture._current = None
+        self._file.close()
+
+    def received(self, connection, data):
+        self._write(CaptureRecord.RECEIVED, self._stream(connection), data)
+
+    def sent(self, connection, data):
+        self._write(CaptureRecord.SENT, self._stream(connection), data)
+
+    def closed(self, connection):
+        stream = self._streams.pop(connection, None)
+        if stream is not None:
+            self._write(CaptureRecord.CLOSE, stream, "")
+
+    def _stream(self, connection):
+        stream = self._streams.get(connection, None)
+        if stream is None:
+            stream = self._next_stream
+            self._next_stream = (stream + 1) & 0xffff
+            self._streams[connection] = stream
+            self._write(CaptureRecord.OPEN, stream,
+                    "%s:%d" % (connection.host, connection.port))
+        return stream
+
+    def _write(self, kind, stream, data):
+        self._file.write(self.RECORD.pack(kind, stream, time.time(),
+            len(data)))
+        self._file.write(data)
+
+
+def read_capture(path):
+    """Iterates over the records of a capture file
+
+        @return: tuples (kind, stream, timestamp, data) where kind is a
+            L{CaptureRecord}"""
+    capture = open(path, "rb")
+    try:
+        if capture.read(len(TrafficCapture.MAGIC)) != TrafficCapture.MAGIC:
+            raise ValueError("%s is not a papyon capture file" % path)
+        header_size = TrafficCapture.RECORD.size
+        while True:
+            header = capture.read(header_size)
+            if len(header) < header_size:
+                break
+            kind, stream, timestamp, length = \
+                    TrafficCapture.RECORD.unpack(header)
+            yield kind, stream, timestamp, capture.read(length)
+    finally:
+        capture.close()
@@ -0,0 +1,503 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+import shutil
+import sys
+import tempfile
+import unittest
+
+ACCOUNT = "papyon@hotmail.com"
+
+class FakeClient(object):
+    class profile(object):
+        account = ACCOUNT
+
+class FakeContact(object):
+    """The parts of an ABFindAll contact used by the address book"""
+    def __init__(self, id, account, display_name, groups=(), deleted=False):
+        self.Id = id
+        self.Type = "Regular"
+        self.PassportName = account
+        self.DisplayName = display_name
+        self.QuickName = ""
+        self.CID = None
+        self.IsMessengerUser = True
+        self.Emails = []
+        self.Groups = list(groups)
+        self.Deleted = deleted
+        self.contact_infos = {}
+
+class FakeGroup(object):
+    def __init__(self, id, name, deleted=False):
+        self.Id = id
+        self.Name = name
+        self.Deleted = deleted
+
+class FakeAB(object):
+    def __init__(self, results):
+        self._last_changes = DEFAULT_TIMESTAMP
+        self.results = results
+        self.requests = []
+
+    def FindAll(self, callback, errback, scenario, deltas_only):
+        self.requests.append(deltas_only)
+        result = self.results.pop(0)
+        if isinstance(result, str):
+            errback[0](result, *errback[1:])
+        else:
+            self._last_changes = "2010-01-0%dT00:00:00" % len(self.requests)
+            callback[0](result, *callback[1:])
+
+class DeferredAB(object):
+    """Adds the contacts right away, but answers the ABFindAll requests
+    only when told to"""
+    def __init__(self):
+        self._last_changes = DEFAULT_TIMESTAMP
+        self.requests = []
+
+    def ContactAdd(self, callback, errback, scenario, contact_info,
+            invite_info, auto_manage_allow_list=True):
+        callback[0]("id-" + contact_info['passport_name'], *callback[1:])
+
+    def FindAll(self, callback, errback, scenario, deltas_only):
+        self.requests.append((callback, errback, deltas_only))
+
+    def respond(self, result):
+        callback, errback, deltas_only = self.requests.pop(0)
+        if isinstance(result, str):
+            errback[0](result, *errback[1:])
+        else:
+            callback[0](result, *callback[1:])
+
+class FakeSharing(object):
+    def __init__(self, results):
+        self._last_changes = DEFAULT_TIMESTAMP
+        self.results = results
+        self.requests = []
+
+    def FindMembership(self, callback, errback, scenario, services,
+            deltas_only):
+        self.requests.append(deltas_only)
+        self._last_changes = "2010-02-0%dT00:00:00" % len(self.requests)
+        callback[0](self.results.pop(0), *callback[1:])
+
+def member(account, roles=(), deleted_roles=()):
+    result = sharing.PassportMember.__new__(sharing.PassportMember)
+    result.Account = account
+    result.DisplayName = account
+    result.Annotations = {}
+    result.Roles = dict.fromkeys(roles, 0)
+    result.DeletedRoles = dict.fromkeys(deleted_roles, 0)
+    return result
+
+
+class AddressBookStorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.group = Group("g1", "Friends")
+        self.contacts = []
+        for i in range(6):
+            network_id = (NetworkID.MSN, NetworkID.EXTERNAL)[i % 2]
+            contact = Contact("ID%d" % i, network_id,
+                    "User%d@hotmail.com" % i, "User %d" % i,
+                    memberships=Membership.FORWARD | Membership.ALLOW)
+            self.contacts.append(contact)
+        self.contacts[0]._add_group_ownership(self.group)
+        self.storage = AddressBookStorage(self.contacts)
+
+    def accounts(self, contacts):
+        return sorted([contact.account for contact in contacts])
+
+    def testSearch(self):
+        self.assertEqual(self.accounts(self.storage.search_by_account(
+            "user1@HOTMAIL.com")), ["User1@hotmail.com"])
+        self.assertEqual(self.accounts(self.storage.search(
+            network_id=NetworkID.EXTERNAL, memberships=Membership.ALLOW,
+            display_name="user 3")), ["User3@hotmail.com"])
+        self.assertEqual(self.storage.lookup(NetworkID.MSN,
+            "user1@hotmail.com"), ())
+        self.assertEqual(len(self.storage.search_by_memberships(
+            Membership.NONE)), 6)
+
+    def testChangesIndexed(self):
+        self.assertEqual(len(self.storage.search_by_id("id2")), 1)
+        contact = self.contacts[2]
+        contact._set_ids("ID7", None)
+        contact._remove_membership(Membership.ALLOW)
+        contact._add_group_ownership(self.group)
+        self.assertEqual(len(self.storage.search_by_id("id2")), 0)
+        self.assertEqual(list(self.storage.search_by_id("id7")), [contact])
+        self.assertEqual(len(self.storage.search_by_memberships(
+            Membership.ALLOW)), 5)
+        self.assertEqual(self.accounts(self.storage.search_by_groups(
+            self.group)), ["User0@hotmail.com", "User2@hotmail.com"])
+
+        contact._reset()
+        self.storage.discard(self.contacts[0])
+        self.assertEqual(self.storage.group_by_group(), {})
+        self.assertEqual(self.storage.search_by_account("user0@hotmail.com"),
+                AddressBookStorage())
+        self.storage.clear()
+        self.assertEqual(contact._storages, [])
+
+    def testChainedSearch(self):
+        msn = self.storage.search_by_network_id(NetworkID.MSN)
+        self.assertEqual(self.accounts(msn.search_by_memberships(
+            Membership.ALLOW).search_by_account("user2@hotmail.com")),
+            ["User2@hotmail.com"])
+        self.assertEqual(len(msn.search_by_account("user1@hotmail.com")), 0)
+        self.assertEqual(msn.lookup(NetworkID.MSN, "USER4@hotmail.com"),
+                (self.contacts[4],))
+        # the results use the indexes of the storage they come from
+        for i in range(200):
+            msn.search_by_account("user%d@hotmail.com" % (i % 6))
+        self.assertEqual(msn._indexes, None)
+        for contact in self.contacts:
+            self.assertEqual(len(contact._storages), 1)
+
+    def testChainedSearchAfterChanges(self):
+        msn = self.storage.search_by_network_id(NetworkID.MSN)
+        self.contacts[2]._remove_membership(Membership.ALLOW)
+        self.assertEqual(self.accounts(msn.search_by_memberships(
+            Membership.ALLOW)), ["User0@hotmail.com", "User4@hotmail.com"])
+        # the result keeps the contacts removed from the storage
+        self.storage.discard(self.contacts[0])
+        self.assertEqual(self.accounts(msn.search_by_memberships(
+            Membership.ALLOW)), ["User0@hotmail.com", "User4@hotmail.com"])
+        msn.discard(self.contacts[4])
+        self.assertEqual(self.accounts(msn.search_by_memberships(
+            Membership.FORWARD).search_by_groups(self.group)),
+            ["User0@hotmail.com"])
+        self.assertEqual(msn.group_by_group(),
+                {self.group: set([self.contacts[0]])})
+
+    def testGetItem(self):
+        self.assertEqual(set([self.storage[i] for i in range(6)]),
+                set(self.contacts))
+        self.assertRaises(IndexError, self.storage.__getitem__, 6)
+
+
+class AddressBookCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = AddressBookCache(self.directory, ACCOUNT)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def sync(self, ab_results, sharing_results):
+        address_book = AddressBook(None, FakeClient(), cache=self.cache)
+        address_book._ab = FakeAB(ab_results)
+        address_book._sharing = FakeSharing(sharing_results)
+        address_book.sync()
+        self.assertEqual(address_book.state, AddressBookState.SYNCHRONIZED)
+        return address_book
+
+    def accounts(self, address_book):
+        return sorted([(c.account, c.display_name, c.memberships,
+            sorted([g.name for g in c.groups]))
+            for c in address_book.contacts])
+
+    def initial_sync(self):
+        return self.sync(
+                [ABResult(None, [FakeContact("1", "foo@hotmail.com", "Foo",
+                        ["g1"]),
+                    FakeContact("2", "bar@hotmail.com", "Bar", ["g1", "g2"])],
+                    [FakeGroup("g1", u"Friends"), FakeGroup("g2", u"Work")])],
+                [[member("foo@hotmail.com", ["Allow", "Reverse"]),
+                    member("baz@hotmail.com", ["Pending"])]])
+
+    def testMissingCache(self):
+        self.assertEqual(self.cache.load(), None)
+        address_book = self.initial_sync()
+        self.assertEqual(address_book._ab.requests, [False])
+        self.assertEqual(address_book._sharing.requests, [False])
+
+    def testCorruptedCache(self):
+        open(self.cache.path, 'wb').write("garbage")
+        self.assertEqual(self.cache.load(), None)
+
+    def testRoundTrip(self):
+        address_book = self.initial_sync()
+        self.assertEqual(self.accounts(self.sync([ABResult(None, [], [])],
+            [[]])), self.accounts(address_book))
+
+    def testDeltas(self):
+        self.initial_sync()
+        address_book = self.sync(
+                [ABResult(None, [FakeContact("1", "foo@hotmail.com", "Foo2",
+                        ["g1"]),
+                    FakeContact("2", "bar@hotmail.com", "Bar", deleted=True),
+                    FakeContact("3", "qux@hotmail.com", "Qux", ["g2"])],
+                    [FakeGroup("g1", u"Buddies"),
+                        FakeGroup("g2", u"Work", deleted=True)])],
+                [[member("foo@hotmail.com", deleted_roles=["Allow"]),
+                    member("baz@hotmail.com", deleted_roles=["Pending"])]])
+        self.assertEqual(address_book._ab.requests, [True])
+        self.assertEqual(address_book._sharing.requests, [True])
+        self.assertEqual(self.accounts(address_book),
+                [("foo@hotmail.com", "Foo2",
+                    Membership.FORWARD | Membership.REVERSE, ["Buddies"]),
+                 ("qux@hotmail.com", "Qux", Membership.FORWARD, [])])
+        self.assertEqual(self.cache.load()[3], "2010-01-01T00:00:00")
+
+    def testDefaultTimestamp(self):
+        address_book = self.initial_sync()
+        self.cache.save(address_book.groups, address_book.profile,
+                address_book.contacts, DEFAULT_TIMESTAMP, "2010-02-01T00:00:00")
+        address_book = self.sync(
+                [ABResult(None, [FakeContact("3", "qux@hotmail.com", "Qux")],
+                    [])],
+                [[]])
+        # the cache can't be used, the contacts are fully listed again
+        self.assertEqual(address_book._ab.requests, [False])
+        self.assertEqual(address_book._sharing.requests, [False])
+        self.assertEqual(self.accounts(address_book),
+                [("qux@hotmail.com", "Qux", Membership.FORWARD, [])])
+
+    def testFullSyncRequired(self):
+        self.initial_sync()
+        address_book = self.sync(
+                ["FullSyncRequired",
+                    ABResult(None, [FakeContact("3", "qux@hotmail.com", "Qux")],
+                        [])],
+                [[], []])
+        self.assertEqual(address_book._ab.requests, [True, False])
+        self.assertEqual(sorted(address_book._sharing.requests),
+                [False, True])
+        self.assertEqual(self.accounts(address_book),
+                [("qux@hotmail.com", "Qux", Membership.FORWARD, [])])
+
+
+class AddressBookChangesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.address_book = AddressBook(None, FakeClient())
+        self.address_book._ab = FakeAB([ABResult(None,
+            [FakeContact("1", "foo@hotmail.com", "Foo")],
+            [FakeGroup("g1", u"Friends")])])
+        self.address_book._sharing = FakeSharing([[]])
+        self.address_book.sync()
+        self.ab = DeferredAB()
+        self.ab._last_changes = self.address_book._ab._last_changes
+        self.address_book._ab = self.ab
+        self.events = []
+        for signal in ('contact-added', 'contact-deleted', 'group-added',
+                'group-deleted', 'group-renamed', 'messenger-contact-added'):
+            self.address_book.connect(signal, self.on_event, signal)
+
+    def on_event(self, address_book, item, signal):
+        self.events.append((signal, getattr(item, "name", None) or item.account))
+
+    def add(self, account, added):
+        self.address_book.add_messenger_contact(account,
+                done_cb=(added.append,))
+
+    def testSharedFetch(self):
+        added = []
+        self.add("bar@hotmail.com", added)
+        self.add("baz@hotmail.com", added)
+        self.add("qux@hotmail.com", added)
+        self.assertEqual(len(self.ab.requests), 1)
+        # the response contains the contacts added while it was pending
+        self.ab.respond(ABResult(None,
+            [FakeContact("id-bar@hotmail.com", "bar@hotmail.com", "Bar"),
+                FakeContact("id-baz@hotmail.com", "baz@hotmail.com", "Baz")],
+            []))
+        self.assertEqual([c.account for c in added],
+                ["bar@hotmail.com", "baz@hotmail.com"])
+        self.assertEqual(added[0].id, "id-bar@hotmail.com")
+        self.assertEqual(added[0].memberships,
+                Membership.FORWARD | Membership.ALLOW)
+        # but not the last one, which gets the next request
+        self.assertEqual(len(self.ab.requests), 1)
+        self.ab.respond(ABResult(None,
+            [FakeContact("id-qux@hotmail.com", "qux@hotmail.com", "Qux")],
+            []))
+        self.assertEqual(len(added), 3)
+        self.assertEqual(self.ab.requests, [])
+        self.assertEqual(len(self.address_book.contacts), 4)
+
+    def testContactNotInChanges(self):
+        added = []
+        self.add("bar@hotmail.com", added)
+        # the changes were computed before the contact was saved
+        self.ab.respond(ABResult(None, [], []))
+        self.assertEqual(len(added), 1)
+        contact = added[0]
+        self.assertEqual(contact.account, "bar@hotmail.com")
+        self.assertEqual(contact.id, "id-bar@hotmail.com")
+        self.assertEqual(contact.cid, BLANK_ID)
+        self.assertEqual(contact.memberships,
+                Membership.FORWARD | Membership.ALLOW)
+        self.assertEqual(list(self.address_book.contacts.search_by_id(
+            "id-bar@hotmail.com")), [contact])
+        self.assertEqual(self.events, [("contact-added", "bar@hotmail.com"),
+            ("messenger-contact-added", "bar@hotmail.com")])
+
+    def testChangesApplied(self):
+        added = []
+        self.add("bar@hotmail.com", added)
+        self.ab.respond(ABResult(None,
+            [FakeContact("id-bar@hotmail.com", "bar@hotmail.com", "Bar",
+                ["g2"]),
+                FakeContact("1", "foo@hotmail.com", "Foo", deleted=True)],
+            [FakeGroup("g1", u"Friends", deleted=True),
+                FakeGroup("g2", u"Work")]))
+        self.assertEqual(self.events, [("group-deleted", "Friends"),
+            ("group-added", "Work"), ("contact-added", "bar@hotmail.com"),
+            ("contact-deleted", "foo@hotmail.com"),
+            ("messenger-contact-added", "bar@hotmail.com")])
+        self.assertEqual([g.name for g in added[0].groups], ["Work"])
+        self.assertEqual([c.account for c in self.address_book.contacts],
+                ["bar@hotmail.com"])
+
+    def testNoLastChange(self):
+        self.ab._last_changes = DEFAULT_TIMESTAMP
+        added = []
+        self.add("bar@hotmail.com", added)
+        # there is nothing to ask the changes from, the result is complete
+        self.assertEqual(self.ab.requests[0][2], False)
+        self.ab.respond(ABResult(None,
+            [FakeContact("id-bar@hotmail.com", "bar@hotmail.com", "Bar")],
+            []))
+        self.assertEqual([c.account for c in self.address_book.contacts],
+                ["bar@hotmail.com"])
+
+    def testFullSyncRequired(self):
+        added = []
+        self.add("bar@hotmail.com", added)
+        self.ab.respond("FullSyncRequired")
+        self.assertEqual(self.ab.requests[0][2], False)
+        self.ab.respond(ABResult(None,
+            [FakeContact("id-bar@hotmail.com", "bar@hotmail.com", "Bar")],
+            []))
+        self.assertEqual(len(added), 1)
+        # the full result replaces the content of the address book
+        self.assertEqual([c.account for c in self.address_book.contacts],
+                ["bar@hotmail.com"])
+        self.assertEqual(self.address_book.groups, set())
+
+
+class StreamedSyncTestCase(unittest.TestCase):
+
+    DOCUMENT = """<soap:Envelope
+        xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+      <soap:Body>
+        <ABFindAllResponse xmlns="http://www.msn.com/webservices/AddressBook">
+          <ABFindAllResult>
+            <groups>%s</groups>
+            <contacts>%s</contacts>
+          </ABFindAllResult>
+        </ABFindAllResponse>
+      </soap:Body>
+    </soap:Envelope>"""
+
+    def setUp(self):
+        self.loop = PollEventLoop()
+        set_event_loop(self.loop)
+
+    def tearDown(self):
+        set_event_loop(None)
+
+    def run_idles(self):
+        while self.loop._idles:
+            self.loop.iteration(False)
+
+    def testParser(self):
+        groups = "".join(["<Group><groupId>g%d</groupId></Group>" % i
+            for i in range(3)])
+        contacts = "".join(["<Contact><contactId>%d</contactId></Contact>" % i
+            for i in range(250)])
+        handled = []
+        responses = []
+        parser = SOAPResponseParser(self.DOCUMENT % (groups, contacts),
+                ("ab:Group", "ab:Contact"),
+                lambda element: handled.append(element[0].text),
+                responses.append, self.fail)
+        parser.start()
+        # the elements are handed a batch at a time
+        self.assertEqual(len(handled), SOAPResponseParser.BATCH_SIZE)
+        self.assertEqual(responses, [])
+        self.run_idles()
+        self.assertEqual(handled,
+                ["g0", "g1", "g2"] + [str(i) for i in range(250)])
+        self.assertEqual(len(responses), 1)
+        self.assert_(responses[0].is_valid())
+        # the handled elements are not kept in the tree
+        result = responses[0].body.find("./ab:ABFindAllResponse/" \
+                "ab:ABFindAllResult")
+        self.assertEqual(list(result.find("./ab:groups")), [])
+        self.assertEqual(list(result.find("./ab:contacts")), [])
+
+    def parse_error(self, document, element_handler):
+        errors = []
+        parser = SOAPResponseParser(document, ("ab:Contact",),
+                element_handler, self.fail, errors.append)
+        parser.start()
+        self.run_idles()
+        self.assertEqual(len(errors), 1)
+        return errors[0]
+
+    def testParseErrors(self):
+        contacts = "".join(["<Contact><contactId>%d</contactId></Contact>" % i
+            for i in range(150)])
+        truncated = (self.DOCUMENT % ("", contacts))[:-100]
+        handled = []
+        error = self.parse_error(truncated, handled.append)
+        self.assert_(isinstance(error, SyntaxError))
+        self.assertEqual(len(handled), 150)
+
+        def element_handler(element):
+            raise NotImplementedError("Unknown member type")
+        error = self.parse_error(self.DOCUMENT % ("", contacts),
+                element_handler)
+        self.assert_(isinstance(error, NotImplementedError))
+
+    def testBatchedSync(self):
+        contacts = [FakeContact(str(i), "contact%d@hotmail.com" % i, "C%d" % i)
+                for i in range(5)]
+        address_book = AddressBook(None, FakeClient())
+        address_book.SYNC_BATCH_SIZE = 2
+        address_book._ab = FakeAB([ABResult(None, contacts, [])])
+        address_book._sharing = FakeSharing([[member("contact%d@hotmail.com"
+            % i, ["Allow"]) for i in range(5)]])
+        address_book.sync()
+        self.assertEqual(address_book.state, AddressBookState.SYNCHRONIZING)
+        self.assertEqual(len(address_book.contacts), 2)
+        self.run_idles()
+        self.assertEqual(address_book.state, AddressBookState.SYNCHRONIZED)
+        self.assertEqual(len(address_book.contacts), 5)
+        self.assertEqual(len(address_book.contacts.search_by_memberships(
+            Membership.ALLOW)), 5)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, "")
+    from papyon.profile import Contact, Group, Membership, NetworkID
+    from papyon.service.AddressBook import AddressBook, AddressBookCache, \
+            AddressBookState, DEFAULT_TIMESTAMP
+    from papyon.service.AddressBook import sharing
+    from papyon.service.AddressBook.address_book import AddressBookStorage, \
+            BLANK_ID
+    from papyon.service.AddressBook.ab import ABResult
+    from papyon.service.SOAPService import SOAPResponseParser
+    from papyon.gnet.eventloop import PollEventLoop, set_event_loop
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import re
+import sys
+import unittest
+
+class MembershipListBuilderTestCase(unittest.TestCase):
+
+    def contacts(self, payloads):
+        result = []
+        for payload in payloads:
+            for domain, users in re.findall('<d n="([^"]+)">(.*?)</d>',
+                    payload):
+                for user, lists, network in re.findall(
+                        '<c n="([^"]+)" l="(\d+)" t="(\d+)"/>', users):
+                    result.append(("%s@%s" % (user, domain), int(network),
+                        int(lists)))
+        return sorted(result)
+
+    def testSingleContact(self):
+        builder = MembershipListBuilder()
+        builder.add("foo@hotmail.com", NetworkID.MSN, Membership.FORWARD)
+        self.assertEqual(list(builder.payloads()),
+                ['<ml><d n="hotmail.com"><c n="foo" l="1" t="1"/></d></ml>'])
+
+    def testMobile(self):
+        builder = MembershipListBuilder()
+        builder.add("5551234", NetworkID.MOBILE, Membership.ALLOW)
+        self.assertEqual(list(builder.payloads()),
+                ['<ml><t><c n="tel:5551234" l="2"/></t></ml>'])
+
+    def testMergedMemberships(self):
+        builder = MembershipListBuilder()
+        builder.add("foo@hotmail.com", NetworkID.MSN, Membership.FORWARD)
+        builder.add("foo@hotmail.com", NetworkID.MSN, Membership.ALLOW)
+        builder.add("bar@hotmail.com", NetworkID.MSN, Membership.NONE)
+        self.assertEqual(len(builder), 1)
+        self.assertEqual(self.contacts(builder.payloads()),
+                [("foo@hotmail.com", NetworkID.MSN,
+                    Membership.FORWARD | Membership.ALLOW)])
+
+    def testEmpty(self):
+        self.assertEqual(list(MembershipListBuilder().payloads()), [])
+        self.assertEqual(list(MembershipListBuilder(True).payloads()),
+                ['<ml l="1"></ml>'])
+
+    def testSplit(self):
+        builder = MembershipListBuilder(initial=True)
+        expected = []
+        for i in range(2000):
+            account = "contact%04d@domain%d.com" % (i, i % 7)
+            builder.add(account, NetworkID.MSN, Membership.FORWARD)
+            expected.append((account, NetworkID.MSN, Membership.FORWARD))
+        payloads = list(builder.payloads())
+        for payload in payloads:
+            self.assert_(len(payload) < MembershipListBuilder.MAX_PAYLOAD_SIZE)
+            self.assert_(payload.startswith('<ml l="1"><d n="'))
+            self.assert_(payload.endswith('</d></ml>'))
+            self.assert_('></d>' not in payload.replace('/></d>', ''))
+        self.assertEqual(self.contacts(payloads), sorted(expected))
+        # only the last payload is not full
+        total = sum([len(payload) for payload in payloads])
+        self.assertEqual(len(payloads),
+                total / MembershipListBuilder.MAX_PAYLOAD_SIZE + 1)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, "")
+    from papyon.msnp.membership_list import MembershipListBuilder
+    from papyon.profile import Membership, NetworkID
+    unittest.main()
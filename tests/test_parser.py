@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import gobject
+import sys
+import unittest
+
+class ReplayClient(gobject.GObject):
+
+    __gsignals__ = {
+            "received": (gobject.SIGNAL_RUN_FIRST,
+                gobject.TYPE_NONE,
+                (object, gobject.TYPE_ULONG)),
+            }
+
+    def feed(self, data, read_size):
+        for i in range(0, len(data), read_size):
+            buf = data[i:i + read_size]
+            self.emit("received", buf, len(buf))
+gobject.type_register(ReplayClient)
+
+
+class DelimiterParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = ReplayClient()
+        self.parser = DelimiterParser(self.client)
+        self.parser.connect("received", self.on_received)
+        self.chunks = []
+
+    def on_received(self, parser, chunk):
+        self.chunks.append(chunk)
+        if chunk.startswith("MSG"):
+            parser.delimiter = int(chunk.split(" ")[-1])
+        elif isinstance(parser.delimiter, int):
+            parser.delimiter = "\r\n"
+
+    def testLines(self):
+        self.parser.delimiter = "\r\n"
+        for read_size in (1, 2, 3, 100):
+            self.chunks = []
+            self.client.feed("CHG 1 NLN 0\r\nPNG\r\n\r\nQNG 50", read_size)
+            self.assertEqual(self.chunks, ["CHG 1 NLN 0", "PNG", ""])
+            self.assertEqual(self.parser.flush(), "QNG 50")
+
+    def testDelimiterChange(self):
+        self.parser.delimiter = "\r\n"
+        payload = "MIME-Version: 1.0\r\n\r\nhello"
+        data = "MSG a b %d\r\n%sNLN\r\n" % (len(payload), payload)
+        for read_size in (1, 7, len(data)):
+            self.chunks = []
+            self.client.feed(data, read_size)
+            self.assertEqual(self.chunks,
+                    ["MSG a b %d" % len(payload), payload, "NLN"])
+
+    def testLongerDelimiter(self):
+        self.parser.delimiter = "\n"
+        self.client.feed("ab\r", 3)
+        self.assertEqual(self.chunks, [])
+        # the new delimiter starts before the end of the previous scan
+        self.parser.delimiter = "\r\n"
+        self.client.feed("\n", 1)
+        self.assertEqual(self.chunks, ["ab"])
+
+    def testLargeChunk(self):
+        self.parser.delimiter = 100000
+        self.client.feed("x" * 100010, 64)
+        self.assertEqual(self.chunks, ["x" * 100000])
+        self.assertEqual(self.parser.flush(), "x" * 10)
+
+    def testNoDelimiter(self):
+        self.parser.delimiter = None
+        self.client.feed("abc", 2)
+        self.assertEqual(self.chunks, ["ab", "c"])
+
+
+chunked_response = "HTTP/1.1 200 OK\r\n" \
+    "Transfer-Encoding: chunked\r\n" \
+    "\r\n" \
+    "5;name=value\r\nhello\r\n" \
+    "6\r\n world\r\n" \
+    "0\r\n" \
+    "X-Trailer: 1\r\n" \
+    "\r\n"
+
+length_response = "HTTP/1.1 200 OK\r\n" \
+    "Content-Length: 3\r\n" \
+    "\r\n" \
+    "abc"
+
+class HTTPParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = ReplayClient()
+        self.parser = HTTPParser(self.client)
+        self.parser.connect("received", self.on_received)
+        self.responses = []
+
+    def on_received(self, parser, response):
+        self.responses.append(response)
+
+    def testChunked(self):
+        for read_size in (1, 5, len(chunked_response)):
+            self.responses = []
+            self.client.feed(chunked_response + length_response, read_size)
+            self.assertEqual(len(self.responses), 2)
+            self.assertEqual(self.responses[0].body, "hello world")
+            self.assertEqual(self.responses[0].headers["X-Trailer"], "1")
+            self.assertEqual(self.responses[1].body, "abc")
+
+    def testStreaming(self):
+        chunks = []
+        def headers_received(parser, response):
+            parser.stream_body(chunks.append)
+        self.parser.connect("headers-received", headers_received)
+        self.client.feed(chunked_response, 3)
+        self.assertEqual("".join(chunks), "hello world")
+        self.assertEqual(self.responses[0].body, "")
+
+    def testInformational(self):
+        self.client.feed("HTTP/1.1 100 Continue\r\n\r\n" + length_response, 7)
+        self.assertEqual([r.status for r in self.responses], [100, 200])
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, "")
+    from papyon.gnet.parser import DelimiterParser, HTTPParser
+    unittest.main()
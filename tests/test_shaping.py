@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# papyon - a python client library for Msn
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+import socket
+import sys
+import time
+import unittest
+
+class ShapedClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = PollEventLoop()
+        set_event_loop(self.loop)
+        local, self.remote = socket.socketpair()
+        self.remote.setblocking(False)
+        self.client = SocketClient("localhost", 1)
+        self.client._pre_open(local)
+        self.client._post_open()
+
+    def tearDown(self):
+        self.client.close()
+        self.remote.close()
+        set_event_loop(None)
+
+    def receive(self, size, timeout=2.0):
+        data = ""
+        deadline = time.time() + timeout
+        while len(data) < size and time.time() < deadline:
+            self.loop.iteration(False)
+            try:
+                data += self.remote.recv(65536)
+            except socket.error:
+                time.sleep(0.001)
+        return data
+
+    def testUnlimited(self):
+        self.client.send("x" * 20000)
+        self.assertEqual(len(self.receive(20000)), 20000)
+
+    def testSmallBurst(self):
+        # the bucket never holds MIN_SHAPED_WRITE_SIZE bytes
+        burst = SocketClient.MIN_SHAPED_WRITE_SIZE / 2
+        self.client.set_rate_limit(100000, burst)
+        writes = []
+        self.client.connect("sent", lambda client, buf, size:
+                writes.append(size))
+        self.client.send("x" * 2000)
+        self.assertEqual(len(self.receive(2000)), 2000)
+        self.assertEqual(writes, [2000])
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, "")
+    from papyon.gnet.eventloop import PollEventLoop, set_event_loop
+    from papyon.gnet.io import SocketClient
+    unittest.main()